@@ -1,43 +1,155 @@
 import os
 print("=== DEPLOY 22-MAY-2025: Código actualizado ===")
-from flask import Flask, request, Response, session, redirect, url_for, render_template_string, send_file, flash, jsonify, make_response
-from twilio.twiml.voice_response import VoiceResponse
-import openai
+from flask import Flask, request, Response, session, redirect, url_for, render_template, send_file, flash, jsonify, stream_with_context, g, make_response
 from dotenv import load_dotenv
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import datetime
-import bcrypt
 from flask_wtf import CSRFProtect
+from werkzeug.wsgi import ClosingIterator
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_wtf.csrf import generate_csrf
 import csv
 import traceback
 import math
+import time
 import io
+import threading
 import base64
+import hashlib
+import json
+import store
+from store import AppointmentStore, VoicemailStore, limpiar
+from metrics import Metrics
+import profiling
+from auth import AdminCredentials, LoginThrottle
+from assets import Asset, AssetManifest
+import voice
+from voice import bp as voice_bp
+from sessions import ServerSessionInterface, SessionStore
+import click
+import jobs
+import extraction
+from mailer import DIGEST_INTERVAL, MAX_AVISOS, Mailer, RateLimited, SinDestinatario, SMTPPool
 
 load_dotenv()
 
 # Detectar si estamos en Render
 IS_RENDER = os.getenv('RENDER', '').lower() == 'true'
 
-app = Flask(__name__, static_url_path='/static', static_folder='static')
+# static/ lo sirve assets.py desde memoria (ver static_asset más abajo)
+app = Flask(__name__, static_folder=None)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "supersecretkey")  # Cambia esto en producción
 csrf = CSRFProtect(app)
-openai.api_key = os.getenv("OPENAI_API_KEY")
+
+# Detrás del proxy de Render la IP del cliente es la última que el proxy anexa a
+# X-Forwarded-For; las anteriores las escribe el propio cliente. ProxyFix pone
+# esa en request.remote_addr, y el esquema (https) en request.url, que es lo que
+# firma Twilio. TRUSTED_PROXIES = proxies delante de gunicorn.
+TRUSTED_PROXIES = int(os.getenv("TRUSTED_PROXIES", "1" if IS_RENDER else "0"))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+
+# --- Sesiones ---
+# Por defecto en el servidor (sqlite + caché en memoria, ver sessions.py): la
+# cookie solo lleva el id y las sesiones se pueden revocar.
+# SESSION_BACKEND=cookie vuelve a la cookie firmada de Flask.
+if os.getenv("SESSION_BACKEND", "sqlite") == "sqlite":
+    session_store = SessionStore(os.getenv("SESSION_DB", "sesiones.db"))
+    app.session_interface = ServerSessionInterface(session_store)
+else:
+    session_store = None
+
+# --- Plantillas ---
+# Se compilan una vez por worker y quedan en la caché de Jinja. Fuera de debug
+# Flask no vuelve a mirar los ficheros en disco. Con JINJA_BYTECODE_CACHE=<dir>
+# el bytecode compilado se guarda también en disco y los workers nuevos no
+# recompilan. La compilación la hace el hilo de precalentar (más abajo), no
+# la importación.
+PLANTILLAS = ("login.html", "admin.html", "edit_appointment.html")
+if os.getenv("JINJA_BYTECODE_CACHE"):
+    from jinja2 import FileSystemBytecodeCache
+    os.makedirs(os.getenv("JINJA_BYTECODE_CACHE"), exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(os.getenv("JINJA_BYTECODE_CACHE"))
 
 # Endpoint de salud para Render
 @app.route('/healthz')
 def healthz():
     return 'ok', 200
 
-# Configurar cabeceras de caché para archivos estáticos
+# --- Métricas (metrics.py) ---
+# Histogramas de duración por endpoint, bytes leídos/escritos en los archivos de
+# datos y tiempos de los webhooks de Twilio (voice.py), sumados entre workers.
+# Con METRICS_TOKEN, /metrics pide "Authorization: Bearer <token>".
+metricas = Metrics(os.getenv("METRICS_DIR", "metricas"))
+app.extensions["metrics"] = metricas
+store.medir_es = metricas.bytes_io
+metricas.describe("http_request_duration_seconds", "histogram", "Duración de las peticiones por endpoint")
+metricas.describe("http_requests_total", "counter", "Peticiones por endpoint y código de respuesta")
+metricas.describe("store_bytes_read_total", "counter", "Bytes leídos de los archivos de datos")
+metricas.describe("store_bytes_written_total", "counter", "Bytes escritos en los archivos de datos")
+metricas.describe("twilio_webhook_duration_seconds", "histogram", "Duración de los webhooks de Twilio")
+metricas.describe("twilio_webhook_over_budget_total", "counter", "Webhooks que superaron VOICE_LATENCY_BUDGET_MS")
+metricas.describe("twilio_webhook_errors_total", "counter", "Webhooks que respondieron con el TwiML de error")
+metricas.gauge("jobs", "Trabajos en la cola por estado",
+               lambda: [({"state": k}, v) for k, v in sorted(job_queue.stats().items())])
+metricas.gauge("mail_pending", "Avisos de correo esperando al próximo resumen", lambda: mailer.pending())
+metricas.gauge("appointments", "Citas vigentes", lambda: len(citas_store))
+if session_store is not None:
+    metricas.gauge("sessions_active", "Sesiones abiertas en el servidor", lambda: session_store.count())
+
+def al_cerrar(response, funcion):
+    """Llama a ``funcion`` cuando el servidor termina de enviar la respuesta."""
+    if response.direct_passthrough:
+        # send_file entrega su iterable tal cual al servidor y los call_on_close
+        # de la respuesta no se llamarían nunca
+        response.response = ClosingIterator(response.response, [funcion])
+    else:
+        response.call_on_close(funcion)
+
+@app.before_request
+def medir_inicio():
+    g.metricas_inicio = time.perf_counter()
+    metricas.set_endpoint(request.endpoint or "not_found")
+
+@app.after_request
+def medir_fin(response):
+    inicio = g.pop("metricas_inicio", time.perf_counter())
+    endpoint, metodo, estado = request.endpoint or "not_found", request.method, str(response.status_code)
+
+    def registrar():
+        metricas.observe("http_request_duration_seconds", time.perf_counter() - inicio,
+                         endpoint=endpoint, method=metodo)
+        metricas.inc("http_requests_total", endpoint=endpoint, method=metodo, status=estado)
+        metricas.set_endpoint(None)
+    # Al cerrar la respuesta: las descargas en streaming (CSV, mensajes de voz)
+    # cuentan hasta el último trozo enviado
+    al_cerrar(response, registrar)
+    return response
+
+@app.route("/metrics")
+def metrics():
+    token = os.getenv("METRICS_TOKEN")
+    if token and request.headers.get("Authorization", "") != f"Bearer {token}":
+        return "Unauthorized", 401
+    return Response(metricas.render(), mimetype="text/plain; version=0.0.4")
+
+# --- Archivos estáticos ---
+# Manifiesto en memoria de static/ (huellas, ETags y versiones comprimidas).
+# Cache-Control lo pone assets.py: inmutable para URLs con ?v=<huella>.
+assets = AssetManifest(os.path.join(app.root_path, "static"),
+                       intervalo=int(os.getenv("ASSETS_RECHECK_SECONDS", "60")))
+app.jinja_env.globals["asset_url"] = assets.url
+
+@app.route("/static/<path:filename>", endpoint="static")
+def static_asset(filename):
+    asset = assets.get(filename)
+    if asset is None:
+        return "Not found", 404
+    return assets.response(asset, request)
+
 @app.after_request
 def add_header(response):
-    # Agregar cabeceras solo para archivos estáticos o logos
+    # Los logos se pueden usar desde otros dominios
     if request.path.startswith('/static/') or request.path.startswith('/logo/'):
-        response.headers['Cache-Control'] = 'public, max-age=86400'  # 24 horas
         response.headers['Access-Control-Allow-Origin'] = '*'
     return response
 
@@ -58,14 +170,168 @@ PROMPT = (
 
 GMAIL_PASSWORD = os.getenv("GMAIL_APP_PASSWORD")
 
+# Almacenes compartidos por todas las rutas (se cargan en el primer uso)
+citas_store = AppointmentStore("citas_clientes.txt")
+mensajes_store = VoicemailStore("mensajes_clientes.txt")
+
+# --- Trabajos en segundo plano (jobs.py) ---
+# Correos y citas de llamadas se hacen fuera de la petición. Cada worker de
+# gunicorn arranca JOB_WORKER_THREADS hilos (0 = solo procesos "python jobs.py"),
+# al precalentar o en la primera petición, no al importar (ver arrancar_trabajos).
+job_queue = jobs.JobQueue(os.getenv("JOBS_DB", "trabajos.db"))
+app.extensions["jobs"] = job_queue
+
+# --- Correo de avisos (mailer.py) ---
+# Gmail por defecto; SMTP_HOST/SMTP_PORT/SMTP_STARTTLS permiten un servidor local.
+# Los avisos se juntan en un resumen cada MAIL_DIGEST_INTERVAL segundos.
+SMTP_USER = os.getenv("GMAIL_USER", "")
+smtp_pool = SMTPPool(os.getenv("SMTP_HOST", "smtp.gmail.com"), int(os.getenv("SMTP_PORT", "587")),
+                     starttls=os.getenv("SMTP_STARTTLS", "1") != "0", user=SMTP_USER, password=GMAIL_PASSWORD)
+mailer = Mailer(os.getenv("MAIL_DB", "correo.db"), smtp_pool, SMTP_USER, os.getenv("NOTIFY_EMAIL", SMTP_USER))
+
+def avisar(tipo, asunto, texto):
+    """Apunta un aviso por correo y programa el envío del resumen que lo incluirá."""
+    mailer.notify(tipo, asunto, texto)
+    if DIGEST_INTERVAL > 0:
+        ventana = int(time.time() // DIGEST_INTERVAL)
+        job_queue.enqueue("mail_digest", {}, clave=f"mail_digest:{ventana}", retraso=DIGEST_INTERVAL)
+    else:
+        job_queue.enqueue("mail_digest", {})
+
+@jobs.handler("mail_digest")
+def job_mail_digest(datos):
+    try:
+        while mailer.send_digest() == MAX_AVISOS:
+            pass
+    except RateLimited as e:
+        # Los avisos siguen guardados: otro resumen cuando haya cuota
+        print(f"[MAIL] {e}")
+        job_queue.enqueue("mail_digest", {}, clave=f"mail_digest:cuota:{int(time.time() + e.espera)}",
+                          retraso=e.espera)
+    except SinDestinatario as e:
+        # También siguen guardados: salen en el primer resumen con destinatario
+        print(f"[MAIL] {e}: {mailer.pending()} aviso(s) pendientes")
+
+@jobs.handler("call_appointment")
+def job_call_appointment(datos):
+    """Guarda la cita de una llamada terminada; el id sale del CallSid (idempotente)."""
+    cid = hashlib.sha1(datos["call_sid"].encode()).hexdigest()[:12]
+    citas_store.add(datos["cita"], cid=cid)
+    print(f"[VOICE] Cita {cid} guardada desde llamada: {datos['cita'][0]}")
+    if "respuestas" in datos:
+        extraer_cita(cid, datos["respuestas"], datos["lengua"], datetime.date.fromisoformat(datos["fecha"]))
+    job_queue.enqueue("appointment_email", {"id": cid}, clave=f"appointment_email:{cid}",
+                      retraso=EXTRACTION_BATCH_WINDOW if os.getenv("OPENAI_API_KEY") else 0)
+
+# --- Servicio y fecha de las llamadas (extraction.py) ---
+# Con OPENAI_API_KEY las llamadas se agrupan en lotes para el modelo (uno por
+# ventana de EXTRACTION_BATCH_WINDOW segundos); sin ella, o si el modelo
+# falla, se usan las reglas locales. La cita se guarda antes con lo que dijo
+# el cliente y aquí solo se corrigen el servicio y la fecha.
+extractor = extraction.Extractor(os.getenv("EXTRACTION_DB", "extraccion.db"))
+EXTRACTION_BATCH_WINDOW = extraction.BATCH_WINDOW
+
+def extraer_cita(cid, respuestas, lengua, referencia):
+    campos = extractor.cached(extraction.clave(respuestas, referencia))
+    if campos is None and os.getenv("OPENAI_API_KEY"):
+        extractor.submit(cid, respuestas, lengua, referencia)
+        # Las llamadas que terminen dentro de la misma ventana van en el mismo lote
+        ventana = int(time.time() // EXTRACTION_BATCH_WINDOW)
+        job_queue.enqueue("extract_batch", {}, clave=f"extract_batch:{ventana}", retraso=EXTRACTION_BATCH_WINDOW)
+        return
+    aplicar_extraccion(cid, respuestas, campos or extraction.reglas(respuestas, lengua, referencia))
+
+def aplicar_extraccion(cid, respuestas, campos):
+    cita = citas_store.get(cid)
+    if cita is None:
+        return
+    nueva = dict(cita)
+    for campo in ("name", "service", "date", "address"):
+        # Solo se tocan los campos que nadie ha editado desde la llamada
+        if campos.get(campo) and cita[campo] == limpiar(respuestas.get(campo, "")):
+            nueva[campo] = campos[campo]
+    if nueva != cita:
+        nueva["message"] = f'{cita["message"]}. Caller said: service "{respuestas.get("service", "")}", date "{respuestas.get("date", "")}"'
+        citas_store.update(cid, nueva)
+
+@jobs.handler("extract_batch")
+def job_extract_batch(datos):
+    fallidas = []
+    while True:
+        items = extractor.take()
+        if not items:
+            break
+        try:
+            resultados = extraction.llm_lote(items)
+        except Exception as e:
+            print(f"[EXTRACCION] El modelo falló con {len(items)} llamadas, se usan las reglas locales: {e}")
+            resultados = {}
+        for item in items:
+            try:
+                referencia = datetime.date.fromisoformat(item["referencia"])
+                campos = resultados.get(item["id"])
+                if campos:
+                    extractor.remember(extraction.clave(item["respuestas"], referencia), campos)
+                else:
+                    campos = extraction.reglas(item["respuestas"], item["lengua"], referencia)
+                aplicar_extraccion(item["id"], item["respuestas"], campos)
+            except Exception as e:
+                # Sigue reservada (take no la vuelve a dar en este bucle); se
+                # libera al final para el reintento del trabajo
+                print(f"[EXTRACCION] No se pudo aplicar {item['id']}: {e}")
+                fallidas.append(item["id"])
+                continue
+            # Solo se borra cuando el resultado ya está en la cita
+            extractor.done(item["id"])
+    if fallidas:
+        extractor.release(fallidas)
+        raise RuntimeError(f"{len(fallidas)} transcripciones sin aplicar")
+
+@jobs.handler("voicemail")
+def job_voicemail(datos):
+    """Guarda el mensaje; el aviso va en otro trabajo, así un fallo al avisar no repite el mensaje."""
+    mensajes_store.add(datos)
+    sid = datos.get("call_sid")
+    job_queue.enqueue("voicemail_email", datos, clave=f"voicemail_email:{sid}" if sid else None)
+
+@jobs.handler("voicemail_email")
+def job_voicemail_email(datos):
+    avisar("voicemail", f"New voicemail from {datos.get('caller') or 'unknown number'}",
+           f"From: {datos.get('caller', '')}\nLanguage: {datos.get('language', '')}\n"
+           f"Message: {datos.get('transcript', '')}\nRecording: {datos.get('recording_url', '')}")
+
+@jobs.handler("appointment_email")
+def job_appointment_email(datos):
+    cita = citas_store.get(datos["id"])
+    if cita is None:
+        return
+    cuerpo = "\n".join(f"{campo.capitalize()}: {cita[campo]}" for campo in ("name", "service", "date", "address", "email", "message"))
+    avisar("appointment", f"New appointment: {cita['name']} - {cita['service']}", cuerpo)
+
+_trabajos_pid = None
+
+def arrancar_trabajos():
+    """Hilos de la cola en este proceso, una vez (y otra vez tras un fork)."""
+    global _trabajos_pid
+    if _trabajos_pid == os.getpid():
+        return
+    _trabajos_pid = os.getpid()
+    hilos = int(os.getenv("JOB_WORKER_THREADS", "1"))
+    if hilos > 0:
+        job_queue.start(hilos)
+
+@app.before_request
+def trabajos_en_marcha():
+    # Con WARMUP=0 (o si llega una petición antes que el hilo de precalentar)
+    arrancar_trabajos()
+
+# Tabla de administradores en memoria (se relee si cambia admins.txt)
+admin_credentials = AdminCredentials("admins.txt")
+login_throttle = LoginThrottle()
+
 def check_admin_login(username, password):
     try:
-        with open("admins.txt", "r", encoding="utf-8") as f:
-            for line in f:
-                if line.strip() and not line.startswith('#'):
-                    user, hashed = line.strip().split(":", 1)
-                    if user == username and bcrypt.checkpw(password.encode(), hashed.encode()):
-                        return True
+        return admin_credentials.check(username, password)
     except Exception as e:
         print(f"[SECURITY] Error leyendo admins.txt: {e}")
     return False
@@ -76,631 +342,391 @@ def login():
     if request.method == "POST":
         username = request.form.get("username", "").strip()
         password = request.form.get("password", "")
-        if check_admin_login(username, password):
+        # Los fallos de un usuario cuentan por IP: unos intentos malos desde otra
+        # máquina no dejan fuera al administrador con la contraseña correcta
+        ip = request.remote_addr
+        claves = (("user", username, ip), ("ip", ip))
+        espera = login_throttle.blocked(*claves)
+        if espera:
+            error = f"Too many login attempts. Please try again in {espera} seconds."
+        elif check_admin_login(username, password):
+            login_throttle.reset(*claves)
+            # Id de sesión nuevo al entrar (las sesiones en cookie no lo necesitan)
+            if hasattr(session, "regenerate"):
+                session.regenerate()
             session["admin_user"] = username
             return redirect(url_for("admin_panel"))
         else:
+            login_throttle.fail(*claves)
             error = "Invalid credentials. Please try again."
-    return render_template_string('''
-    <html><head><title>Admin Login</title>
-    <link href="https://fonts.googleapis.com/css2?family=Montserrat:wght@400;700&display=swap" rel="stylesheet">
-    <style>body{font-family:Montserrat;background:#f8fafc;display:flex;align-items:center;justify-content:center;height:100vh;}    .login-box{background:#fff;padding:32px 28px;border-radius:14px;box-shadow:0 2px 12px rgba(44,83,100,0.13);max-width:340px;width:100%;}
-    h2{color:#1a365d;margin-bottom:18px;}    input{width:100%;padding:9px 12px;margin-bottom:14px;border-radius:7px;border:1px solid #b0b8c1;}    button{width:100%;background:#1a365d;color:#fff;padding:10px 0;border:none;border-radius:7px;font-weight:700;font-size:1.1em;}
-    .error{color:#c0392b;margin-bottom:10px;}
-    .logo-genesis{display:block;margin:0 auto 18px auto;max-width:150px;height:auto;width:auto;border-radius:10px;box-shadow:0 2px 8px rgba(44,83,100,0.10);padding:8px;background:#fff;object-fit:contain;}
-    </style></head><body>    <form class="login-box" method="post">        <div style="text-align:center;">
-            <!-- Logo con múltiples métodos de respaldo -->
-            <img src="/static/logo_genesis.png" alt="Genesis SA Services LLC" class="logo-genesis" 
-                 onerror="this.onerror=null; this.src='/logo/logo_genesis.png'; 
-                 this.onerror=function(){this.onerror=null; this.src='/logo/logo_test.png';
-                 this.onerror=function(){loadBase64Logo(this);}}"
-                 >
-            <script>
-            function loadBase64Logo(imgElem) {
-                fetch('/logo_base64?format=json')
-                .then(r => r.json())
-                .then(data => {
-                    if(data.status === 'success') {
-                        imgElem.src = data.data;
-                    }
-                })
-                .catch(e => console.error('Error loading base64 logo:', e));
-            }
-            </script>
-        </div>
-        <h2>Admin Login</h2>
-        {% if error %}<div class="error">{{error}}</div>{% endif %}
-        <input type="hidden" name="csrf_token" value="{{ csrf_token }}"/>
-        <input name="username" placeholder="Username" required autofocus>
-        <input name="password" type="password" placeholder="Password" required>
-        <button type="submit">Login</button>
-    </form></body></html>
-    ''', error=error, csrf_token=generate_csrf())
+    return render_template("login.html", error=error, csrf_token=generate_csrf())
 
 @app.route("/logout")
 def logout():
-    session.pop("admin_user", None)
+    # Con sesiones en el servidor, vaciarla la borra también allí
+    session.clear()
     return redirect(url_for("home"))
 
+@app.cli.command("revoke-sessions")
+@click.argument("username")
+def revoke_sessions(username):
+    """Cierra todas las sesiones abiertas de USERNAME."""
+    if session_store is None:
+        print("SESSION_BACKEND=cookie: las sesiones en cookie no se pueden revocar")
+        return
+    print(f"{session_store.revoke_user(username)} sesión(es) cerrada(s) de {username}")
+
 def admin_required(f):
     from functools import wraps
     @wraps(f)
     def decorated(*args, **kwargs):
         if not session.get("admin_user"):
             return redirect(url_for("login"))
+        # ?_profile=1 / ?_profile=sample: perfil de esta petición (profiling.py)
+        modo = profiling.solicitado(request)
+        if modo:
+            return perfilar(modo, f, args, kwargs)
         return f(*args, **kwargs)
     return decorated
 
+def perfilar(modo, f, args, kwargs):
+    captura = profiling.Captura(modo, f"{request.method} {request.full_path.rstrip('?')}")
+    try:
+        captura.start()
+    except profiling.Ocupado:
+        response = make_response(f(*args, **kwargs))
+        response.headers["X-Profile-Status"] = "busy"
+        return response
+    try:
+        response = make_response(f(*args, **kwargs))
+    except BaseException:
+        captura.stop()
+        raise
+    # La captura termina al cerrar la respuesta (incluye el streaming)
+    al_cerrar(response, captura.stop)
+    response.headers["X-Profile-Id"] = captura.id
+    response.headers["X-Profile-Url"] = url_for("profiles")
+    return response
+
+@app.route("/admin/profiles")
+@admin_required
+def profiles():
+    filas = "".join(
+        f"<tr><td>{datetime.datetime.fromtimestamp(instante):%Y-%m-%d %H:%M:%S}</td><td>{pid}</td><td>"
+        + " ".join(f"<a href='{url_for('profile_file', nombre=a)}'>{a.rsplit('.', 1)[1]}</a>" for a in archivos)
+        + "</td></tr>"
+        for pid, instante, archivos in profiling.listar())
+    return f'''<html><head><title>Profiles</title></head><body style="font-family:Montserrat;padding:40px;">
+    <h2>Request profiles</h2><p>Add <code>?_profile=1</code> (cProfile) or <code>?_profile=sample</code>
+    (flamegraph) to any admin page.</p>
+    <table cellpadding="6">{filas or "<tr><td>No profiles yet.</td></tr>"}</table>
+    <br><a href="/admin">Back to the panel</a></body></html>'''
+
+@app.route("/admin/profiles/<nombre>")
+@admin_required
+def profile_file(nombre):
+    ruta = profiling.ruta(nombre)
+    if ruta is None:
+        return "Profile not found", 404
+    tipos = {"svg": "image/svg+xml", "txt": "text/plain", "folded": "text/plain"}
+    extension = nombre.rsplit(".", 1)[1]
+    return send_file(os.path.abspath(ruta), mimetype=tipos.get(extension, "application/octet-stream"),
+                     as_attachment=extension in ("pstats", "folded"), download_name=nombre)
+
 @app.route("/admin", methods=["GET", "POST"])
+@admin_required
 def admin_panel():
-    if not session.get("admin_user"):
-        return redirect(url_for("login"))
     # --- Búsqueda y filtro ---
     search = request.args.get('search', '').strip().lower()
-    page = int(request.args.get('page', 1))
+    page = max(1, request.args.get('page', 1, type=int))
     per_page = 10
-    citas = []
-    if os.path.exists("citas_clientes.txt"):
-        with open("citas_clientes.txt", "r", encoding="utf-8") as f:
-            for line in f:
-                if line.strip():
-                    partes = line.strip().split("|")
-                    if len(partes) >= 5:
-                        cita = {
-                            "name": partes[0],
-                            "service": partes[1],
-                            "date": partes[2],
-                            "address": partes[3],
-                            "email": partes[4],
-                            "message": partes[5] if len(partes) > 5 else ""
-                        }
-                        if search:
-                            if (search in cita["name"].lower() or search in cita["service"].lower() or search in cita["date"].lower() or search in cita["email"].lower() or search in cita["address"].lower() or search in cita["message"].lower()):
-                                citas.append(cita)
-                        else:
-                            citas.append(cita)
-    total_citas = len(citas)
+    # La página se pide al almacén; sin búsqueda no se materializa ninguna otra cita
+    if search:
+        citas = citas_store.search(search)
+        total_citas = len(citas)
+        citas = citas[(page-1)*per_page:page*per_page]
+    else:
+        total_citas = len(citas_store)
+        citas = citas_store.page((page-1)*per_page, per_page)
     total_pages = max(1, math.ceil(total_citas / per_page))
-    citas = citas[(page-1)*per_page:page*per_page]
-    mensajes = []
-    if os.path.exists("mensajes_clientes.txt"):
-        with open("mensajes_clientes.txt", "r", encoding="utf-8") as f:
-            for line in f:
-                if line.strip():
-                    mensajes.append(line.strip())
+    paginas = botones_de_pagina(page, total_pages)
+    # --- Mensajes de voz: búsqueda y páginas propias ---
+    vm_search = request.args.get('vm_search', '').strip()
+    vm_page = max(1, request.args.get('vm_page', 1, type=int))
+    if vm_search:
+        mensajes = mensajes_store.search(vm_search)
+        total_mensajes = len(mensajes)
+        mensajes = mensajes[(vm_page-1)*per_page:vm_page*per_page]
+    else:
+        total_mensajes = len(mensajes_store)
+        mensajes = mensajes_store.page((vm_page-1)*per_page, per_page)
+    vm_total_pages = max(1, math.ceil(total_mensajes / per_page))
+    vm_paginas = botones_de_pagina(vm_page, vm_total_pages)
     # --- Notificaciones ---
     notif = request.args.get('notif', '')
-    # --- Estadísticas ---
-    stats = {}
-    months = {}
-    services = {}
-    for c in citas:
-        m = c['date'][:7] if len(c['date']) >= 7 else 'Unknown'
-        months[m] = months.get(m, 0) + 1
-        s = c['service']
-        services[s] = services.get(s, 0) + 1
-    stats['months'] = months
-    stats['services'] = services
-    # Servicios únicos para el filtro
-    servicios_unicos = sorted(list(set(c['service'] for c in citas)))
-    return render_template_string('''
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Genesis SA Services LLC Admin Panel</title>
-    <link href="https://fonts.googleapis.com/css2?family=Montserrat:wght@400;700&display=swap" rel="stylesheet">
-    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.2/css/all.min.css">
-    <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-    <style>
-    body {
-      font-family: Montserrat, Arial, sans-serif;
-      background: linear-gradient(135deg, #e0f7fa 0%, #f8fafc 100%);
-      margin: 0;
-      color: var(--fg, #1a365d);
-      transition: background 0.4s;
-    }
-    :root {
-      --bg: #f8fafc;
-      --fg: #1a365d;
-      --card: #fff;
-      --table: #f8fafc;
-      --th: #e3eaf2;
-      --empty: #b0b8c1;
-      --accent1: #1a8cff;
-      --accent2: #1ad18c;
-      --accent-gradient: linear-gradient(90deg, #1a8cff 0%, #1ad18c 100%);
-    }
-    body.dark {
-      --bg: #1a2332;
-      --fg: #f8fafc;
-      --card: #232e3c;
-      --table: #232e3c;
-      --th: #2d3a4a;
-      --empty: #6c7a89;
-      --accent1: #1ad18c;
-      --accent2: #1a8cff;
-      --accent-gradient: linear-gradient(90deg, #1ad18c 0%, #1a8cff 100%);
-      background: linear-gradient(135deg, #232e3c 0%, #1a2332 100%);
-    }
-    .container {
-      max-width: 1100px;
-      margin: 40px auto;
-      background: var(--card);
-      padding: 36px 32px 32px 32px;
-      border-radius: 28px;
-      box-shadow: 0 4px 24px rgba(44,83,100,0.13);
-      transition: background 0.4s;
-    }    .header {
-      display: flex; align-items: center; justify-content: space-between; margin-bottom: 30px;
-    }
-    .logo-genesis {
-      max-width: 150px;
-      width: auto;
-      height: auto;
-      border-radius: 18px;
-      box-shadow: 0 2px 8px rgba(44,83,100,0.10);
-      background: #fff;
-      padding: 8px;
-      object-fit: contain;
-      display: block;
-      margin: 0 auto;
-    }
-    .logout-btn {
-      background: var(--accent1);
-      color: #fff;
-      padding: 11px 26px;
-      border: none;
-      border-radius: 14px;
-      font-weight: 700;
-      font-size: 1em;
-      cursor: pointer;
-      transition: background 0.2s;
-      margin-left: 10px;
-      box-shadow: 0 2px 8px rgba(26,140,255,0.10);
-    }
-    .logout-btn:hover {
-      background: var(--accent2);
-    }
-    .dark-toggle {
-      background: var(--accent2);
-      color: #fff;
-      border: none;
-      border-radius: 14px;
-      padding: 10px 20px;
-      margin-left: 18px;
-      cursor: pointer;
-      font-size: 1em;
-      transition: background 0.2s;
-      box-shadow: 0 2px 8px rgba(26,209,140,0.10);
-    }
-    .dark-toggle:hover {
-      background: var(--accent1);
-    }
-    h1 {
-      color: var(--fg);
-      font-size: 2.3em;
-      margin: 0 0 8px 0;
-    }
-    .summary-cards {
-      display: flex; gap: 24px; margin-bottom: 32px;
-    }
-    .card {
-      flex: 1;
-      background: var(--accent-gradient);
-      border-radius: 22px;
-      padding: 28px 20px;
-      box-shadow: 0 2px 12px rgba(44,83,100,0.10);
-      display: flex; align-items: center; gap: 18px;
-      color: #fff;
-      transition: background 0.4s;
-    }    body.dark .card {
-      background: var(--accent-gradient);
-      color: #fff;
-    }
-    body.dark .logo-genesis {
-      background: #fff;
-    }
-    .card i {
-      font-size: 2.5em;
-      color: #fff;
-      filter: drop-shadow(0 2px 6px rgba(26,140,255,0.10));
-    }
-    .card .info {
-      display: flex; flex-direction: column;
-    }
-    .card .info .label {
-      font-size: 1.1em; color: #e0f7fa;
-    }
-    .card .info .value {
-      font-size: 1.7em; font-weight: 700; color: #fff;
-    }
-    .section {margin-bottom: 38px;}
-    .section h2 {color: var(--fg); font-size: 1.3em; margin-bottom: 12px;}
-    table {
-      width: 100%; border-collapse: collapse; margin-bottom: 18px; background: var(--table); border-radius: 16px; overflow: hidden;
-      box-shadow: 0 2px 8px rgba(44,83,100,0.07);
-    }
-    th, td {padding: 14px 12px; text-align: left;}
-    th {
-      background: var(--th); color: var(--fg); font-weight: 700;
-      border-bottom: 2px solid var(--accent1);
-    }
-    tr {transition: background 0.15s;}
-    tr:hover {background: #e0f7fa;}
-    body.dark tr:hover {background: #2d3a4a;}
-    td {color: var(--fg);}
-    .empty {color: var(--empty); font-style: italic;}
-    ul {padding-left: 18px;}
-    li {margin-bottom: 7px; color: var(--fg);}
-    .notif {
-      background: #eafaf1; color: #1a7f37; border: 1px solid #b7e4c7; padding: 12px 22px; border-radius: 12px; margin-bottom: 18px; font-weight: 600;
-      box-shadow: 0 2px 8px rgba(26,209,140,0.07);
-    }
-    .notif.error {background: #fdecea; color: #c0392b; border: 1px solid #f5c6cb;}
-    .pagination {display: flex; gap: 8px; margin-bottom: 18px;}
-    .pagination button {
-      background: var(--accent1); color: #fff; border: none; border-radius: 10px; padding: 8px 18px; cursor: pointer; font-size: 1em;
-      transition: background 0.2s;
-    }
-    .pagination button.active, .pagination button:disabled {
-      background: var(--accent2); color: #fff; cursor: not-allowed;
-    }
-    .edit-btn, .delete-btn {
-      background: var(--accent2); color: #fff; border: none; border-radius: 8px; padding: 7px 14px; margin-right: 4px; cursor: pointer; font-size: 1em;
-      transition: background 0.2s;
-    }
-    .edit-btn:hover {background: var(--accent1);}
-    .delete-btn {background: #fdecea; color: #c0392b;}
-    .delete-btn:hover {background: #f5c6cb; color: #fff;}
-    .add-form {
-      background: var(--th); padding: 22px 18px; border-radius: 14px; margin-bottom: 18px;
-      box-shadow: 0 2px 8px rgba(44,83,100,0.07);
-    }
-    .add-form input, .add-form textarea {
-      width: 100%; padding: 9px 12px; margin-bottom: 12px; border-radius: 8px; border: 1px solid #b0b8c1;
-      font-size: 1em;
-    }
-    .add-form button {
-      background: var(--accent1); color: #fff; border: none; border-radius: 8px; padding: 10px 22px; font-weight: 700; font-size: 1em;
-      transition: background 0.2s;
-    }
-    .add-form button:hover {background: var(--accent2);}
-    .add-form label {font-weight: 600; color: var(--fg);}
-    .download-btn {
-      background: var(--accent1); color: #fff; border: none; border-radius: 8px; padding: 9px 20px; margin-right: 8px; font-size: 1em; cursor: pointer;
-      transition: background 0.2s;
-    }
-    .download-btn:hover {background: var(--accent2);}
-    @media (max-width: 800px) {
-      .summary-cards {flex-direction: column; gap: 12px;}
-      .container {padding: 18px 4vw;}
-      table, th, td {font-size: 0.97em;}
-    }    </style>
-    </head>    <body>    <div class="container">      <div class="header">        <div style="text-align:center;">
-          <!-- Logo con múltiples métodos de respaldo -->
-          <img src="/static/logo_genesis.png" alt="Genesis SA Services LLC" class="logo-genesis" 
-               onerror="this.onerror=null; this.src='/logo/logo_genesis.png'; 
-               this.onerror=function(){this.onerror=null; this.src='/logo/logo_test.png';
-               this.onerror=function(){loadBase64Logo(this);}}"
-               >
-          <script>
-          function loadBase64Logo(imgElem) {
-              fetch('/logo_base64?format=json')
-              .then(r => r.json())
-              .then(data => {
-                  if(data.status === 'success') {
-                      imgElem.src = data.data;
-                  }
-              })
-              .catch(e => console.error('Error loading base64 logo:', e));
-          }
-          </script>
-        </div>
-        <div>
-          <button class="dark-toggle" onclick="toggleDark()"><i class="fas fa-moon"></i> Dark Mode</button>
-          <button class="logout-btn" onclick="window.location.href='/logout'"><i class="fas fa-sign-out-alt"></i> Logout</button>
-        </div>
-      </div>
-      <h1>Genesis SA Services LLC</h1>
-      <p style="color:#5a6a85; margin-bottom:28px;">Welcome, <b>{{user}}</b>! Here you can manage appointments and voicemails.</p>
-      {% if notif %}<div class="notif">{{notif}}</div>{% endif %}
-      <div class="summary-cards">
-        <div class="card"><i class="fas fa-calendar-check"></i><div class="info"><span class="label">Appointments</span><span class="value">{{total}}</span></div></div>
-        <div class="card"><i class="fas fa-voicemail"></i><div class="info"><span class="label">Voicemails</span><span class="value">{{mensajes|length}}</span></div></div>
-      </div>
-      <div class="section">
-        <h2><i class="fas fa-search"></i> Search & Filter</h2>
-        <form method="get" style="margin-bottom:18px;display:flex;gap:12px;flex-wrap:wrap;">
-          <input name="search" value="{{request.args.get('search','')}}" placeholder="Search by name, service, email..." style="padding:7px 10px;border-radius:6px;border:1px solid #b0b8c1;min-width:180px;">
-          <button type="submit" class="download-btn"><i class="fas fa-search"></i> Search</button>
-        </form>
-        <div style="margin-bottom:10px;">
-          <button class="download-btn" onclick="window.location.href='/export_pdf'">Export PDF</button>
-          <button class="download-btn" onclick="window.location.href='/export_csv'">Export CSV</button>
-        </div>
-        {% if citas %}
-        <table><tr><th>Name</th><th>Service</th><th>Date</th><th>Address</th><th>Email</th><th>Message</th><th>Actions</th></tr>
-        {% for c in citas %}<tr>
-          <td>{{c.name}}</td><td>{{c.service}}</td><td>{{c.date}}</td><td>{{c.address}}</td><td>{{c.email}}</td><td>{{c.message}}</td>
-          <td>
-            <form method="post" action="/edit_appointment" style="display:inline;">
-              <input type="hidden" name="old_name" value="{{c.name}}">
-              <input type="hidden" name="old_date" value="{{c.date}}">
-              <button class="edit-btn" type="submit"><i class="fas fa-edit"></i></button>
-            </form>
-            <form method="post" action="/delete_appointment" style="display:inline;" onsubmit="return confirm('Delete this appointment?');">
-              <input type="hidden" name="name" value="{{c.name}}">
-              <input type="hidden" name="date" value="{{c.date}}">
-              <button class="delete-btn" type="submit"><i class="fas fa-trash"></i></button>
-            </form>
-          </td>
-        </tr>{% endfor %}
-        </table>
-        <div class="pagination">
-          {% for p in range(1, total_pages+1) %}
-            <form method="get" style="display:inline;">
-              <input type="hidden" name="search" value="{{request.args.get('search','')}}">
-              <button type="submit" name="page" value="{{p}}" {% if p==page %}class="active" disabled{% endif %}>{{p}}</button>
-            </form>
-          {% endfor %}
-        </div>
-        {% else %}<div class="empty">No appointments found.</div>{% endif %}
-      </div>
-      <div class="section">
-        <h2><i class="fas fa-voicemail"></i> Voicemail Messages</h2>
-        <button class="download-btn" onclick="window.location.href='/download_voicemails'">Download All Voicemails</button>
-        {% if mensajes %}
-        <ul>{% for m in mensajes %}<li>{{m}}</li>{% endfor %}</ul>
-        {% else %}<div class="empty">No voicemail messages found.</div>{% endif %}
-      </div>
-      <div class="section">
-        <h2><i class="fas fa-chart-bar"></i> Statistics</h2>
-        <canvas id="statsChart" height="80"></canvas>
-      </div>
-    </div>
-    <script>
-    // Dark mode toggle
-    function toggleDark() {
-      document.body.classList.toggle('dark');
-      localStorage.setItem('dark', document.body.classList.contains('dark'));
-    }
-    if(localStorage.getItem('dark')==='true'){document.body.classList.add('dark');}
-    // Chart.js statistics
-    fetch('/stats_data').then(r=>r.json()).then(data=>{
-      new Chart(document.getElementById('statsChart').getContext('2d'), {
-        type: 'bar', data: {labels: data.months, datasets: [{label: 'Appointments per Month', data: data.counts, backgroundColor: '#1a365d'}]},
-        options: {plugins:{legend:{display:false}},scales:{y:{beginAtZero:true}}}
-      });
-    });
-    </script>
-    </body>
-    </html>
-    ''', user=session["admin_user"], citas=citas, mensajes=mensajes, total=total_citas, page=page, total_pages=total_pages, servicios_unicos=servicios_unicos, notif=notif)
+    # Servicios únicos para el filtro (de todas las citas, no solo de esta página)
+    servicios_unicos = citas_store.services()
+    return render_template("admin.html", user=session["admin_user"], citas=citas, mensajes=mensajes, total=total_citas, page=page, total_pages=total_pages, paginas=paginas, servicios_unicos=servicios_unicos, notif=notif,
+                           total_mensajes=total_mensajes, todos_los_mensajes=len(mensajes_store), vm_page=vm_page, vm_paginas=vm_paginas)
+
+def botones_de_pagina(page, total_pages):
+    """Primera, última y las cercanas a la actual (None = "…")."""
+    paginas = []
+    for p in sorted({1, total_pages} | set(range(max(1, page-2), min(total_pages, page+2)+1))):
+        if paginas and p - paginas[-1] > 1:
+            paginas.append(None)
+        paginas.append(p)
+    return paginas
+
+# --- API de citas paginada por cursor ---
+@app.route("/api/appointments")
+def api_appointments():
+    if not session.get("admin_user"):
+        return jsonify({"error": "unauthorized"}), 401
+    try:
+        cursor = request.args.get("cursor")
+        cursor = int(cursor) if cursor else None
+        limit = min(max(int(request.args.get("limit", 50)), 1), 500)
+    except ValueError:
+        return jsonify({"error": "invalid cursor or limit"}), 400
+    citas, next_cursor, total = citas_store.scan(
+        after=cursor, limit=limit,
+        service=request.args.get("service", "").strip(),
+        search=request.args.get("search", "").strip().lower())
+    return jsonify({"appointments": citas, "next_cursor": next_cursor, "total": total})
 
 # --- Agregar cita manualmente ---
 @app.route("/add_appointment", methods=["POST"])
+@admin_required
 def add_appointment():
-    if not session.get("admin_user"):
-        return redirect(url_for("login"))
     data = [request.form.get(k, "").strip() for k in ["name","service","date","address","email","message"]]
-    if not all(data[:5]):
-        return redirect(url_for("admin_panel", notif="All fields except message are required!"))
-    with open("citas_clientes.txt", "a", encoding="utf-8") as f:
-        f.write("|".join(data)+"\n")
+    # Email opcional, como en /import_csv: las citas por teléfono no lo tienen
+    if not all(data[:4]):
+        return redirect(url_for("admin_panel", notif="Name, service, date and address are required!"))
+    citas_store.add(data)
     return redirect(url_for("admin_panel", notif="Appointment added!"))
 
 # --- Eliminar cita ---
 @app.route("/delete_appointment", methods=["POST"])
+@admin_required
 def delete_appointment():
-    if not session.get("admin_user"):
-        return redirect(url_for("login"))
     name = request.form.get("name", "")
     date = request.form.get("date", "")
-    new_lines = []
-    deleted = False
-    with open("citas_clientes.txt", "r", encoding="utf-8") as f:
-        for line in f:
-            partes = line.strip().split("|")
-            if len(partes) >= 3 and partes[0] == name and partes[2] == date:
-                deleted = True
-                continue
-            new_lines.append(line)
-    with open("citas_clientes.txt", "w", encoding="utf-8") as f:
-        f.writelines(new_lines)
+    cita = citas_store.resolve(request.form.get("id", ""), name, date)
+    deleted = bool(cita) and citas_store.delete(cita["id"])
     return redirect(url_for("admin_panel", notif="Appointment deleted!" if deleted else "Appointment not found!"))
 
 # --- Editar cita (formulario y guardado) ---
 @app.route("/edit_appointment", methods=["POST"])
+@admin_required
 def edit_appointment():
-    if not session.get("admin_user"):
-        return redirect(url_for("login"))
     old_name = request.form.get("old_name", "")
     old_date = request.form.get("old_date", "")
     # Buscar cita
-    cita = None
-    with open("citas_clientes.txt", "r", encoding="utf-8") as f:
-        for line in f:
-            partes = line.strip().split("|")
-            if len(partes) >= 3 and partes[0] == old_name and partes[2] == old_date:
-                cita = partes
-                break
+    cita = citas_store.resolve(request.form.get("id", ""), old_name, old_date)
     if not cita:
         return redirect(url_for("admin_panel", notif="Appointment not found!"))
     # Mostrar formulario de edición
-    return render_template_string('''
-    <html><head><title>Edit Appointment</title></head><body style="font-family:Montserrat;padding:40px;">
-    <h2>Edit Appointment</h2>
-    <form method="post" action="/save_appointment">
-      <input type="hidden" name="old_name" value="{{cita[0]}}">
-      <input type="hidden" name="old_date" value="{{cita[2]}}">
-      Name: <input name="name" value="{{cita[0]}}" required><br><br>
-      Service: <input name="service" value="{{cita[1]}}" required><br><br>
-      Date: <input name="date" type="date" value="{{cita[2]}}" required><br><br>
-      Address: <input name="address" value="{{cita[3]}}" required><br><br>
-      Email: <input name="email" value="{{cita[4]}}" required><br><br>
-      Message: <input name="message" value="{{cita[5] if len(cita)>5 else ''}}"><br><br>
-      <button type="submit">Save</button>
-      <a href="/admin">Cancel</a>
-    </form></body></html>
-    ''', cita=cita)
+    return render_template("edit_appointment.html", cita=cita)
 
 @app.route("/save_appointment", methods=["POST"])
+@admin_required
 def save_appointment():
-    if not session.get("admin_user"):
-        return redirect(url_for("login"))
     old_name = request.form.get("old_name", "")
     old_date = request.form.get("old_date", "")
     new_data = [request.form.get(k, "").strip() for k in ["name","service","date","address","email","message"]]
-    if not all(new_data[:5]):
-        return redirect(url_for("admin_panel", notif="All fields except message are required!"))
-    new_lines = []
-    updated = False
-    with open("citas_clientes.txt", "r", encoding="utf-8") as f:
-        for line in f:
-            partes = line.strip().split("|")
-            if len(partes) >= 3 and partes[0] == old_name and partes[2] == old_date:
-                new_lines.append("|".join(new_data)+"\n")
-                updated = True
-            else:
-                new_lines.append(line)
-    with open("citas_clientes.txt", "w", encoding="utf-8") as f:
-        f.writelines(new_lines)
+    if not all(new_data[:4]):
+        return redirect(url_for("admin_panel", notif="Name, service, date and address are required!"))
+    cita = citas_store.resolve(request.form.get("id", ""), old_name, old_date)
+    updated = bool(cita) and citas_store.update(cita["id"], new_data)
     return redirect(url_for("admin_panel", notif="Appointment updated!" if updated else "Appointment not found!"))
 
 # --- Exportar citas a CSV ---
+COLUMNAS_CSV = ["Name","Service","Date","Address","Email","Message"]
+
+def filtros_exportacion():
+    """Filtros opcionales de las exportaciones, los mismos que usa el panel."""
+    return {
+        "search": request.args.get("search", "").strip().lower(),
+        "service": request.args.get("service", "").strip(),
+        "desde": request.args.get("start") or None,
+        "hasta": request.args.get("end") or None,
+    }
+
 @app.route("/export_csv")
+@admin_required
 def export_csv():
-    citas = []
-    if os.path.exists("citas_clientes.txt"):
-        with open("citas_clientes.txt", "r", encoding="utf-8") as f:
-            for line in f:
-                if line.strip():
-                    partes = line.strip().split("|")
-                    if len(partes) >= 5:
-                        citas.append(partes)
-    si = io.StringIO()
-    cw = csv.writer(si)
-    cw.writerow(["Name","Service","Date","Address","Email","Message"])
-    for c in citas:
-        cw.writerow(c[:6])
-    output = make_response(si.getvalue())
+    filtros = filtros_exportacion()
+
+    def generar():
+        # Se envía un trozo por cada lote de citas: la memoria no depende del total
+        si = io.StringIO()
+        cw = csv.writer(si)
+        cw.writerow(COLUMNAS_CSV)
+        for lote in citas_store.iter_pages(**filtros):
+            for c in lote:
+                cw.writerow([c["name"], c["service"], c["date"], c["address"], c["email"], c["message"]])
+            yield si.getvalue()
+            si.seek(0)
+            si.truncate(0)
+        yield si.getvalue()
+
+    output = Response(stream_with_context(generar()), mimetype="text/csv")
     output.headers["Content-Disposition"] = "attachment; filename=appointments.csv"
-    output.headers["Content-type"] = "text/csv"
+    return output
+
+# --- Importar citas desde CSV ---
+# Mismas columnas que /export_csv (Email y Message opcionales, en cualquier
+# orden). El archivo se lee fila a fila y se guarda por lotes de IMPORT_LOTE
+# citas con store.add_many (un bloqueo y una escritura por lote), así que la
+# memoria no depende del tamaño del archivo. La respuesta va saliendo con el
+# progreso de cada lote y los errores por línea. Las filas idénticas a una cita
+# existente se omiten: repetir una importación cortada no duplica citas.
+# Las fechas que no son de calendario ("Tomorrow", como las dicta quien llama
+# por teléfono, y así salen en /export_csv) se guardan tal cual, con un aviso.
+IMPORT_LOTE = 5000
+IMPORT_MAX_ERRORES = 100   # errores que se listan; el resto solo se cuentan
+OBLIGATORIAS = ("name", "service", "date", "address")
+
+def fecha_importada(valor):
+    """Fecha ISO a partir de YYYY-MM-DD o MM/DD/YYYY (hojas de cálculo); ValueError si no lo es."""
+    if "/" in valor:
+        mes, dia, anio = valor.split("/")
+        return datetime.date(int(anio), int(mes), int(dia)).isoformat()
+    return datetime.date.fromisoformat(valor).isoformat()
+
+def fila_importada(fila, columnas):
+    """(cita, aviso) de una fila del CSV; cita en el orden de store.CAMPOS. ValueError con el motivo."""
+    cita = {campo: fila[i].strip() if i < len(fila) else "" for campo, i in columnas.items()}
+    faltan = [campo for campo in OBLIGATORIAS if not cita.get(campo)]
+    if faltan:
+        raise ValueError("missing " + ", ".join(faltan))
+    if cita.get("email") and "@" not in cita["email"]:
+        raise ValueError(f"invalid email {cita['email']!r}")
+    aviso = None
+    try:
+        cita["date"] = fecha_importada(cita["date"])
+    except ValueError:
+        aviso = f"date {cita['date']!r} is not YYYY-MM-DD or MM/DD/YYYY, stored as is"
+    return [cita.get(campo, "") for campo in store.CAMPOS], aviso
+
+@app.route("/import_csv", methods=["POST"])
+@admin_required
+def import_csv():
+    archivo = request.files.get("file")
+    if archivo is not None and archivo.filename:
+        # request.close() cierra los archivos subidos al salir de la vista, antes
+        # de que se envíe la respuesta: el archivo pasa a ser de generar()
+        flujo, archivo.stream = archivo.stream, io.BytesIO()
+    elif request.mimetype == "text/csv":
+        # curl --data-binary @citas.csv -H "Content-Type: text/csv" -H "X-CSRFToken: ..."
+        flujo = request.stream
+    else:
+        return redirect(url_for("admin_panel", notif="Choose a CSV file to import!"))
+    texto = io.TextIOWrapper(flujo, encoding="utf-8-sig", errors="replace", newline="")
+    lector = csv.reader(texto)
+    cabecera = next(lector, [])
+    columnas = {nombre.strip().lower(): i for i, nombre in enumerate(cabecera)}
+    columnas = {campo: columnas[campo] for campo in store.CAMPOS if campo in columnas}
+    faltan = [campo.capitalize() for campo in OBLIGATORIAS if campo not in columnas]
+    if faltan:
+        return Response(f"Missing columns: {', '.join(faltan)}. Expected the /export_csv layout: "
+                        f"{','.join(COLUMNAS_CSV)}\n", status=400, mimetype="text/plain")
+    nombre = archivo.filename if archivo is not None else "CSV"
+
+    def generar():
+        inicio = time.perf_counter()
+        leidas = importadas = errores = avisos = 0
+        lote = []
+
+        def guardar():
+            nonlocal importadas
+            importadas += len(citas_store.add_many(lote, omitir_repetidas=True))
+            lote.clear()
+            return (f"{leidas} rows read, {importadas} imported, {leidas - importadas - errores} "
+                    f"duplicates skipped, {errores} errors, {avisos} warnings "
+                    f"({time.perf_counter() - inicio:.1f} s)\n")
+
+        yield f"Importing {nombre}...\n"
+        try:
+            for fila in lector:
+                if not any(campo.strip() for campo in fila):
+                    continue
+                leidas += 1
+                try:
+                    cita, aviso = fila_importada(fila, columnas)
+                except ValueError as e:
+                    errores += 1
+                    if errores <= IMPORT_MAX_ERRORES:
+                        yield f"  line {lector.line_num}: {e}\n"
+                    elif errores == IMPORT_MAX_ERRORES + 1:
+                        yield f"  (only the first {IMPORT_MAX_ERRORES} errors are listed)\n"
+                    continue
+                lote.append(cita)
+                if aviso:
+                    avisos += 1
+                    if avisos <= IMPORT_MAX_ERRORES:
+                        yield f"  line {lector.line_num}: warning: {aviso}\n"
+                    elif avisos == IMPORT_MAX_ERRORES + 1:
+                        yield f"  (only the first {IMPORT_MAX_ERRORES} warnings are listed)\n"
+                if len(lote) >= IMPORT_LOTE:
+                    yield guardar()
+        except csv.Error as e:
+            errores += 1
+            yield f"  line {lector.line_num}: malformed CSV ({e}), import stopped\n"
+        finally:
+            texto.close()
+        resumen = guardar()
+        print(f"[IMPORT] {session.get('admin_user')}: {resumen.strip()}")
+        yield "Done: " + resumen
+
+    output = Response(stream_with_context(generar()), mimetype="text/plain")
+    # Sin esto un proxy (o el navegador) puede esperar al final para mostrar el progreso
+    output.headers["X-Accel-Buffering"] = "no"
     return output
 
 # --- Descargar mensajes de voz como TXT ---
 @app.route("/download_voicemails")
+@admin_required
 def download_voicemails():
-    mensajes = []
-    if os.path.exists("mensajes_clientes.txt"):
-        with open("mensajes_clientes.txt", "r", encoding="utf-8") as f:
-            mensajes = [line.strip() for line in f if line.strip()]
-    si = io.StringIO()
-    for m in mensajes:
-        si.write(m+"\n")
-    output = make_response(si.getvalue())
+    def generar():
+        # Por bloques de 500 mensajes: la respuesta empieza a salir enseguida
+        lote = []
+        for m in mensajes_store.iter_all():
+            linea = f"{m['name'] or m['caller'] or 'Unknown'}: {m['transcript']}"
+            if m["timestamp"]:
+                detalles = ", ".join(x for x in (m["name"] and m["caller"], m["language"], m["call_sid"]) if x)
+                linea = f"[{m['timestamp']}] {linea}" + (f" ({detalles})" if detalles else "")
+            if m["recording_url"]:
+                linea += f" {m['recording_url']}"
+            lote.append(linea + "\n")
+            if len(lote) == 500:
+                yield "".join(lote)
+                lote = []
+        if lote:
+            yield "".join(lote)
+    output = Response(stream_with_context(generar()), mimetype="text/plain")
     output.headers["Content-Disposition"] = "attachment; filename=voicemails.txt"
-    output.headers["Content-type"] = "text/plain"
     return output
 
 # --- Estadísticas para Chart.js ---
 @app.route("/stats_data")
+@admin_required
 def stats_data():
     import calendar
-    from collections import Counter
-    citas = []
-    if os.path.exists("citas_clientes.txt"):
-        with open("citas_clientes.txt", "r", encoding="utf-8") as f:
-            for line in f:
-                if line.strip():
-                    partes = line.strip().split("|")
-                    if len(partes) >= 3:
-                        citas.append(partes)
-    # Citas por mes
-    months = []
-    counts = []
-    by_month = Counter()
-    for c in citas:
-        try:
-            y,m,_ = c[2].split("-")
-            month = f"{calendar.month_abbr[int(m)]} {y}"
-            by_month[month] += 1
-        except:
-            continue
-    for k in sorted(by_month, key=lambda x: (int(x.split()[1]), list(calendar.month_abbr).index(x.split()[0]))):
-        months.append(k)
-        counts.append(by_month[k])
-    return jsonify({"months":months, "counts":counts})
-
-@csrf.exempt
-@app.route("/voice", methods=["POST"])
-def voice():
-    resp = VoiceResponse()
-    gather = resp.gather(
-        input='speech',
-        action='/gather_name',
-        method='POST',
-        timeout=7,
-        speechTimeout='auto',
-        voice='alice',
-        language='en-US'
-    )
-    gather.say(
-        "Hello and welcome to Genesis SA Services LLC! We are honored to receive your call today. At Genesis, your satisfaction and peace of mind are our priority. May I have your name, please?",
-        voice='alice', language='en-US')
-    resp.say(
-        "We could not hear your response. If you need help, please call us again or visit genesissaservices.com. Thank you for trusting Genesis SA Services LLC! Goodbye.",
-        voice='alice', language='en-US')
-    resp.hangup()
-    return Response(str(resp), mimetype='text/xml')
-
-@csrf.exempt
-@app.route("/gather_language", methods=["POST"])
-def gather_language():
-    speech_result = request.form.get('SpeechResult', '').lower()
-    print(f"[LOG] Selección de idioma o agente: {speech_result}")
-    resp = VoiceResponse()
-    if 'español' in speech_result or 'spanish' in speech_result:
-        resp.redirect('/voice_es')
-    elif 'agent' in speech_result or 'agente' in speech_result:
-        resp.say("Transferring you to a human agent. Please wait.", voice='alice', language='en-US')
-        # Aquí puedes poner el número real de un agente humano
-        resp.dial('+1XXXXXXXXXX')
-        resp.hangup()
-    else:
-        resp.redirect('/voice')
-    return Response(str(resp), mimetype='text/xml')
-
-@csrf.exempt
-@app.route("/voice_es", methods=["POST"])
-def voice_es():
-    print("[LOG] Endpoint /voice_es fue llamado")
-    resp = VoiceResponse()
-    gather = resp.gather(
-        input='speech',
-        action='/gather_es',
-        method='POST',
-        timeout=7,
-        speechTimeout='auto',
-        voice='alice',
-        language='es-ES'
-    )
-    gather.say(
-        "¡Hola y bienvenido a Genesis SA Services LLC! Nos sentimos honrados de recibir su llamada hoy. En Genesis, su satisfacción y tranquilidad son nuestra prioridad. ¿Me puede decir su nombre, por favor?",
-        voice='alice', language='es-ES')
-    resp.say(
-        "No pudimos escuchar su respuesta. Si necesita ayuda, por favor llámenos de nuevo o visite genesissaservices.com. ¡Gracias por confiar en Genesis SA Services LLC! Adiós.",
-        voice='alice', language='es-ES')
-    resp.hangup()
-    return Response(str(resp), mimetype='text/xml')
-
-@csrf.exempt
-@app.route("/gather_es", methods=["POST"])
-def gather_es():
-    speech_result = request.form.get('SpeechResult')
-    print(f"Cliente (ES) dijo: {speech_result}")
+    # Conteos mantenidos por el almacén: no se recorren las citas
+    stats = citas_store.stats(request.args.get("start") or None, request.args.get("end") or None,
+                              request.args.get("service") or None)
+    months = [f"{calendar.month_abbr[int(m[5:7])]} {m[:4]}" for m in stats["months"]]
+    return jsonify({"months": months, "counts": list(stats["months"].values()),
+                    "services": stats["services"], "total": stats["total"]})
+
+# --- Webhooks de voz (voice.py) ---
+# Sin CSRF (los manda Twilio); voice.py comprueba la firma X-Twilio-Signature
+app.register_blueprint(voice_bp)
+csrf.exempt(voice_bp)
+# El panel solo enlaza grabaciones https de Twilio (mensajes guardados antes incluidos)
+app.jinja_env.tests["twilio_recording"] = voice.grabacion_valida
 
 @app.route("/")
 def home():
@@ -708,45 +734,26 @@ def home():
 
 @app.route("/logo/<filename>")
 def get_logo(filename):
-    """Ruta mantenida por compatibilidad, pero ahora sirve directamente el archivo estático"""
-    try:
-        # Validamos que el archivo solicitado sea realmente un logo
-        if not filename.startswith("logo_") and not filename == "logo.png":
-            raise FileNotFoundError("Archivo no permitido")
-            
-        # Intentamos servir el archivo solicitado
-        file_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), "static", filename)
-        if os.path.exists(file_path):
-            response = make_response(send_file(file_path, as_attachment=False, mimetype='image/png'))
-            # Añadimos encabezados para mejorar el caching
-            response.headers["Cache-Control"] = "public, max-age=86400"  # Cache por 24 horas
-            return response
-        else:
-            raise FileNotFoundError(f"No se encontró el archivo: {filename}")
-    except Exception as e:
-        try:
-            # Si hay error, intentamos primero con logo_genesis.png
-            file_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), "static", "logo_genesis.png")
-            response = make_response(send_file(file_path, as_attachment=False, mimetype='image/png'))
-            response.headers["Cache-Control"] = "public, max-age=86400"
-            return response
-        except:
-            # Si todavía hay error, usamos el logo de prueba
-            file_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), "static", "logo_test.png")
-            response = make_response(send_file(file_path, as_attachment=False, mimetype='image/png'))
-            response.headers["Cache-Control"] = "public, max-age=86400"
-            return response
+    """Ruta mantenida por compatibilidad: sirve el logo pedido desde el manifiesto"""
+    asset = None
+    # Validamos que el archivo solicitado sea realmente un logo
+    if filename.startswith("logo_") or filename == "logo.png":
+        asset = assets.get(filename)
+    # Si no existe, logo_genesis.png y, como último recurso, el logo de prueba
+    asset = asset or assets.get("logo_genesis.png") or assets.get("logo_test.png")
+    if asset is None:
+        return "Not found", 404
+    return assets.response(asset, request)
 
 @app.route("/add_test_data")
+@admin_required
 def add_test_data():
     # Agrega citas de prueba
-    with open("citas_clientes.txt", "a", encoding="utf-8") as f:
-        f.write("John Doe|Landscaping|2025-06-01|123 Main St|john@example.com|Please call before coming.\n")
-        f.write("Jane Smith|Tree Removal|2025-06-03|456 Oak Ave|jane@example.com|Backyard only.\n")
+    citas_store.add(["John Doe", "Landscaping", "2025-06-01", "123 Main St", "john@example.com", "Please call before coming."])
+    citas_store.add(["Jane Smith", "Tree Removal", "2025-06-03", "456 Oak Ave", "jane@example.com", "Backyard only."])
     # Agrega mensajes de voz de prueba
-    with open("mensajes_clientes.txt", "a", encoding="utf-8") as f:
-        f.write("John Doe: Please call me back about my landscaping appointment.\n")
-        f.write("Jane Smith: I need a tree removed urgently.\n")
+    mensajes_store.add({"name": "John Doe", "transcript": "Please call me back about my landscaping appointment."})
+    mensajes_store.add({"name": "Jane Smith", "transcript": "I need a tree removed urgently."})
     return "Test data added! <a href='/admin'>Go to Admin Panel</a>"
 
 @app.route("/test_logo")
@@ -760,22 +767,24 @@ def test_logo_page():
         html_content = f.read()
     return html_content
 
-@app.route("/logo_base64")
-def get_logo_base64():
-    """En caso extremo, devuelve el logo como una imagen embebida en base64"""
-    try:
-        logo_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), "static", "logo_genesis.png")
-        with open(logo_path, "rb") as image_file:
-            encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-        
-        # Esta página también ofrece una URL JSON para usar en otros contextos
-        if request.args.get('format') == 'json':
-            return jsonify({
-                "status": "success",
-                "data": f"data:image/png;base64,{encoded_string}"
-            })
-            
-        return f'''
+# Respuestas de /logo_base64 ya construidas: {(origen, formato): Asset}. Se
+# reconstruyen solo cuando cambia el ETag de static/logo_genesis.png o, sin él,
+# la fecha o el tamaño de encoded_logo.txt.
+_logo_base64 = {}
+_logo_respaldo = (None, None)   # (firma, contenido) de encoded_logo.txt
+
+def _leer_logo_respaldo():
+    """(firma, contenido) de encoded_logo.txt; se relee solo si cambia la firma (mtime, tamaño)."""
+    global _logo_respaldo
+    st = os.stat("encoded_logo.txt")
+    firma = (st.st_mtime_ns, st.st_size)
+    if _logo_respaldo[0] != firma:
+        with open("encoded_logo.txt", "r") as f:
+            _logo_respaldo = (firma, f.read().strip())
+    return _logo_respaldo
+
+def _pagina_logo_base64(encoded_string):
+    return f'''
         <!DOCTYPE html>
         <html><head><title>Logo Base64</title>
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
@@ -797,21 +806,9 @@ def get_logo_base64():
             <p>URL para probar vía static: <a href="/static/logo_genesis.png" target="_blank">/static/logo_genesis.png</a></p>
         </body></html>
         '''
-    except Exception as e:
-        try:
-            # Intentamos cargar el logo desde el archivo de respaldo
-            with open("encoded_logo.txt", "r") as f:
-                encoded_string = f.read().strip()
-                
-            # Esta página también ofrece una URL JSON para usar en otros contextos
-            if request.args.get('format') == 'json':
-                return jsonify({
-                    "status": "success",
-                    "data": f"data:image/png;base64,{encoded_string}",
-                    "source": "backup"
-                })
-                
-            return f'''
+
+def _pagina_logo_base64_respaldo(encoded_string):
+    return f'''
             <!DOCTYPE html>
             <html><head><title>Logo Base64 (from backup)</title>
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
@@ -831,54 +828,132 @@ def get_logo_base64():
                 </textarea>
             </body></html>
             '''
-        except:
-            return jsonify({
-                "status": "error",
-                "message": "No se pudo cargar el logo como base64."
-            }) if request.args.get('format') == 'json' else "No se pudo cargar el logo como base64."
+
+def _logo_base64_asset(formato):
+    logo = assets.get("logo_genesis.png")
+    if logo:
+        origen = logo.etag
+    else:
+        firma, encoded_string = _leer_logo_respaldo()
+        origen = ("backup",) + firma
+    clave = (origen, formato)
+    asset = _logo_base64.get(clave)
+    if asset is None:
+        if logo:
+            encoded_string = base64.b64encode(logo.datos).decode('utf-8')
+            datos = {"status": "success", "data": f"data:image/png;base64,{encoded_string}"}
+            pagina = _pagina_logo_base64
+            firma = logo.firma
+        else:
+            # Logo desde el archivo de respaldo (ya leído arriba)
+            datos = {"status": "success", "data": f"data:image/png;base64,{encoded_string}", "source": "backup"}
+            pagina = _pagina_logo_base64_respaldo
+        if formato == "json":
+            cuerpo, nombre = json.dumps(datos).encode(), "logo_base64.json"
+        else:
+            cuerpo, nombre = pagina(encoded_string).encode(), "logo_base64.html"
+        asset = Asset(nombre, cuerpo, firma)
+        # Las versiones de un logo anterior ya no sirven
+        if any(k[0] != origen for k in _logo_base64):
+            _logo_base64.clear()
+        _logo_base64[clave] = asset
+    return asset
+
+@app.route("/logo_base64")
+def get_logo_base64():
+    """En caso extremo, devuelve el logo como una imagen embebida en base64"""
+    # Esta página también ofrece una URL JSON para usar en otros contextos
+    formato = "json" if request.args.get('format') == 'json' else "html"
+    try:
+        return assets.response(_logo_base64_asset(formato), request)
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "message": "No se pudo cargar el logo como base64."
+        }) if formato == "json" else "No se pudo cargar el logo como base64."
+
+# --- Exportar citas a PDF ---
+# A partir de este número de citas el PDF se genera en segundo plano
+PDF_BACKGROUND_ROWS = int(os.getenv("PDF_BACKGROUND_ROWS", "5000"))
 
 @app.route("/export_pdf")
+@admin_required
 def export_pdf():
-    from reportlab.lib.pagesizes import letter
-    from reportlab.pdfgen import canvas
-    import io
-    citas = []
-    if os.path.exists("citas_clientes.txt"):
-        with open("citas_clientes.txt", "r", encoding="utf-8") as f:
-            for line in f:
-                if line.strip():
-                    partes = line.strip().split("|")
-                    if len(partes) >= 5:
-                        citas.append(partes)
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(30, 750, "Genesis SA Services LLC - Appointments")
-    c.setFont("Helvetica", 11)
-    y = 720
-    for i, cita in enumerate(citas):
-        c.drawString(30, y, f"{i+1}. Name: {cita[0]}, Service: {cita[1]}, Date: {cita[2]}, Address: {cita[3]}, Email: {cita[4]}, Message: {cita[5] if len(cita)>5 else ''}")
-        y -= 22
-        if y < 60:
-            c.showPage();
-            y = 750
-    c.save()
-    buffer.seek(0)
-    return send_file(buffer, as_attachment=True, download_name="appointments.pdf", mimetype="application/pdf")
-
-# --- Agregar datos de ejemplo si es necesario al iniciar la app ---
+    import tempfile
+    import reports
+    filtros = filtros_exportacion()
+    _, _, total = citas_store.scan(limit=0, **filtros)
+    if total > PDF_BACKGROUND_ROWS:
+        token = reports.start_background(citas_store.iter_pages(**filtros))
+        return redirect(url_for("export_pdf_download", token=token))
+    # Hasta 8 MB en memoria; si el informe crece más, pasa a un archivo temporal
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    reports.write_pdf(citas_store.iter_pages(**filtros), spool)
+    spool.seek(0)
+    return send_file(spool, as_attachment=True, download_name="appointments.pdf", mimetype="application/pdf")
+
+@app.route("/export_pdf/<token>")
+@admin_required
+def export_pdf_download(token):
+    import reports
+    estado = reports.status(token)
+    if estado == "ready":
+        return send_file(os.path.abspath(reports.path(token)), as_attachment=True,
+                         download_name="appointments.pdf", mimetype="application/pdf")
+    if estado == "pending":
+        return '''<html><head><meta http-equiv="refresh" content="3"><title>Generating report</title></head>
+        <body style="font-family:Montserrat;padding:40px;">The PDF report is being generated. This page will download it when ready.
+        <br><br><a href="/admin">Back to the panel</a></body></html>'''
+    return "Report not found or failed. <a href='/admin'>Go to Admin Panel</a>", 404
+
+# --- Agregar datos de ejemplo en local ---
+# Ya no se hace al importar (cada worker tocaba los archivos de datos al
+# arrancar): "flask add-test-data" o "python app.py".
 def auto_add_test_data():
     # Solo agrega si no hay citas ni mensajes y NO estamos en Render
     if IS_RENDER:
         return
     if not os.path.exists("citas_clientes.txt") or os.path.getsize("citas_clientes.txt") == 0:
-        with open("citas_clientes.txt", "a", encoding="utf-8") as f:
-            f.write("John Doe|Landscaping|2025-06-01|123 Main St|john@example.com|Please call before coming.\n")
-            f.write("Jane Smith|Tree Removal|2025-06-03|456 Oak Ave|jane@example.com|Backyard only.\n")
+        citas_store.add(["John Doe", "Landscaping", "2025-06-01", "123 Main St", "john@example.com", "Please call before coming."])
+        citas_store.add(["Jane Smith", "Tree Removal", "2025-06-03", "456 Oak Ave", "jane@example.com", "Backyard only."])
     if not os.path.exists("mensajes_clientes.txt") or os.path.getsize("mensajes_clientes.txt") == 0:
-        with open("mensajes_clientes.txt", "a", encoding="utf-8") as f:
-            f.write("John Doe: Please call me back about my landscaping appointment.\n")
-            f.write("Jane Smith: I need a tree removed urgently.\n")
-
-# Ejecutar la función al iniciar el script
-auto_add_test_data()
+        mensajes_store.add({"name": "John Doe", "transcript": "Please call me back about my landscaping appointment."})
+        mensajes_store.add({"name": "Jane Smith", "transcript": "I need a tree removed urgently."})
+
+@app.cli.command("add-test-data")
+def add_test_data_command():
+    """Agrega las citas y mensajes de ejemplo si los archivos están vacíos."""
+    auto_add_test_data()
+
+# --- Precalentar ---
+# Lo que antes se hacía al importar (compilar las plantillas, construir el
+# TwiML de voice.py, que importa twilio, leer static/, arrancar los hilos de la
+# cola de trabajos) se hace en un hilo en cuanto el worker arranca: el worker
+# atiende peticiones antes y, normalmente, la primera llamada de Twilio ya lo
+# encuentra hecho. Lo lanza arrancar(), desde el hook post_worker_init de
+# gunicorn.conf.py o desde __main__, no el import: importar app (los comandos
+# flask, "python jobs.py") no crea archivos ni hilos.
+def precalentar():
+    inicio = time.perf_counter()
+    try:
+        arrancar_trabajos()
+        assets.refresh()
+        for plantilla in PLANTILLAS:
+            app.jinja_env.get_template(plantilla)
+        voice.precalentar()
+    except Exception as e:
+        print(f"[STARTUP] Error al precalentar: {e}")
+        return
+    print(f"[STARTUP] Plantillas, TwiML y static/ listos en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+
+def arrancar():
+    """Precalienta en un hilo (WARMUP=0 lo deja todo para la primera petición)."""
+    if os.getenv("WARMUP", "1") != "0":
+        threading.Thread(target=precalentar, daemon=True, name="precalentar").start()
+
+if __name__ == "__main__":
+    auto_add_test_data()
+    # Con el recargador de debug, solo en el proceso hijo que atiende peticiones
+    if IS_RENDER or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        arrancar()
+    app.run(debug=not IS_RENDER)
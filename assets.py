@@ -0,0 +1,113 @@
+"""Archivos de static/ servidos desde memoria.
+
+La primera vez que se pide un archivo (o al precalentar, ver app.py) se lee
+todo el directorio, cada archivo una vez, y se guarda con su huella (sha256),
+un ETag fuerte y, si merece la pena, sus versiones gzip y brotli (esta última
+solo si el paquete ``brotli`` está instalado). Las URLs ``/static/x?v=<huella>``
+se sirven como inmutables; las demás se revalidan con el ETag y reciben un 304
+si no han cambiado. Cada codificación lleva su propio ETag (``<huella>-gzip``,
+``<huella>-br``): un ETag fuerte identifica los bytes exactos enviados. El directorio se vuelve a revisar como mucho cada
+``intervalo`` segundos, así que las peticiones normales no tocan el disco.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+INMUTABLE = "public, max-age=31536000, immutable"
+REVALIDAR = "public, max-age=86400"
+COMPRIMIBLES = ("text/", "image/svg+xml", "application/javascript", "application/json")
+
+
+class Asset:
+    def __init__(self, nombre, datos, firma):
+        self.nombre = nombre
+        self.datos = datos
+        self.firma = firma  # (mtime_ns, tamaño) con el que se leyó
+        self.mtime = firma[0] / 1e9
+        huella = hashlib.sha256(datos).hexdigest()
+        self.hash = huella[:12]
+        self.etag = huella[:32]
+        self.mimetype = mimetypes.guess_type(nombre)[0] or "application/octet-stream"
+        self.variantes = {}  # codificación -> bytes
+        if self.mimetype.startswith(COMPRIMIBLES):
+            comprimidos = {"gzip": gzip.compress(datos, 9, mtime=0)}
+            if brotli is not None:
+                comprimidos["br"] = brotli.compress(datos)
+            # Solo se guardan las variantes que ahorran algo de verdad
+            self.variantes = {k: v for k, v in comprimidos.items() if len(v) < len(datos) * 0.9}
+
+
+class AssetManifest:
+    def __init__(self, directorio, intervalo=60):
+        self.directorio = directorio
+        self.intervalo = intervalo
+        self._assets = {}
+        self._revisado = float("-inf")   # sin leer: importar app no toca el disco
+        self._mutex = threading.Lock()
+
+    def refresh(self):
+        """Relee los archivos nuevos o modificados y olvida los borrados."""
+        with self._mutex:
+            assets = {}
+            for raiz, _, archivos in os.walk(self.directorio):
+                for archivo in archivos:
+                    ruta = os.path.join(raiz, archivo)
+                    nombre = os.path.relpath(ruta, self.directorio).replace(os.sep, "/")
+                    try:
+                        st = os.stat(ruta)
+                        firma = (st.st_mtime_ns, st.st_size)
+                        anterior = self._assets.get(nombre)
+                        if anterior is not None and anterior.firma == firma:
+                            assets[nombre] = anterior
+                        else:
+                            with open(ruta, "rb") as f:
+                                assets[nombre] = Asset(nombre, f.read(), firma)
+                    except OSError as e:
+                        print(f"[ASSETS] No se pudo leer {ruta}: {e}")
+            self._assets = assets
+            self._revisado = time.monotonic()
+
+    def get(self, nombre):
+        if time.monotonic() - self._revisado >= self.intervalo:
+            self.refresh()
+        return self._assets.get(nombre)
+
+    def url(self, nombre):
+        """URL con la huella del contenido, o la ruta normal si el archivo no existe."""
+        asset = self.get(nombre)
+        return f"/static/{nombre}?v={asset.hash}" if asset else f"/static/{nombre}"
+
+    def response(self, asset, request):
+        """Respuesta para ``asset``: 304 si el cliente ya lo tiene, comprimida si lo acepta."""
+        if request.args.get("v") == asset.hash:
+            cache = INMUTABLE
+        else:
+            cache = REVALIDAR
+        codificacion = None
+        for candidata in ("br", "gzip"):
+            if candidata in asset.variantes and request.accept_encodings[candidata]:
+                codificacion = candidata
+                break
+        etag = f"{asset.etag}-{codificacion}" if codificacion else asset.etag
+        if etag in request.if_none_match:
+            resp = Response(status=304)
+        else:
+            resp = Response(asset.variantes.get(codificacion, asset.datos), mimetype=asset.mimetype)
+            if codificacion:
+                resp.headers["Content-Encoding"] = codificacion
+        if asset.variantes:
+            resp.vary.add("Accept-Encoding")
+        resp.set_etag(etag)
+        resp.last_modified = asset.mtime
+        resp.headers["Cache-Control"] = cache
+        return resp
@@ -0,0 +1,128 @@
+"""Credenciales de administradores (admins.txt) y límite de intentos de login.
+
+admins.txt se lee una vez y se vuelve a leer solo cuando cambia su mtime. Si un
+hash guardado usa un coste de bcrypt distinto de ``BCRYPT_ROUNDS``, se rehace
+con el coste actual en el siguiente login correcto.
+"""
+import os
+import threading
+import time
+
+from store import bloqueo
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+LOGIN_MAX_ATTEMPTS = int(os.getenv("LOGIN_MAX_ATTEMPTS", "5"))
+LOGIN_WINDOW_SECONDS = int(os.getenv("LOGIN_WINDOW_SECONDS", "300"))
+
+
+def _coste(hashed):
+    """Coste de un hash bcrypt ``$2b$12$...``, o None si no tiene ese formato."""
+    partes = hashed.split("$")
+    return int(partes[2]) if len(partes) > 3 and partes[2].isdigit() else None
+
+
+class AdminCredentials:
+    def __init__(self, path, rounds=BCRYPT_ROUNDS):
+        self.path = path
+        self.rounds = rounds
+        self._mtime = None
+        self._usuarios = {}  # usuario -> [hashes]
+        self._mutex = threading.Lock()
+
+    def _refrescar(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        usuarios = {}
+        if mtime is not None:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip() and not line.startswith('#') and ":" in line:
+                        user, hashed = line.strip().split(":", 1)
+                        usuarios.setdefault(user, []).append(hashed)
+        self._usuarios, self._mtime = usuarios, mtime
+
+    def check(self, username, password):
+        import bcrypt
+        with self._mutex:
+            self._refrescar()
+            hashes = list(self._usuarios.get(username, ()))
+        for hashed in hashes:
+            try:
+                ok = bcrypt.checkpw(password.encode(), hashed.encode())
+            except ValueError:
+                continue
+            if ok:
+                if _coste(hashed) != self.rounds:
+                    self._rehash(username, hashed, password)
+                return True
+        return False
+
+    def _rehash(self, username, anterior, password):
+        """Reemplaza en admins.txt el hash ``anterior`` por uno con el coste actual."""
+        import bcrypt
+        nuevo = bcrypt.hashpw(password.encode(), bcrypt.gensalt(self.rounds)).decode()
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with bloqueo(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    lineas = f.readlines()
+                with open(tmp, "w", encoding="utf-8") as f:
+                    for line in lineas:
+                        if line.strip() == f"{username}:{anterior}":
+                            line = f"{username}:{nuevo}\n"
+                        f.write(line)
+                os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[SECURITY] No se pudo actualizar el hash de {username}: {e}")
+
+
+class LoginThrottle:
+    """Intentos fallidos por clave (IP, usuario+IP) en una ventana deslizante.
+
+    Mientras una clave está bloqueada el login se rechaza sin llegar a bcrypt,
+    así una ráfaga de intentos no ocupa a todos los workers. El conteo es por
+    proceso.
+    """
+
+    def __init__(self, max_attempts=LOGIN_MAX_ATTEMPTS, window=LOGIN_WINDOW_SECONDS):
+        self.max_attempts = max_attempts
+        self.window = window
+        self._fallos = {}  # clave -> [instantes de los fallos recientes]
+        self._mutex = threading.Lock()
+
+    def _recientes(self, clave, ahora):
+        fallos = [t for t in self._fallos.get(clave, ()) if ahora - t < self.window]
+        if fallos:
+            self._fallos[clave] = fallos
+        else:
+            self._fallos.pop(clave, None)
+        return fallos
+
+    def blocked(self, *claves):
+        """Segundos que faltan para poder intentarlo de nuevo (0 si no está bloqueado)."""
+        ahora = time.monotonic()
+        with self._mutex:
+            espera = 0
+            for clave in claves:
+                fallos = self._recientes(clave, ahora)
+                if len(fallos) >= self.max_attempts:
+                    espera = max(espera, int(fallos[-self.max_attempts] + self.window - ahora) + 1)
+            return espera
+
+    def fail(self, *claves):
+        ahora = time.monotonic()
+        with self._mutex:
+            if len(self._fallos) > 10000:
+                for clave in list(self._fallos):
+                    self._recientes(clave, ahora)
+            for clave in claves:
+                self._fallos.setdefault(clave, []).append(ahora)
+
+    def reset(self, *claves):
+        with self._mutex:
+            for clave in claves:
+                self._fallos.pop(clave, None)
@@ -0,0 +1,47 @@
+"""Comprueba que las rutas del panel piden login.
+
+Uso: python bench/admin_routes.py
+
+Importa app en un directorio temporal vacío y pide cada ruta de app.url_map sin
+sesión. Salvo las de PUBLICAS y los webhooks de voz (voice.py, que van
+firmados por Twilio), todas deben redirigir a /login o responder 401. Sale con
+código 1 si alguna responde otra cosa: una ruta nueva sin ``@admin_required``
+aparece aquí.
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PUBLICAS = {"home", "login", "logout", "static", "metrics", "healthz", "get_logo", "get_logo_base64",
+            "test_logo_page"}
+
+
+def main():
+    os.chdir(tempfile.mkdtemp())
+    os.environ.update(RENDER="true", WARMUP="0", JOB_WORKER_THREADS="0")
+    sys.path.insert(0, RAIZ)
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as aplicacion
+    aplicacion.app.config["WTF_CSRF_ENABLED"] = False
+    c = aplicacion.app.test_client()
+    abiertas = 0
+    for regla in sorted(aplicacion.app.url_map.iter_rules(), key=lambda r: r.rule):
+        if regla.endpoint in PUBLICAS or regla.endpoint.startswith("voice."):
+            continue
+        ruta = regla.rule
+        for argumento in regla.arguments:
+            ruta = ruta.replace(f"<{argumento}>", "x").replace(f"<path:{argumento}>", "x")
+        metodo = "GET" if "GET" in regla.methods else "POST"
+        with contextlib.redirect_stdout(io.StringIO()):
+            r = c.open(ruta, method=metodo)
+        protegida = r.status_code == 401 or (r.status_code == 302 and r.location.endswith("/login"))
+        abiertas += not protegida
+        print(f"  {metodo:<5}{ruta:<30}{r.status_code:>5}  {'ok' if protegida else 'SIN LOGIN'}")
+    sys.exit(1 if abiertas else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Generador de datos de prueba: citas y mensajes de voz con la forma de los reales.
+
+Uso: python bench/datos.py <citas> [directorio] [--mensajes N] [--semilla S]
+
+Escribe ``citas_clientes.txt`` (formato del diario, con id) y
+``mensajes_clientes.txt`` (JSON por línea) en ``directorio`` (por defecto el
+actual). Con la misma semilla y el mismo número de filas sale siempre el mismo
+archivo, así que los resultados de distintos días se pueden comparar. Sin
+``--mensajes`` se generan una décima parte de mensajes que de citas.
+"""
+import json
+import os
+import random
+import sys
+
+NOMBRES = ["John", "Jane", "Maria", "Carlos", "Ana", "Luis", "Emily", "Robert", "Sofia", "David",
+           "Michael", "Laura", "José", "Carmen", "James", "Patricia"]
+APELLIDOS = ["Doe", "Smith", "Garcia", "Lopez", "Brown", "Martinez", "Johnson", "Perez", "Hernandez",
+             "Williams", "Rodriguez", "Davis"]
+SERVICIOS = ["Landscaping", "Tree Removal", "Fence Installation", "Lawn Mowing", "Irrigation",
+             "Hardscaping", "Gutter Cleaning", "Mulching"]
+CALLES = ["Main St", "Oak Ave", "Pine Rd", "Cedar Ln", "Elm St", "Maple Dr", "Sunset Blvd", "Culebra Rd"]
+NOTAS = ["", "", "", "Please call before coming.", "Backyard only.", "Gate code 1234.", "Dog in the yard.",
+         "Estimate first, please.", "Llamar antes de venir."]
+TEXTOS = {
+    "en": ["Please call me back about my appointment.", "I need a tree removed urgently.",
+           "Can you give me a quote for a new fence?", "I want to reschedule to next week."],
+    "es": ["Por favor llámenme sobre mi cita.", "Necesito quitar un árbol urgente.",
+           "Quisiera un presupuesto para una cerca nueva."],
+}
+LOTE = 10000   # filas por escritura
+
+
+def cita(rnd, i):
+    nombre = f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)}"
+    usuario = nombre.lower().replace(" ", ".").replace("é", "e")
+    return [
+        nombre, rnd.choice(SERVICIOS), f"{rnd.choice((2024, 2025))}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+        f"{rnd.randint(1, 9999)} {rnd.choice(CALLES)}, San Antonio", f"{usuario}{i}@example.com",
+        rnd.choice(NOTAS), f"{rnd.getrandbits(48):012x}",
+    ]
+
+
+def mensaje(rnd, i):
+    lengua = rnd.choice(("en", "en", "es"))
+    return {
+        "timestamp": f"2025-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d} "
+                     f"{rnd.randint(8, 19):02d}:{rnd.randint(0, 59):02d}:00",
+        "call_sid": f"CA{rnd.getrandbits(128):032x}",
+        "caller": f"+1210555{rnd.randint(0, 9999):04d}",
+        "name": f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)}" if rnd.random() < 0.7 else "",
+        "language": lengua,
+        "transcript": rnd.choice(TEXTOS[lengua]),
+        "recording_url": f"https://api.twilio.com/recordings/RE{i:030d}",
+    }
+
+
+def _escribir(path, filas, linea, semilla):
+    rnd = random.Random(f"{semilla}:{os.path.basename(path)}")
+    with open(path, "w", encoding="utf-8") as f:
+        for inicio in range(0, filas, LOTE):
+            f.write("".join(linea(rnd, i) for i in range(inicio, min(filas, inicio + LOTE))))
+
+
+def generar(directorio, citas, mensajes=None, semilla=0):
+    """Escribe los dos archivos en ``directorio`` y devuelve sus rutas."""
+    if mensajes is None:
+        mensajes = max(1, citas // 10)
+    rutas = (os.path.join(directorio, "citas_clientes.txt"), os.path.join(directorio, "mensajes_clientes.txt"))
+    _escribir(rutas[0], citas, lambda rnd, i: "|".join(cita(rnd, i)) + "\n", semilla)
+    _escribir(rutas[1], mensajes, lambda rnd, i: json.dumps(mensaje(rnd, i), ensure_ascii=False) + "\n", semilla)
+    # Quitar lo que describía el diario anterior (estadísticas guardadas)
+    if os.path.exists(rutas[0] + ".stats"):
+        os.remove(rutas[0] + ".stats")
+    return rutas
+
+
+def opcion(nombre, defecto=None):
+    return sys.argv[sys.argv.index(nombre) + 1] if nombre in sys.argv else defecto
+
+
+def main():
+    args = [a for i, a in enumerate(sys.argv[1:], 1)
+            if not a.startswith("--") and not sys.argv[i - 1].startswith("--")]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+    mensajes = opcion("--mensajes")
+    rutas = generar(args[1] if len(args) > 1 else ".", int(args[0]),
+                    int(mensajes) if mensajes else None, int(opcion("--semilla", 0)))
+    for ruta in rutas:
+        print(f"{ruta}: {os.path.getsize(ruta) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
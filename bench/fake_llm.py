@@ -0,0 +1,77 @@
+"""Modelo falso compatible con /v1/chat/completions, para probar la extracción sin red.
+
+Uso: python bench/fake_llm.py [puerto] [retardo_ms]   (por defecto 8099 y 300)
+
+Arrancar la app con OPENAI_API_KEY=x OPENAI_BASE_URL=http://127.0.0.1:8099/v1.
+Responde a cada lote con lo que darían las reglas locales de extraction.py,
+tras ``retardo_ms`` para imitar la latencia del modelo. Muestra cuántas
+peticiones y transcripciones ha recibido, que es lo que mide el agrupado.
+Desde otro script: ``arrancar(puerto, retardo)`` devuelve el servidor, con
+los contadores ``peticiones`` e ``items``.
+"""
+import datetime
+import http.server
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import extraction  # noqa: E402
+
+
+class _Manejador(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        servidor = self.server
+        cuerpo = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        items = json.loads(cuerpo["messages"][-1]["content"])["items"]
+        time.sleep(servidor.retardo)
+        resultados = []
+        for item in items:
+            referencia = datetime.date.fromisoformat(item["call_date"])
+            campos = extraction.reglas(item, item["language"], referencia)
+            resultados.append(dict(campos, id=item["id"]))
+        with servidor.mutex:
+            servidor.peticiones += 1
+            servidor.items += len(items)
+            if servidor.mostrar:
+                print(f"[LLM] petición {servidor.peticiones}: {len(items)} transcripciones")
+        datos = json.dumps({
+            "id": f"chatcmpl-{servidor.peticiones}", "object": "chat.completion", "model": cuerpo.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": json.dumps({"results": resultados})}}],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+
+class Servidor(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, direccion, retardo=0.3, mostrar=True):
+        super().__init__(direccion, _Manejador)
+        self.retardo = retardo
+        self.mostrar = mostrar
+        self.peticiones = 0
+        self.items = 0
+        self.mutex = threading.Lock()
+
+
+def arrancar(puerto=0, retardo=0.3, mostrar=False):
+    servidor = Servidor(("127.0.0.1", puerto), retardo, mostrar)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+if __name__ == "__main__":
+    puerto = int(sys.argv[1]) if len(sys.argv) > 1 else 8099
+    retardo = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.3
+    print(f"Modelo falso en http://127.0.0.1:{puerto}/v1 (retardo {retardo * 1000:.0f} ms)")
+    Servidor(("127.0.0.1", puerto), retardo).serve_forever()
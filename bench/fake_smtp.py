@@ -0,0 +1,88 @@
+"""Servidor SMTP local que acepta todo y no entrega nada, para probar los correos.
+
+Uso: python bench/fake_smtp.py [puerto]   (por defecto 1025)
+
+Arrancar la app con SMTP_HOST=127.0.0.1 SMTP_PORT=1025 SMTP_STARTTLS=0 y
+NOTIFY_EMAIL=alguien@example.com. Cada mensaje recibido se muestra con su
+asunto. También se puede usar desde otro script con ``arrancar(puerto)``:
+devuelve el servidor, y ``servidor.mensajes`` guarda los mensajes recibidos
+y ``servidor.conexiones`` cuenta las sesiones abiertas.
+"""
+import email
+import socketserver
+import sys
+import threading
+
+
+class _Sesion(socketserver.StreamRequestHandler):
+    def responder(self, linea):
+        self.wfile.write(linea.encode() + b"\r\n")
+
+    def handle(self):
+        servidor = self.server
+        with servidor.mutex:
+            servidor.conexiones += 1
+        self.responder("220 localhost fake SMTP")
+        destinatarios = []
+        while True:
+            linea = self.rfile.readline()
+            if not linea:
+                return
+            comando = linea.decode("utf-8", "replace").strip()
+            verbo = comando[:4].upper()
+            if verbo == "EHLO":
+                self.wfile.write(b"250-localhost\r\n250-8BITMIME\r\n250 SMTPUTF8\r\n")
+            elif verbo == "HELO":
+                self.responder("250 localhost")
+            elif verbo == "MAIL":
+                destinatarios = []
+                self.responder("250 OK")
+            elif verbo == "RCPT":
+                destinatarios.append(comando.split(":", 1)[1].strip(" <>"))
+                self.responder("250 OK")
+            elif verbo == "DATA":
+                self.responder("354 End data with <CR><LF>.<CR><LF>")
+                partes = []
+                while True:
+                    linea = self.rfile.readline()
+                    if not linea or linea in (b".\r\n", b".\n"):
+                        break
+                    partes.append(linea[1:] if linea.startswith(b"..") else linea)
+                mensaje = email.message_from_bytes(b"".join(partes))
+                with servidor.mutex:
+                    servidor.mensajes.append((destinatarios, mensaje))
+                if servidor.mostrar:
+                    print(f"[SMTP] {', '.join(destinatarios)}: {mensaje['Subject']}")
+                self.responder("250 OK")
+            elif verbo == "QUIT":
+                self.responder("221 Bye")
+                return
+            elif verbo in ("RSET", "NOOP"):
+                self.responder("250 OK")
+            else:
+                self.responder("502 Command not implemented")
+
+
+class Servidor(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, direccion, mostrar=True):
+        super().__init__(direccion, _Sesion)
+        self.mensajes = []
+        self.conexiones = 0
+        self.mostrar = mostrar
+        self.mutex = threading.Lock()
+
+
+def arrancar(puerto=0, mostrar=False):
+    """Servidor en un hilo; con puerto 0 se elige uno libre (``servidor.server_address``)."""
+    servidor = Servidor(("127.0.0.1", puerto), mostrar)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+if __name__ == "__main__":
+    puerto = int(sys.argv[1]) if len(sys.argv) > 1 else 1025
+    print(f"SMTP de prueba en 127.0.0.1:{puerto}")
+    Servidor(("127.0.0.1", puerto)).serve_forever()
@@ -0,0 +1,88 @@
+"""Tiempo de ``import app`` y presupuesto que no debe pasar.
+
+Uso: python bench/importtime.py [presupuesto_ms] [--veces N] [--detalle]
+     (presupuesto por defecto IMPORT_BUDGET_MS o 250 ms, 5 veces)
+
+Importa app en un proceso nuevo con ``python -X importtime``, en un directorio
+temporal vacío, con RENDER=true y el resto del entorno por defecto (como un
+worker de gunicorn en Render antes de post_worker_init), y se queda con la
+mediana del tiempo acumulado de ``app``. Sale con código 1 si
+pasa del presupuesto, si al importar se cargó algún módulo de PESADOS, que
+tienen que importarse dentro de las funciones que los usan, o si importar app
+dejó archivos en el directorio (bases sqlite) o hilos en marcha: eso se hace al
+precalentar o en la primera petición. ``--detalle``
+muestra los módulos que más tardan de la última vez.
+"""
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Módulos que app no debe cargar al importarse
+PESADOS = ("openai", "twilio", "smtplib", "email.mime", "cProfile", "pstats", "reportlab")
+LINEA = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def medir():
+    """({módulo: (propio_us, acumulado_us, nivel)}, archivos creados, hilos) de un ``import app`` en frío."""
+    with tempfile.TemporaryDirectory() as directorio:
+        resultado = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import app, threading; print(threading.active_count())"],
+            cwd=directorio, capture_output=True, text=True,
+            env=dict(os.environ, RENDER="true", PYTHONPATH=RAIZ))
+        archivos = sorted(os.listdir(directorio))
+    if resultado.returncode:
+        print(resultado.stderr[-2000:])
+        raise SystemExit("import app falló")
+    modulos = {}
+    for linea in resultado.stderr.splitlines():
+        m = LINEA.match(linea)
+        if m:
+            modulos[m.group(4)] = (int(m.group(1)), int(m.group(2)), len(m.group(3)) // 2)
+    return modulos, archivos, int(resultado.stdout.split()[-1])
+
+
+def opcion(nombre, defecto=None):
+    return sys.argv[sys.argv.index(nombre) + 1] if nombre in sys.argv else defecto
+
+
+def main():
+    args = [a for i, a in enumerate(sys.argv[1:], 1)
+            if not a.startswith("--") and not sys.argv[i - 1].startswith("--")]
+    presupuesto = float(args[0]) if args else float(os.getenv("IMPORT_BUDGET_MS", "250"))
+    veces = int(opcion("--veces", 5))
+    medir()   # la primera deja los .pyc escritos
+    tiempos = []
+    for _ in range(veces):
+        modulos, archivos, hilos = medir()
+        tiempos.append(modulos["app"][1] / 1000)
+    mediana = statistics.median(tiempos)
+    print(f"import app: mediana {mediana:.1f} ms de {veces} (mín {min(tiempos):.1f}, máx {max(tiempos):.1f}), "
+          f"presupuesto {presupuesto:.0f} ms")
+    if "--detalle" in sys.argv:
+        print(f"  {'módulo':<40}{'propio':>10}{'acumulado':>12}")
+        directos = [(n, p, a) for n, (p, a, nivel) in modulos.items() if nivel <= 1]
+        for nombre, propio, acumulado in sorted(directos, key=lambda m: -m[2])[:20]:
+            print(f"  {nombre:<40}{propio / 1000:>8.1f}ms{acumulado / 1000:>10.1f}ms")
+    cargados = sorted(n for n in modulos if any(n == p or n.startswith(p + ".") for p in PESADOS))
+    fallo = False
+    if cargados:
+        print("  módulos que no se deberían cargar al importar:", ", ".join(cargados[:10]))
+        fallo = True
+    if archivos:
+        print("  archivos creados al importar:", ", ".join(archivos))
+        fallo = True
+    if hilos > 1:
+        print(f"  {hilos - 1} hilo(s) en marcha al terminar de importar")
+        fallo = True
+    if mediana > presupuesto:
+        print(f"  {mediana - presupuesto:.1f} ms por encima del presupuesto")
+        fallo = True
+    sys.exit(1 if fallo else 0)
+
+
+if __name__ == "__main__":
+    main()
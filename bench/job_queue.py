@@ -0,0 +1,70 @@
+"""Prueba de carga de la cola de trabajos con varios procesos trabajadores.
+
+Uso: python bench/job_queue.py [trabajos] [procesos]   (por defecto 2000 y 4)
+
+Encola los trabajos (cada clave dos veces, para comprobar la idempotencia)
+con un manejador que falla en el primer intento de uno de cada cinco. Luego
+varios procesos los ejecutan a la vez. Al final comprueba que cada trabajo
+terminó una sola vez y que los fallidos se reintentaron.
+"""
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("JOBS_BACKOFF_SECONDS", "0.05")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import jobs  # noqa: E402
+
+DIRECTORIO = tempfile.mkdtemp()
+REGISTRO = os.path.join(DIRECTORIO, "hechos.txt")
+
+
+@jobs.handler("prueba")
+def prueba(datos):
+    if datos["n"] % 5 == 0 and not os.path.exists(os.path.join(DIRECTORIO, f"fallo-{datos['n']}")):
+        open(os.path.join(DIRECTORIO, f"fallo-{datos['n']}"), "w").close()
+        raise RuntimeError("fallo provocado")
+    with open(REGISTRO, "a") as f:
+        f.write(f"{datos['n']}\n")
+
+
+def trabajador(path):
+    cola = jobs.JobQueue(path)
+    while cola.run_one() or any(cola.stats().get(e) for e in ("pendiente", "en_curso")):
+        pass
+    os._exit(0)
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    procesos = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    path = os.path.join(DIRECTORIO, "trabajos.db")
+    cola = jobs.JobQueue(path)
+    inicio = time.perf_counter()
+    nuevos = sum(1 for n in list(range(total)) * 2 if cola.enqueue("prueba", {"n": n}, clave=f"prueba:{n}"))
+    encolar = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    hijos = []
+    for _ in range(procesos):
+        pid = os.fork()
+        if pid == 0:
+            trabajador(path)
+        hijos.append(pid)
+    for pid in hijos:
+        os.waitpid(pid, 0)
+    ejecutar = time.perf_counter() - inicio
+    with open(REGISTRO) as f:
+        hechos = [int(x) for x in f]
+    print(f"{total} trabajos, {procesos} procesos")
+    print(f"  encolar (x2): {encolar:.2f} s, nuevos {nuevos}")
+    print(f"  ejecutar: {ejecutar:.2f} s ({total / ejecutar:.0f} trabajos/s)")
+    print(f"  estados: {cola.stats()}")
+    repetidos = len(hechos) - len(set(hechos))
+    perdidos = total - len(set(hechos))
+    print(f"  hechos {len(hechos)}, repetidos {repetidos}, perdidos {perdidos}")
+    sys.exit(1 if repetidos or perdidos or nuevos != total else 0)
+
+
+if __name__ == "__main__":
+    main()
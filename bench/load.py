@@ -0,0 +1,232 @@
+"""Prueba de carga por http: varios procesos cliente contra un servidor real.
+
+Uso:
+  python bench/load.py [segundos] [procesos] [hilos] [--filas N]
+      (arranca gunicorn con gunicorn.conf.py sobre N citas generadas, por defecto 100000)
+  python bench/load.py 30 4 8 --url https://... --user admin --password ...
+
+Cada hilo cliente entra al panel (login con su token CSRF) y hace una mezcla
+de peticiones parecida a la real: panel con y sin búsqueda, API, estadísticas,
+alguna exportación filtrada, citas nuevas y llamadas completas a los webhooks
+de voz. Al final se muestran p50/p99 por ruta, los errores y las peticiones
+por segundo. Sin ``--url`` el servidor y los datos son temporales y se usa un
+administrador propio de la prueba. Los webhooks de voz van firmados con
+TWILIO_AUTH_TOKEN (con ``--url`` hay que dar el del servidor; si no, un token de
+prueba que también recibe el gunicorn temporal). Ese gunicorn no recicla workers
+(``--max-requests 0``): al reciclar uno, las peticiones que llegan por sus
+conexiones keep-alive esperan hasta ``graceful_timeout`` y los p99 miden eso.
+"""
+import http.client
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import datos  # noqa: E402
+
+USUARIO, CLAVE = "bench", "bench-password"
+TOKEN_TWILIO = os.environ.setdefault("TWILIO_AUTH_TOKEN", "bench-twilio-token")
+WEBHOOKS = ("/voice", "/gather_name")
+# (nombre, peso)
+MEZCLA = [("admin", 20), ("admin search", 8), ("admin page", 6), ("api", 12), ("stats", 8),
+          ("export_csv filtro", 2), ("add_appointment", 2), ("llamada", 10)]
+
+
+class Cliente:
+    """Conexión persistente con la cookie de sesión, como un navegador."""
+
+    def __init__(self, url):
+        partes = urllib.parse.urlsplit(url)
+        clase = http.client.HTTPSConnection if partes.scheme == "https" else http.client.HTTPConnection
+        self.con = clase(partes.netloc, timeout=30)
+        self.base = url
+        self.cookie = ""
+
+    def pedir(self, metodo, ruta, formulario=None):
+        cabeceras = {"Cookie": self.cookie} if self.cookie else {}
+        cuerpo = None
+        if formulario is not None:
+            cuerpo = urllib.parse.urlencode(formulario)
+            cabeceras["Content-Type"] = "application/x-www-form-urlencoded"
+            if ruta in WEBHOOKS:
+                from twilio.request_validator import RequestValidator
+                cabeceras["X-Twilio-Signature"] = RequestValidator(TOKEN_TWILIO).compute_signature(
+                    self.base + ruta, formulario)
+        try:
+            self.con.request(metodo, ruta, body=cuerpo, headers=cabeceras)
+            r = self.con.getresponse()
+        except (http.client.HTTPException, OSError):
+            # El servidor cerró la conexión (keepalive vencido): otra y un reintento
+            self.con.close()
+            self.con.request(metodo, ruta, body=cuerpo, headers=cabeceras)
+            r = self.con.getresponse()
+        datos_respuesta = r.read()
+        galleta = r.getheader("Set-Cookie")
+        if galleta and galleta.startswith("session="):
+            self.cookie = galleta.split(";", 1)[0]
+        return r.status, datos_respuesta
+
+
+def entrar(cliente, usuario, clave):
+    _, pagina = cliente.pedir("GET", "/login")
+    token = re.search(rb'name="csrf_token" value="([^"]+)"', pagina)
+    token = token.group(1).decode() if token else ""
+    estado, _ = cliente.pedir("POST", "/login", {"username": usuario, "password": clave, "csrf_token": token})
+    if estado != 302:
+        raise RuntimeError(f"login fallido ({estado})")
+    return token
+
+
+def peticiones(nombre, rnd, token):
+    """Lista de (ruta para el informe, método, ruta, formulario) de una operación."""
+    if nombre == "admin":
+        return [("/admin", "GET", "/admin", None)]
+    if nombre == "admin search":
+        consulta = rnd.choice(datos.APELLIDOS).lower() + " " + rnd.choice(datos.SERVICIOS).split()[0].lower()
+        return [("/admin?search", "GET", "/admin?" + urllib.parse.urlencode({"search": consulta}), None)]
+    if nombre == "admin page":
+        return [("/admin?page", "GET", f"/admin?page={rnd.randint(2, 500)}", None)]
+    if nombre == "api":
+        return [("/api/appointments", "GET", f"/api/appointments?limit=50&service={urllib.parse.quote(rnd.choice(datos.SERVICIOS))}",
+                 None)]
+    if nombre == "stats":
+        return [("/stats_data", "GET", "/stats_data", None)]
+    if nombre == "export_csv filtro":
+        return [("/export_csv?search", "GET", f"/export_csv?search={rnd.choice(datos.APELLIDOS).lower()}"
+                 f"&service={urllib.parse.quote(rnd.choice(datos.SERVICIOS))}&start=2025-06-01&end=2025-06-30", None)]
+    if nombre == "add_appointment":
+        i = rnd.getrandbits(32)
+        return [("/add_appointment", "POST", "/add_appointment",
+                 {"name": f"Load Client {i}", "service": "Landscaping", "date": "2025-07-01",
+                  "address": f"{i % 9999} Main St", "email": f"load{i}@example.com", "message": "",
+                  "csrf_token": token})]
+    sid = f"CALOAD{rnd.getrandbits(64):016x}"
+    pasos = [("/voice", "POST", "/voice", {"CallSid": sid})]
+    for respuesta in ("John Smith.", "Tree removal.", "Next Monday.", "123 Main Street."):
+        pasos.append(("/gather_name", "POST", "/gather_name",
+                      {"CallSid": sid, "From": "+12105550100", "SpeechResult": respuesta}))
+    return pasos
+
+
+def hilo_cliente(url, usuario, clave, hasta, semilla, muestras):
+    rnd = random.Random(semilla)
+    cliente = Cliente(url)
+    token = entrar(cliente, usuario, clave)
+    nombres = [n for n, _ in MEZCLA]
+    pesos = [p for _, p in MEZCLA]
+    while time.time() < hasta:
+        for etiqueta, metodo, ruta, formulario in peticiones(rnd.choices(nombres, pesos)[0], rnd, token):
+            inicio = time.perf_counter()
+            try:
+                estado, _ = cliente.pedir(metodo, ruta, formulario)
+            except Exception:
+                estado = 0
+            muestras.append((etiqueta, (time.perf_counter() - inicio) * 1000, estado))
+
+
+def proceso_cliente(url, usuario, clave, hilos, hasta, semilla, salida):
+    muestras = []
+    trabajadores = [threading.Thread(target=hilo_cliente, args=(url, usuario, clave, hasta, semilla * 1000 + i,
+                                                                 muestras)) for i in range(hilos)]
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+    salida.put(muestras)
+
+
+def arrancar_servidor(filas):
+    """gunicorn (gunicorn.conf.py) sobre datos generados; devuelve (url, proceso)."""
+    import bcrypt
+    directorio = tempfile.mkdtemp()
+    datos.generar(directorio, filas)
+    shutil.copy(os.path.join(RAIZ, "admins.txt"), directorio)
+    with open(os.path.join(directorio, "admins.txt"), "a", encoding="utf-8") as f:
+        f.write(f"\n{USUARIO}:{bcrypt.hashpw(CLAVE.encode(), bcrypt.gensalt()).decode()}\n")
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        puerto = s.getsockname()[1]
+    servidor = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", os.path.join(RAIZ, "gunicorn.conf.py"), "--pythonpath", RAIZ,
+         "--bind", f"127.0.0.1:{puerto}", "--access-logfile", "/dev/null", "--max-requests", "0", "app:app"],
+        cwd=directorio, env=dict(os.environ, RENDER="true"), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{puerto}"
+    for _ in range(300):
+        try:
+            if Cliente(url).pedir("GET", "/healthz")[0] == 200:
+                return url, servidor
+        except OSError:
+            time.sleep(0.1)
+    servidor.kill()
+    raise RuntimeError("gunicorn no arrancó")
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def opcion(nombre, defecto=None):
+    return sys.argv[sys.argv.index(nombre) + 1] if nombre in sys.argv else defecto
+
+
+def main():
+    args = [a for i, a in enumerate(sys.argv[1:], 1)
+            if not a.startswith("--") and not sys.argv[i - 1].startswith("--")]
+    segundos = float(args[0]) if args else 20
+    procesos = int(args[1]) if len(args) > 1 else 4
+    hilos = int(args[2]) if len(args) > 2 else 4
+    servidor = None
+    if opcion("--url"):
+        url, usuario, clave = opcion("--url").rstrip("/"), opcion("--user", "admin"), opcion("--password", "")
+    else:
+        filas = int(opcion("--filas", 100000))
+        print(f"Arrancando gunicorn con {filas} citas generadas...")
+        (url, servidor), usuario, clave = arrancar_servidor(filas), USUARIO, CLAVE
+    try:
+        contexto = multiprocessing.get_context("fork")
+        salida = contexto.Queue()
+        hasta = time.time() + segundos
+        clientes = [contexto.Process(target=proceso_cliente, args=(url, usuario, clave, hilos, hasta, i, salida))
+                    for i in range(procesos)]
+        for p in clientes:
+            p.start()
+        muestras = [m for _ in clientes for m in salida.get()]
+        for p in clientes:
+            p.join()
+    finally:
+        if servidor is not None:
+            servidor.terminate()
+            servidor.wait()
+    por_ruta = {}
+    for etiqueta, ms, estado in muestras:
+        por_ruta.setdefault(etiqueta, []).append((ms, estado))
+    errores = sum(1 for _, _, estado in muestras if not estado or estado >= 400)
+    print(f"{len(muestras)} peticiones en {segundos:.0f} s con {procesos}x{hilos} clientes: "
+          f"{len(muestras) / segundos:.0f} pet/s, {errores} errores")
+    codigos = {}
+    for _, _, estado in muestras:
+        if not estado or estado >= 400:
+            codigos[estado or "conexión"] = codigos.get(estado or "conexión", 0) + 1
+    if codigos:
+        print("  errores por código:", codigos)
+    print(f"  {'ruta':<22}{'n':>8}{'p50':>10}{'p99':>10}{'máx':>10}{'errores':>9}")
+    for etiqueta, valores in sorted(por_ruta.items()):
+        tiempos = [ms for ms, _ in valores]
+        fallos = sum(1 for _, estado in valores if not estado or estado >= 400)
+        print(f"  {etiqueta:<22}{len(valores):>8}{percentil(tiempos, 0.5):>8.1f}ms{percentil(tiempos, 0.99):>8.1f}ms"
+              f"{max(tiempos):>8.1f}ms{fallos:>9}")
+
+
+if __name__ == "__main__":
+    main()
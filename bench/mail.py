@@ -0,0 +1,69 @@
+"""Correo de avisos contra el SMTP local de bench/fake_smtp.py.
+
+Uso: python bench/mail.py [correos]   (por defecto 200)
+
+Compara enviar ``correos`` mensajes abriendo una sesión SMTP por mensaje
+(lo que hacía enviar_correo) con la conexión reutilizada de SMTPPool. Luego
+comprueba que 50 avisos salen en un solo resumen y que la cuota por minuto
+frena los envíos.
+"""
+import os
+import smtplib
+import sys
+import tempfile
+import time
+from email.mime.text import MIMEText
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_smtp  # noqa: E402
+import mailer  # noqa: E402
+
+
+def mensaje(i):
+    msg = MIMEText(f"Aviso {i}")
+    msg["From"], msg["To"], msg["Subject"] = "app@example.com", "admin@example.com", f"Aviso {i}"
+    return msg
+
+
+def main():
+    correos = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    servidor = fake_smtp.arrancar()
+    host, puerto = servidor.server_address
+
+    inicio = time.perf_counter()
+    for i in range(correos):
+        with smtplib.SMTP(host, puerto) as smtp:
+            smtp.send_message(mensaje(i))
+    sesion_por_correo = time.perf_counter() - inicio
+
+    pool = mailer.SMTPPool(host, puerto, starttls=False)
+    inicio = time.perf_counter()
+    for i in range(correos):
+        pool.send(mensaje(i))
+    reutilizada = time.perf_counter() - inicio
+    print(f"{correos} correos")
+    print(f"  una sesión por correo: {sesion_por_correo:.2f} s")
+    print(f"  conexión reutilizada:  {reutilizada:.2f} s ({pool.conexiones} conexión)")
+
+    # Resumen: 50 avisos, un correo
+    mailer.RATE_PER_MINUTE = 3
+    m = mailer.Mailer(os.path.join(tempfile.mkdtemp(), "correo.db"), pool, "app@example.com", "admin@example.com")
+    recibidos = len(servidor.mensajes)
+    for i in range(50):
+        m.notify("appointment", f"New appointment {i}", f"Name: Cliente {i}")
+    m.send_digest()
+    print(f"  50 avisos -> {len(servidor.mensajes) - recibidos} correo: {servidor.mensajes[-1][1]['Subject']}")
+
+    # Cuota: 3 por minuto
+    enviados = 1
+    try:
+        while enviados < 10:
+            m.send("Prueba", "cuota")
+            enviados += 1
+    except mailer.RateLimited as e:
+        print(f"  cuota de 3/min: {enviados} enviados, luego RateLimited ({e.espera:.0f} s)")
+
+
+if __name__ == "__main__":
+    main()
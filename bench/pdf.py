@@ -0,0 +1,71 @@
+"""Mide /export_pdf: tiempo y memoria pico (RSS) del informe de citas.
+
+Uso: python bench/pdf.py [filas]   (por defecto 50000)
+
+Cada variante corre en un proceso hijo para que la memoria pico de una no
+contamine la de la otra: la versión anterior (una línea por cita en un
+BytesIO) y reports.write_pdf leyendo el almacén por lotes.
+"""
+import io
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import reports  # noqa: E402
+from search_index import generar  # noqa: E402
+from store import AppointmentStore  # noqa: E402
+
+
+def anterior(store, _destino):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    y = 720
+    for i, cita in enumerate(store.all()):
+        c.drawString(30, y, f"{i+1}. Name: {cita['name']}, Service: {cita['service']}, Date: {cita['date']}, "
+                            f"Address: {cita['address']}, Email: {cita['email']}, Message: {cita['message']}")
+        y -= 22
+        if y < 60:
+            c.showPage()
+            y = 750
+    c.save()
+    return len(buffer.getvalue())
+
+
+def nuevo(store, destino):
+    reports.write_pdf(store.iter_pages(), destino)
+    return os.path.getsize(destino)
+
+
+def medir(nombre, funcion, path):
+    pid = os.fork()
+    if pid == 0:
+        store = AppointmentStore(path)
+        len(store)
+        base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        inicio = time.perf_counter()
+        tamano = funcion(store, path + ".pdf")
+        segundos = time.perf_counter() - inicio
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f"  {nombre:<10}{segundos:>9.2f} s{(pico - base) / 1024:>12.1f} MB{tamano / 1024 / 1024:>10.1f} MB")
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+
+def main():
+    filas = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    path = os.path.join(tempfile.mkdtemp(), "citas_clientes.txt")
+    generar(path, filas)
+    print(f"{filas} filas")
+    print(f"  {'variante':<10}{'tiempo':>11}{'RSS extra':>15}{'PDF':>13}")
+    medir("anterior", anterior, path)
+    medir("reports", nuevo, path)
+
+
+if __name__ == "__main__":
+    main()
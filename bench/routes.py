@@ -0,0 +1,156 @@
+"""Banco de pruebas de las rutas de app.py con el cliente de pruebas de Flask.
+
+Uso: python bench/routes.py [filas,filas,...] [--repeticiones N] [--solo texto]
+     (por defecto 1000,100000 filas y 200 repeticiones)
+
+Por cada tamaño se generan los datos con bench/datos.py en un directorio
+temporal y se importa app en un proceso hijo, con RENDER=true y sin hilos de la
+cola de trabajos (los webhooks solo encolan, como en producción). De cada ruta
+se mide la primera petición (la que paga cargar el diario o construir un
+índice) y luego p50/p99 de las siguientes. Las exportaciones completas se
+repiten menos veces (se lee la respuesta entera). ``--solo`` limita las rutas a
+las que contengan ese texto en el nombre.
+"""
+import contextlib
+import io
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import urllib.parse
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import datos  # noqa: E402
+
+
+def _cita(i):
+    return {"name": f"Bench Client {i}", "service": "Landscaping", "date": "2025-06-01",
+            "address": f"{i} Main St", "email": f"bench{i}@example.com", "message": ""}
+
+
+def _guardar(ctx, i):
+    # Como el formulario del panel: id más nombre y fecha anteriores para comprobarla
+    cita = ctx["citas"][i % len(ctx["citas"])]
+    return dict(_cita(i), id=cita["id"], old_name=cita["name"], old_date=cita["date"])
+
+
+def _borrar(ctx, i):
+    # Cada repetición borra una cita distinta (del final de la lista)
+    cita = ctx["citas"][-1 - i]
+    return {"id": cita["id"], "name": cita["name"], "date": cita["date"]}
+
+
+def _paso(ctx, i):
+    # Una llamada nueva cada 4 peticiones: nombre, servicio, fecha y dirección
+    respuestas = ("John Smith.", "Tree removal.", "Next Monday.", "123 Main Street.")
+    return {"CallSid": f"CABENCH{i // 4:08d}", "From": "+12105550100", "SpeechResult": respuestas[i % 4]}
+
+
+def _importar(ctx, i):
+    # 1000 filas nuevas por petición, con el formato de /export_csv
+    filas = "".join(f"Import Client {i}-{n},Mulching,2025-07-01,{n} Oak Ave,imp{i}.{n}@example.com,\n"
+                    for n in range(1000))
+    return {"file": (io.BytesIO(("Name,Service,Date,Address,Email,Message\n" + filas).encode()), "citas.csv")}
+
+
+# (nombre, método, ruta, datos(ctx, i) o None, fracción de las repeticiones)
+CASOS = [
+    ("admin_panel", "GET", "/admin", None, 1),
+    ("admin_panel page", "GET", "/admin?page=50", None, 1),
+    ("admin_panel search", "GET", "/admin?search=garcia tree", None, 1),
+    ("admin_panel vm_search", "GET", "/admin?vm_search=urgente", None, 1),
+    ("api_appointments", "GET", "/api/appointments?limit=50&service=Mulching", None, 1),
+    ("stats_data", "GET", "/stats_data", None, 1),
+    ("stats_data rango", "GET", "/stats_data?start=2025-03-01&end=2025-05-31&service=Irrigation", None, 1),
+    ("export_csv", "GET", "/export_csv", None, 0.02),
+    ("export_csv filtro", "GET", "/export_csv?search=smith&service=Hardscaping", None, 0.1),
+    ("export_pdf filtro", "GET", "/export_pdf?service=Mulching&start=2025-06-01&end=2025-06-03", None, 0.05),
+    ("download_voicemails", "GET", "/download_voicemails", None, 0.02),
+    ("add_appointment", "POST", "/add_appointment", lambda ctx, i: _cita(i), 1),
+    ("edit_appointment", "POST", "/edit_appointment", _guardar, 1),
+    ("save_appointment", "POST", "/save_appointment", _guardar, 1),
+    ("delete_appointment", "POST", "/delete_appointment", _borrar, 1),
+    ("import_csv 1000 filas", "POST", "/import_csv", _importar, 0.05),
+    ("voice", "POST", "/voice", lambda ctx, i: {"CallSid": f"CAV{i}"}, 1),
+    ("gather_language", "POST", "/gather_language", lambda ctx, i: {"SpeechResult": "English"}, 1),
+    ("gather_name", "POST", "/gather_name", _paso, 1),
+    ("voicemail_transcription", "POST", "/voicemail_transcription",
+     lambda ctx, i: {"CallSid": f"CAM{i}", "RecordingSid": f"RE{i}", "TranscriptionText": "Call me back"}, 1),
+]
+
+
+WEBHOOKS = ("/voice", "/gather_language", "/gather_name", "/voicemail_transcription")
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def medir(filas, repeticiones, solo, salida):
+    directorio = tempfile.mkdtemp()
+    datos.generar(directorio, filas)
+    shutil.copy(os.path.join(RAIZ, "admins.txt"), directorio)
+    os.chdir(directorio)
+    os.environ.update(RENDER="true", JOB_WORKER_THREADS="0", TWILIO_AUTH_TOKEN="bench-twilio-token")
+    sys.path.insert(0, RAIZ)
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as aplicacion
+    aplicacion.app.config["WTF_CSRF_ENABLED"] = False
+    from twilio.request_validator import RequestValidator
+    c = aplicacion.app.test_client()
+    with c.session_transaction() as s:
+        s["admin_user"] = "admin"
+    resultados = []
+    for nombre, metodo, ruta, formulario, fraccion in CASOS:
+        if solo and solo not in nombre:
+            continue
+        ctx = {"citas": [dict(cita) for cita in aplicacion.citas_store.page(0, 2 * repeticiones + 1)]}
+        veces = max(2, int(repeticiones * fraccion))
+        tiempos, errores = [], 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(veces):
+                inicio = time.perf_counter()
+                if metodo == "GET":
+                    r = c.get(ruta)
+                elif ruta in WEBHOOKS:
+                    # Firmadas como las manda Twilio: se mide también la comprobación
+                    datos_form = formulario(ctx, i)
+                    r = c.post(ruta, data=datos_form, headers={"X-Twilio-Signature": RequestValidator(
+                        "bench-twilio-token").compute_signature("http://localhost" + ruta, datos_form)})
+                else:
+                    r = c.post(ruta, data=formulario(ctx, i))
+                r.get_data()
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+                # Las rutas del panel avisan de los fallos con una redirección y notif
+                aviso = urllib.parse.unquote_plus(r.headers.get("Location", ""))
+                errores += r.status_code >= 400 or "not found" in aviso or "required" in aviso
+        resultados.append((nombre, veces, tiempos[0], percentil(tiempos[1:], 0.5), percentil(tiempos[1:], 0.99),
+                           errores))
+    salida.put(resultados)
+
+
+def main():
+    args = [a for i, a in enumerate(sys.argv[1:], 1)
+            if not a.startswith("--") and not sys.argv[i - 1].startswith("--")]
+    tamanos = [int(x) for x in args[0].split(",")] if args else [1000, 100000]
+    repeticiones = int(sys.argv[sys.argv.index("--repeticiones") + 1]) if "--repeticiones" in sys.argv else 200
+    solo = sys.argv[sys.argv.index("--solo") + 1] if "--solo" in sys.argv else ""
+    contexto = multiprocessing.get_context("fork")
+    for filas in tamanos:
+        salida = contexto.Queue()
+        p = contexto.Process(target=medir, args=(filas, repeticiones, solo, salida))
+        p.start()
+        resultados = salida.get()
+        p.join()
+        print(f"\n{filas} citas")
+        print(f"  {'ruta':<26}{'n':>6}{'primera':>12}{'p50':>11}{'p99':>11}{'errores':>9}")
+        for nombre, veces, primera, p50, p99, errores in resultados:
+            print(f"  {nombre:<26}{veces:>6}{primera:>10.2f}ms{p50:>9.2f}ms{p99:>9.2f}ms{errores:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Compara el buscador del panel: recorrido lineal contra el índice invertido.
+
+Uso: python bench/search_index.py [filas,filas,...]   (por defecto 10000,100000,1000000)
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from store import CAMPOS, AppointmentStore  # noqa: E402
+
+NOMBRES = ["John", "Jane", "Maria", "Carlos", "Ana", "Luis", "Emily", "Robert", "Sofia", "David"]
+APELLIDOS = ["Doe", "Smith", "Garcia", "Lopez", "Brown", "Martinez", "Johnson", "Perez"]
+SERVICIOS = ["Landscaping", "Tree Removal", "Fence Installation", "Lawn Mowing", "Irrigation"]
+CALLES = ["Main St", "Oak Ave", "Pine Rd", "Cedar Ln", "Elm St"]
+CONSULTAS = ["smith", "tree removal", "2025-06", "oak", "garcia fence", "zzz"]
+
+
+def generar(path, filas):
+    rnd = random.Random(filas)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(filas):
+            nombre = f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)} {i}"
+            f.write("|".join([
+                nombre, rnd.choice(SERVICIOS), f"2025-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+                f"{rnd.randint(1, 9999)} {rnd.choice(CALLES)}", f"cliente{i}@example.com", "",
+            ]) + "\n")
+
+
+def recorrido(citas, consulta):
+    # Lo que hacía admin_panel antes del índice
+    return [c for c in citas if any(consulta in c[k].lower() for k in CAMPOS)]
+
+
+def medir(funcion, repeticiones=5):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        resultado = funcion()
+    return (time.perf_counter() - inicio) / repeticiones * 1000, len(resultado)
+
+
+def main():
+    tamanos = [int(x) for x in sys.argv[1].split(",")] if len(sys.argv) > 1 else [10000, 100000, 1000000]
+    for filas in tamanos:
+        path = os.path.join(tempfile.mkdtemp(), "citas_clientes.txt")
+        generar(path, filas)
+        store = AppointmentStore(path)
+        citas = store.all()
+        inicio = time.perf_counter()
+        store.search("x")
+        construccion = (time.perf_counter() - inicio) * 1000
+        print(f"\n{filas} filas (índice construido en {construccion:.0f} ms)")
+        print(f"  {'consulta':<16}{'resultados':>11}{'recorrido ms':>14}{'índice ms':>12}")
+        for consulta in CONSULTAS:
+            ms_recorrido, _ = medir(lambda: recorrido(citas, consulta))
+            ms_indice, n = medir(lambda: store.search(consulta))
+            print(f"  {consulta:<16}{n:>11}{ms_recorrido:>14.2f}{ms_indice:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
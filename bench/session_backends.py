@@ -0,0 +1,71 @@
+"""Coste de la sesión en las peticiones del panel, según SESSION_BACKEND.
+
+Uso: python bench/session_backends.py [peticiones]   (por defecto 1000)
+
+Cada variante corre en un proceso hijo, con las variables de entorno puestas
+antes de importar app y con una copia temporal de los datos. Se mide
+GET /api/appointments?limit=10 con un administrador conectado y se muestra
+también el tamaño de la cookie que el navegador reenvía en cada petición.
+"""
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VARIANTES = [
+    ("cookie firmada", {"SESSION_BACKEND": "cookie"}),
+    ("sqlite sin caché", {"SESSION_BACKEND": "sqlite", "SESSION_CACHE_SECONDS": "0"}),
+    ("sqlite con caché", {"SESSION_BACKEND": "sqlite", "SESSION_CACHE_SECONDS": "2"}),
+]
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def medir(entorno, peticiones, salida):
+    directorio = tempfile.mkdtemp()
+    for archivo in ("citas_clientes.txt", "mensajes_clientes.txt", "admins.txt"):
+        if os.path.exists(os.path.join(RAIZ, archivo)):
+            shutil.copy(os.path.join(RAIZ, archivo), directorio)
+    os.chdir(directorio)
+    os.environ.update(entorno, RENDER="true")
+    sys.path.insert(0, RAIZ)
+    import app as aplicacion
+    c = aplicacion.app.test_client()
+    with c.session_transaction() as s:
+        s["admin_user"] = "admin"
+        # Lo que deja el panel en la sesión: el token CSRF y algún aviso
+        s["csrf_token"] = "x" * 40
+        s["notif"] = "Appointment updated"
+    cookie = c.get_cookie("session").value
+    for _ in range(20):
+        c.get("/api/appointments?limit=10")
+    tiempos = []
+    for _ in range(peticiones):
+        inicio = time.perf_counter()
+        r = c.get("/api/appointments?limit=10")
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        assert r.status_code == 200, r.status_code
+    salida.put((len(cookie), tiempos))
+
+
+def main():
+    peticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    contexto = multiprocessing.get_context("fork")
+    print(f"{'sesión':<20}{'cookie':>9}{'p50':>10}{'p99':>10}")
+    for etiqueta, entorno in VARIANTES:
+        salida = contexto.Queue()
+        p = contexto.Process(target=medir, args=(entorno, peticiones, salida))
+        p.start()
+        tamano, tiempos = salida.get()
+        p.join()
+        print(f"{etiqueta:<20}{tamano:>7} B{percentil(tiempos, 0.5):>8.3f}ms{percentil(tiempos, 0.99):>8.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Simulador de llamadas de Twilio para probar la toma de citas por voz.
+
+Uso:
+  python bench/simulate_calls.py [llamadas] [concurrentes]        (en proceso, datos temporales)
+  python bench/simulate_calls.py 200 20 --url http://127.0.0.1:5000
+
+Cada llamada hace lo mismo que Twilio: POST a /voice y luego un POST por
+respuesta (nombre, servicio, fecha y dirección) a /gather_name o /gather_es,
+con su CallSid. Al final se muestran las latencias por webhook (p50/p99/máx)
+y, en modo en proceso, cuántas citas llegaron al archivo a través de la cola
+de trabajos.
+Contra un servidor real por http hay que arrancarlo con RENDER=true (si no,
+enforce_https responde 403). Las peticiones van firmadas como las de Twilio
+con TWILIO_AUTH_TOKEN (en proceso se usa un token de prueba); contra un
+servidor real hay que dar el mismo token que tiene el servidor.
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = os.environ.setdefault("TWILIO_AUTH_TOKEN", "bench-twilio-token")
+RESPUESTAS = {
+    "en": (["John Smith.", "Maria Lopez.", "Robert Brown."], ["Landscaping.", "Tree removal.", "Fence installation."],
+           ["Next Monday.", "June 3rd.", "Tomorrow."], ["123 Main Street, San Antonio.", "456 Oak Avenue."]),
+    "es": (["Carlos García.", "Ana Pérez."], ["Jardinería.", "Remoción de árboles."],
+           ["El próximo lunes.", "3 de junio."], ["Calle Principal 123, San Antonio."]),
+}
+
+
+def firma(url, datos):
+    """Cabecera X-Twilio-Signature de un POST a ``url``."""
+    from twilio.request_validator import RequestValidator
+    return {"X-Twilio-Signature": RequestValidator(TOKEN).compute_signature(url, datos)}
+
+
+def cliente_local():
+    """Cliente de prueba de Flask sobre una copia temporal de los datos."""
+    directorio = tempfile.mkdtemp()
+    for archivo in ("citas_clientes.txt", "mensajes_clientes.txt", "admins.txt", "encoded_logo.txt"):
+        if os.path.exists(os.path.join(RAIZ, archivo)):
+            shutil.copy(os.path.join(RAIZ, archivo), directorio)
+    os.chdir(directorio)
+    sys.path.insert(0, RAIZ)
+    import app as aplicacion
+    aplicacion.app.config["WTF_CSRF_ENABLED"] = False
+
+    def post(ruta, datos):
+        with aplicacion.app.test_client() as c:
+            r = c.post(ruta, data=datos, base_url="https://localhost", headers=firma("https://localhost" + ruta, datos))
+            return r.status_code, r.data
+    return post, aplicacion
+
+
+def cliente_http(base):
+    def post(ruta, datos):
+        peticion = urllib.request.Request(base + ruta, data=urllib.parse.urlencode(datos).encode(),
+                                          headers=firma(base + ruta, datos))
+        with urllib.request.urlopen(peticion, timeout=15) as r:
+            return r.status, r.read()
+    return post
+
+
+def llamada(post, latencias, errores, rnd):
+    lengua = rnd.choice(["en", "en", "es"])
+    sid = "CA" + uuid.uuid4().hex
+    base = {"CallSid": sid, "From": f"+1210555{rnd.randint(1000, 9999)}"}
+    pasos = [("/voice", {})]
+    ruta = "/gather_name" if lengua == "en" else "/gather_es"
+    if lengua == "es":
+        pasos.append(("/voice_es", {}))
+    for opciones in RESPUESTAS[lengua]:
+        pasos.append((ruta, {"SpeechResult": rnd.choice(opciones)}))
+    for ruta_paso, datos in pasos:
+        inicio = time.perf_counter()
+        try:
+            estado, cuerpo = post(ruta_paso, dict(base, **datos))
+            if estado != 200 or b"<Response>" not in cuerpo:
+                errores.append((ruta_paso, estado))
+        except Exception as e:
+            errores.append((ruta_paso, str(e)))
+        latencias.setdefault(ruta_paso, []).append((time.perf_counter() - inicio) * 1000)
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    total = int(args[0]) if args else 100
+    concurrentes = int(args[1]) if len(args) > 1 else 10
+    aplicacion = None
+    if "--url" in sys.argv:
+        post = cliente_http(sys.argv[sys.argv.index("--url") + 1].rstrip("/"))
+    else:
+        post, aplicacion = cliente_local()
+        antes = len(aplicacion.citas_store)
+    latencias, errores = {}, []
+    restantes = iter(range(total))
+    mutex = threading.Lock()
+
+    def trabajador(semilla):
+        rnd = random.Random(semilla)
+        while True:
+            with mutex:
+                if next(restantes, None) is None:
+                    return
+            llamada(post, latencias, errores, rnd)
+
+    inicio = time.perf_counter()
+    hilos = [threading.Thread(target=trabajador, args=(i,)) for i in range(concurrentes)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    segundos = time.perf_counter() - inicio
+    print(f"{total} llamadas, {concurrentes} concurrentes, {segundos:.1f} s, {len(errores)} errores")
+    print(f"  {'webhook':<16}{'n':>7}{'p50':>10}{'p99':>10}{'máx':>10}")
+    for ruta, valores in sorted(latencias.items()):
+        print(f"  {ruta:<16}{len(valores):>7}{percentil(valores, 0.5):>8.1f}ms"
+              f"{percentil(valores, 0.99):>8.1f}ms{max(valores):>8.1f}ms")
+    if errores:
+        print("  primeros errores:", errores[:5])
+    if aplicacion is not None:
+        # Las citas las escribe la cola de trabajos: esperar a que se vacíe
+        limite = time.time() + 30
+        while any(aplicacion.job_queue.stats().get(e) for e in ("pendiente", "en_curso")) and time.time() < limite:
+            time.sleep(0.05)
+        time.sleep(0.2)
+        print(f"  citas nuevas en el archivo: {len(aplicacion.citas_store) - antes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Prueba de carga: N procesos escriben a la vez en el mismo diario de citas.
+
+Uso: python bench/stress_writers.py [procesos] [citas_por_proceso]
+
+Cada proceso agrega citas, edita y borra algunas de las suyas y compacta el
+diario cada 50 citas. Al final se comprueba que todos los procesos terminaron
+bien y que no se perdió ni duplicó ningún registro.
+"""
+import os
+import sys
+import tempfile
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from store import AppointmentStore  # noqa: E402
+
+
+def escritor(path, n, por_proceso):
+    store = AppointmentStore(path)
+    ids = []
+    for i in range(por_proceso):
+        ids.append(store.add([f"W{n}-{i}", "Landscaping", "2025-06-01", "1 Main St", "w@example.com", ""]))
+        if i % 5 == 4:
+            store.update(ids[-2], [f"W{n}-{i - 1}", "Fence Installation", "2025-06-02", "1 Main St", "w@example.com", "edit"])
+        if i % 7 == 6:
+            store.delete(ids.pop(0))
+        if i % 50 == 49:
+            store.compact()
+
+
+def hijo(path, n, por_proceso):
+    # Ninguna excepción puede volver al bucle de fork del padre
+    codigo = 1
+    try:
+        escritor(path, n, por_proceso)
+        codigo = 0
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(codigo)
+
+
+def main():
+    procesos = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    por_proceso = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    path = os.path.join(tempfile.mkdtemp(), "citas_clientes.txt")
+    hijos = []
+    for n in range(procesos):
+        pid = os.fork()
+        if pid == 0:
+            hijo(path, n, por_proceso)
+        hijos.append(pid)
+    fallidos = 0
+    for pid in hijos:
+        _, estado = os.waitpid(pid, 0)
+        fallidos += os.waitstatus_to_exitcode(estado) != 0
+
+    borradas = por_proceso // 7
+    esperado = {f"W{n}-{i}" for n in range(procesos) for i in range(por_proceso)}
+    nombres = [c["name"] for c in AppointmentStore(path).all()]
+    faltan = len(esperado) - len(set(nombres)) - borradas * procesos
+    print(f"{procesos} procesos x {por_proceso} citas: {len(nombres)} vigentes, "
+          f"{len(nombres) - len(set(nombres))} duplicadas, {faltan} perdidas, {fallidos} procesos con error")
+    sys.exit(1 if fallidos or faltan or len(nombres) != len(set(nombres)) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Coste por petición de pintar el panel, el login y el formulario de edición.
+
+Uso: python bench/templates.py [repeticiones]   (por defecto 500)
+
+"antes" es lo que hacían las rutas con render_template_string: el texto de la
+plantilla se compila en cada llamada. "ahora" es render_template con la
+plantilla ya compilada en la caché del entorno. También mide cuánto tarda un
+worker nuevo en compilarlas, con y sin la caché de bytecode en disco.
+"""
+import os
+import sys
+import tempfile
+import time
+
+from flask import Flask, render_template, render_template_string
+from jinja2 import FileSystemBytecodeCache
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLANTILLAS = os.path.join(RAIZ, "templates")
+
+CITA = {"id": "a1b2c3d4e5f6", "name": "John Smith", "service": "Landscaping", "date": "2025-06-01",
+        "address": "123 Main St", "email": "john@example.com", "message": "Front yard"}
+CONTEXTOS = {
+    "login.html": {"error": "Invalid credentials. Please try again.", "csrf_token": "x" * 40},
+    "admin.html": {"user": "admin", "citas": [dict(CITA, id=str(i)) for i in range(10)],
+                   "mensajes": [{"name": "Ana", "text": "Call me back"}] * 20, "total": 1000, "page": 3,
+                   "total_pages": 100, "paginas": [1, None, 2, 3, 4, 5, None, 100],
+                   "servicios_unicos": ["Landscaping", "Tree Removal", "Fence Installation"], "notif": ""},
+    "edit_appointment.html": {"cita": CITA},
+}
+
+
+def nueva_app(bytecode=None):
+    app = Flask(__name__, template_folder=PLANTILLAS)
+    if bytecode:
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(bytecode)
+    return app
+
+
+def por_peticion(repeticiones):
+    app = nueva_app()
+    print(f"{'plantilla':<24}{'antes':>12}{'ahora':>12}")
+    for nombre, contexto in CONTEXTOS.items():
+        with open(os.path.join(PLANTILLAS, nombre), encoding="utf-8") as f:
+            fuente = f.read()
+        with app.test_request_context("/admin?search=smith"):
+            render_template(nombre, **contexto)
+            inicio = time.perf_counter()
+            for _ in range(repeticiones):
+                render_template_string(fuente, **contexto)
+            antes = (time.perf_counter() - inicio) / repeticiones
+            inicio = time.perf_counter()
+            for _ in range(repeticiones):
+                render_template(nombre, **contexto)
+            ahora = (time.perf_counter() - inicio) / repeticiones
+        print(f"{nombre:<24}{antes * 1000:>9.3f} ms{ahora * 1000:>9.3f} ms")
+
+
+def arranque():
+    directorio = tempfile.mkdtemp()
+    print(f"\n{'arranque de un worker':<24}{'tiempo':>12}")
+    for etiqueta, bytecode in (("sin bytecode", None), ("bytecode (frío)", directorio),
+                               ("bytecode (caliente)", directorio)):
+        app = nueva_app(bytecode)
+        inicio = time.perf_counter()
+        for nombre in CONTEXTOS:
+            app.jinja_env.get_template(nombre)
+        print(f"{etiqueta:<24}{(time.perf_counter() - inicio) * 1000:>9.3f} ms")
+
+
+def main():
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    por_peticion(repeticiones)
+    arranque()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""Estructura las respuestas de una llamada (servicio y fecha) para la cita.
+
+Lo que dice el cliente llega tal cual ("Tree removal please.", "el próximo
+lunes"). Aquí se convierte en un servicio del catálogo y una fecha ISO:
+
+* ``reglas`` es un analizador local, en inglés y español, de fechas ("tomorrow",
+  "June 3rd", "3 de junio", "el lunes", "2025-06-03", "6/3") y servicios.
+* ``Extractor`` junta las llamadas pendientes y, si hay ``OPENAI_API_KEY``,
+  las manda al modelo en una sola petición de hasta ``EXTRACTION_BATCH_SIZE``
+  transcripciones. Los resultados se guardan por hash de la transcripción
+  normalizada, así que una transcripción repetida no vuelve al modelo.
+  Si el modelo falla se usan las reglas.
+
+La petición al modelo va por urllib a ``OPENAI_BASE_URL`` (por defecto la API
+de OpenAI). Para probar sin red, bench/fake_llm.py hace de modelo.
+"""
+import datetime
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+import urllib.request
+
+from kvstore import Conexiones
+
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+BATCH_SIZE = int(os.getenv("EXTRACTION_BATCH_SIZE", "20"))
+BATCH_WINDOW = float(os.getenv("EXTRACTION_BATCH_WINDOW", "2"))
+TIMEOUT = 30
+# Segundos que un lote tiene reservadas sus transcripciones. Menos que la
+# reserva de jobs.py: cuando la cola reintenta un trabajo cuyo trabajador murió,
+# las transcripciones ya están libres.
+RESERVA = 240
+CAMPOS = ("name", "service", "date", "address")
+
+# Servicio del catálogo -> frases que lo identifican (sin acentos, minúsculas).
+# El orden importa: se elige el primero que aparece en la frase.
+SERVICIOS = {
+    "Tree Removal": ("tree removal", "remove a tree", "remove the tree", "tree remival", "cut down",
+                     "remocion de arbol", "quitar un arbol", "quitar el arbol", "cortar un arbol",
+                     "cortar el arbol", "talar", "tala de arbol"),
+    "Fence Installation": ("fence", "cerca", "valla", "cerco"),
+    "Lawn Mowing": ("mow", "lawn", "grass", "cesped", "pasto", "zacate", "podar el"),
+    "Landscaping": ("landscap", "garden", "yard", "jardin", "paisaj"),
+}
+
+MESES = {
+    "january": 1, "jan": 1, "february": 2, "feb": 2, "march": 3, "mar": 3, "april": 4, "apr": 4,
+    "may": 5, "june": 6, "jun": 6, "july": 7, "jul": 7, "august": 8, "aug": 8, "september": 9,
+    "sept": 9, "sep": 9, "october": 10, "oct": 10, "november": 11, "nov": 11, "december": 12, "dec": 12,
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6, "julio": 7,
+    "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12,
+}
+DIAS = {
+    "monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3, "friday": 4, "saturday": 5, "sunday": 6,
+    "lunes": 0, "martes": 1, "miercoles": 2, "jueves": 3, "viernes": 4, "sabado": 5, "domingo": 6,
+}
+RELATIVAS = {"today": 0, "hoy": 0, "tomorrow": 1, "manana": 1, "day after tomorrow": 2, "pasado manana": 2}
+
+_MES = "|".join(sorted(MESES, key=len, reverse=True))
+_ISO = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+_BARRAS = re.compile(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b")
+_MES_DIA = re.compile(rf"\b({_MES})\.? (?:the )?(\d{{1,2}})(?:st|nd|rd|th)?\b(?:,? (\d{{4}}))?")
+_DIA_MES = re.compile(rf"\b(\d{{1,2}})(?:st|nd|rd|th)? (?:of |de )?({_MES})\b(?:,? (?:de |del )?(\d{{4}}))?")
+
+
+def normalizar(texto):
+    """Minúsculas, sin acentos ni puntuación y con espacios simples."""
+    texto = unicodedata.normalize("NFKD", str(texto or "").lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w/\-]+", " ", texto).split())
+
+
+def servicio(texto):
+    texto = normalizar(texto)
+    for nombre, frases in SERVICIOS.items():
+        if any(frase in texto for frase in frases):
+            return nombre
+    return None
+
+
+def _fecha(anio, mes, dia, referencia):
+    try:
+        fecha = datetime.date(anio or referencia.year, mes, dia)
+    except ValueError:
+        return None
+    # Sin año, una fecha ya pasada se entiende como la del año que viene
+    if anio is None and fecha < referencia:
+        fecha = fecha.replace(year=fecha.year + 1)
+    return fecha
+
+
+def es_relativa(texto):
+    """True si la fecha depende del día en que se dijo ("mañana", "el lunes")."""
+    texto = normalizar(texto)
+    return any(re.search(rf"\b{p}\b", texto) for p in list(RELATIVAS) + list(DIAS))
+
+
+def fecha(texto, lengua="en", referencia=None):
+    """Fecha ISO de una frase, o None si no se reconoce."""
+    referencia = referencia or datetime.date.today()
+    texto = normalizar(texto)
+    m = _ISO.search(texto)
+    if m:
+        encontrada = _fecha(int(m.group(1)), int(m.group(2)), int(m.group(3)), referencia)
+        return encontrada and encontrada.isoformat()
+    m = _MES_DIA.search(texto)
+    if m:
+        encontrada = _fecha(m.group(3) and int(m.group(3)), MESES[m.group(1)], int(m.group(2)), referencia)
+        return encontrada and encontrada.isoformat()
+    m = _DIA_MES.search(texto)
+    if m:
+        encontrada = _fecha(m.group(3) and int(m.group(3)), MESES[m.group(2)], int(m.group(1)), referencia)
+        return encontrada and encontrada.isoformat()
+    m = _BARRAS.search(texto)
+    if m:
+        a, b = int(m.group(1)), int(m.group(2))
+        mes, dia = (b, a) if lengua == "es" else (a, b)
+        anio = m.group(3) and int(m.group(3))
+        if anio is not None and anio < 100:
+            anio += 2000
+        encontrada = _fecha(anio, mes, dia, referencia)
+        return encontrada and encontrada.isoformat()
+    for frase in sorted(RELATIVAS, key=len, reverse=True):
+        if re.search(rf"\b{frase}\b", texto):
+            return (referencia + datetime.timedelta(days=RELATIVAS[frase])).isoformat()
+    for nombre, dia in DIAS.items():
+        if re.search(rf"\b{nombre}\b", texto):
+            # "el lunes" / "next Monday": el próximo, nunca hoy
+            dias = (dia - referencia.weekday()) % 7 or 7
+            return (referencia + datetime.timedelta(days=dias)).isoformat()
+    return None
+
+
+def reglas(respuestas, lengua="en", referencia=None):
+    """Campos de la cita a partir de las respuestas, solo con el analizador local."""
+    return {
+        "name": respuestas.get("name", ""),
+        "service": servicio(respuestas.get("service", "")),
+        "date": fecha(respuestas.get("date", ""), lengua, referencia),
+        "address": respuestas.get("address", ""),
+    }
+
+
+def transcripcion(respuestas):
+    return "\n".join(f"{campo}: {respuestas.get(campo, '')}" for campo in CAMPOS)
+
+
+def clave(respuestas, referencia):
+    """Hash de la transcripción normalizada; con el día si la fecha es relativa."""
+    texto = normalizar(transcripcion(respuestas))
+    if es_relativa(respuestas.get("date", "")):
+        texto += f"\n@{referencia.isoformat()}"
+    return hashlib.sha256(texto.encode()).hexdigest()
+
+
+# --- Modelo ---
+INSTRUCCIONES = (
+    "You structure phone-call answers for Genesis SA Services LLC appointments. Each item has the "
+    "caller's answers (name, service, date, address) in English or Spanish and the date of the call. "
+    "Return JSON {\"results\": [{\"id\", \"name\", \"service\", \"date\", \"address\"}]} with one result "
+    "per item: service must be one of " + ", ".join(SERVICIOS) + " or null, date must be YYYY-MM-DD "
+    "(resolving relative dates against the call date) or null, name and address cleaned up as written text."
+)
+
+
+def llm_lote(items, api_key=None):
+    """Una petición al modelo para varios ``{"id", "respuestas", "lengua", "referencia"}``.
+
+    Devuelve {id: campos}. Lanza excepción si la petición falla.
+    """
+    contenido = [{"id": it["id"], "language": it["lengua"], "call_date": it["referencia"],
+                  **{campo: it["respuestas"].get(campo, "") for campo in CAMPOS}} for it in items]
+    cuerpo = {
+        "model": OPENAI_MODEL,
+        "temperature": 0,
+        "response_format": {"type": "json_object"},
+        "messages": [{"role": "system", "content": INSTRUCCIONES},
+                     {"role": "user", "content": json.dumps({"items": contenido}, ensure_ascii=False)}],
+    }
+    peticion = urllib.request.Request(
+        f"{OPENAI_BASE_URL}/chat/completions", data=json.dumps(cuerpo).encode(),
+        headers={"Content-Type": "application/json",
+                 "Authorization": f"Bearer {api_key or os.getenv('OPENAI_API_KEY', '')}"})
+    with urllib.request.urlopen(peticion, timeout=TIMEOUT) as r:
+        respuesta = json.load(r)
+    resultados = json.loads(respuesta["choices"][0]["message"]["content"])["results"]
+    return {str(res.get("id")): _validar(res) for res in resultados if isinstance(res, dict)}
+
+
+def _validar(resultado):
+    """Solo servicios del catálogo y fechas ISO válidas; lo demás queda en None."""
+    campos = {campo: resultado.get(campo) or None for campo in CAMPOS}
+    if campos["service"] not in SERVICIOS:
+        campos["service"] = None
+    try:
+        campos["date"] = datetime.date.fromisoformat(str(campos["date"])).isoformat()
+    except ValueError:
+        campos["date"] = None
+    return campos
+
+
+class Extractor:
+    """Transcripciones pendientes y caché de resultados del modelo, en sqlite."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conexion = Conexiones(path, [
+            "CREATE TABLE IF NOT EXISTS cache (clave TEXT PRIMARY KEY, valor TEXT NOT NULL, creado REAL)",
+            "CREATE TABLE IF NOT EXISTS pendientes (id TEXT PRIMARY KEY, datos TEXT NOT NULL, creado REAL, "
+            "reservado REAL)"],
+            timeout=30, columnas=["ALTER TABLE pendientes ADD COLUMN reservado REAL"])
+
+    def cached(self, clave_cache):
+        fila = self._conexion().execute("SELECT valor FROM cache WHERE clave = ?", (clave_cache,)).fetchone()
+        return json.loads(fila[0]) if fila else None
+
+    def remember(self, clave_cache, campos):
+        self._conexion().execute("INSERT OR REPLACE INTO cache (clave, valor, creado) VALUES (?, ?, ?)",
+                                 (clave_cache, json.dumps(campos, ensure_ascii=False), time.time()))
+
+    def submit(self, rid, respuestas, lengua, referencia):
+        """Deja una transcripción pendiente para el próximo lote."""
+        datos = {"id": rid, "respuestas": respuestas, "lengua": lengua, "referencia": referencia.isoformat()}
+        self._conexion().execute("INSERT OR REPLACE INTO pendientes (id, datos, creado) VALUES (?, ?, ?)",
+                                 (rid, json.dumps(datos, ensure_ascii=False), time.time()))
+
+    def take(self, limite=BATCH_SIZE):
+        """Reserva hasta ``limite`` transcripciones pendientes (las más antiguas).
+
+        No se borran hasta ``done``: si el trabajador muere, pasados ``RESERVA``
+        segundos las recoge el siguiente lote (o el reintento del trabajo).
+        """
+        con = self._conexion()
+        ahora = time.time()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            filas = con.execute("SELECT id, datos FROM pendientes WHERE reservado IS NULL OR reservado < ? "
+                                "ORDER BY creado LIMIT ?", (ahora - RESERVA, limite)).fetchall()
+            con.executemany("UPDATE pendientes SET reservado = ? WHERE id = ?", [(ahora, f[0]) for f in filas])
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        return [json.loads(f[1]) for f in filas]
+
+    def done(self, rid):
+        """Borra una transcripción ya aplicada."""
+        self._conexion().execute("DELETE FROM pendientes WHERE id = ?", (rid,))
+
+    def release(self, ids):
+        """Devuelve transcripciones reservadas a la cola (para el próximo intento)."""
+        self._conexion().executemany("UPDATE pendientes SET reservado = NULL WHERE id = ?", [(i,) for i in ids])
+
+    def pending(self):
+        return self._conexion().execute("SELECT COUNT(*) FROM pendientes").fetchone()[0]
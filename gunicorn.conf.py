@@ -0,0 +1,25 @@
+# Configuración de gunicorn (se carga sola al ejecutar "gunicorn app:app" desde aquí)
+#
+# Workers con hilos: una descarga del panel o un PDF grande ya no deja sin
+# worker a los webhooks de Twilio, que deben responder en pocos cientos de ms.
+# El puerto lo toma gunicorn de $PORT (Render lo define).
+import os
+
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 20
+keepalive = 5
+# Reciclar workers de vez en cuando por si algo crece en memoria
+max_requests = 2000
+max_requests_jitter = 200
+accesslog = "-"
+errorlog = "-"
+
+
+def post_worker_init(worker):
+    # Precalentar y arrancar los hilos de trabajos en cada worker, ya después
+    # del fork (importar app no lo hace)
+    import app
+    app.arrancar()
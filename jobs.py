@@ -0,0 +1,177 @@
+"""Cola de trabajos persistente (sqlite) para lo que no debe ir en una petición.
+
+Los webhooks de Twilio y los formularios del panel solo encolan. El trabajo
+(guardar la cita de una llamada, enviar un correo, llamar al modelo) lo hacen
+hilos trabajadores dentro de cada worker de gunicorn. También se pueden usar
+procesos aparte::
+
+    python jobs.py [procesos]
+
+Cada trabajo tiene un tipo, datos JSON y, opcionalmente, una clave de
+idempotencia: encolar dos veces la misma clave no crea un segundo trabajo.
+Si el manejador lanza una excepción, el trabajo se reintenta con espera
+exponencial (``JOBS_BACKOFF_SECONDS`` * 2^intento, hasta una hora). Tras
+``JOBS_MAX_ATTEMPTS`` intentos queda como fallido. Un trabajo en curso cuyo
+trabajador murió se vuelve a repartir cuando vence su reserva.
+"""
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+
+from kvstore import Conexiones
+
+MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "8"))
+BACKOFF_SECONDS = float(os.getenv("JOBS_BACKOFF_SECONDS", "5"))
+MAX_BACKOFF = 3600
+RESERVA = 300               # segundos antes de dar por muerto a un trabajador
+RETENCION = 7 * 24 * 3600   # los hechos se guardan una semana (mantienen la clave)
+
+# tipo -> función(datos). Los módulos registran sus manejadores con @handler
+HANDLERS = {}
+
+
+def handler(tipo):
+    def registrar(funcion):
+        HANDLERS[tipo] = funcion
+        return funcion
+    return registrar
+
+
+def espera(intento):
+    """Segundos antes del reintento número ``intento`` (1, 2, ...), con algo de azar."""
+    return min(BACKOFF_SECONDS * 2 ** (intento - 1), MAX_BACKOFF) * random.uniform(0.9, 1.1)
+
+
+class JobQueue:
+    def __init__(self, path):
+        self.path = path
+        self._conexion = Conexiones(path, [
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tipo TEXT NOT NULL,
+                clave TEXT UNIQUE,
+                datos TEXT NOT NULL,
+                estado TEXT NOT NULL DEFAULT 'pendiente',
+                intentos INTEGER NOT NULL DEFAULT 0,
+                proximo REAL NOT NULL,
+                reservado_hasta REAL,
+                error TEXT,
+                creado REAL NOT NULL,
+                terminado REAL)""",
+            "CREATE INDEX IF NOT EXISTS jobs_listos ON jobs (estado, proximo)"], timeout=30)
+        self._despertar = threading.Event()
+        self._hilos = []
+        self._pid = None
+        self._mutex = threading.Lock()
+
+    def enqueue(self, tipo, datos, clave=None, retraso=0):
+        """Encola un trabajo. Devuelve su id, o None si ``clave`` ya estaba en la cola."""
+        ahora = time.time()
+        cur = self._conexion().execute(
+            "INSERT OR IGNORE INTO jobs (tipo, clave, datos, proximo, creado) VALUES (?, ?, ?, ?, ?)",
+            (tipo, clave, json.dumps(datos, ensure_ascii=False), ahora + retraso, ahora))
+        if not cur.rowcount:
+            return None
+        self._despertar.set()
+        return cur.lastrowid
+
+    def _reservar(self):
+        con = self._conexion()
+        ahora = time.time()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            fila = con.execute(
+                "SELECT id, tipo, datos, intentos FROM jobs WHERE "
+                "(estado = 'pendiente' AND proximo <= ?) OR (estado = 'en_curso' AND reservado_hasta < ?) "
+                "ORDER BY proximo LIMIT 1", (ahora, ahora)).fetchone()
+            if fila:
+                con.execute("UPDATE jobs SET estado = 'en_curso', intentos = intentos + 1, reservado_hasta = ? "
+                            "WHERE id = ?", (ahora + RESERVA, fila[0]))
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        return fila and (fila[0], fila[1], json.loads(fila[2]), fila[3] + 1)
+
+    def run_one(self):
+        """Ejecuta un trabajo listo, si lo hay. Devuelve False si no había ninguno."""
+        trabajo = self._reservar()
+        if not trabajo:
+            return False
+        jid, tipo, datos, intento = trabajo
+        con = self._conexion()
+        try:
+            funcion = HANDLERS.get(tipo)
+            if funcion is None:
+                raise LookupError(f"No hay manejador para el tipo {tipo!r}")
+            funcion(datos)
+        except Exception as e:
+            if intento >= MAX_ATTEMPTS:
+                print(f"[JOBS] Trabajo {jid} ({tipo}) fallido tras {intento} intentos: {e}")
+                con.execute("UPDATE jobs SET estado = 'fallido', error = ?, terminado = ? WHERE id = ?",
+                            (str(e), time.time(), jid))
+            else:
+                retraso = espera(intento)
+                print(f"[JOBS] Trabajo {jid} ({tipo}) falló (intento {intento}), reintento en {retraso:.0f} s: {e}")
+                con.execute("UPDATE jobs SET estado = 'pendiente', error = ?, proximo = ? WHERE id = ?",
+                            (str(e), time.time() + retraso, jid))
+            return True
+        con.execute("UPDATE jobs SET estado = 'hecho', error = NULL, terminado = ? WHERE id = ?", (time.time(), jid))
+        return True
+
+    def purge(self):
+        self._conexion().execute("DELETE FROM jobs WHERE estado IN ('hecho', 'fallido') AND terminado < ?",
+                                 (time.time() - RETENCION,))
+
+    def stats(self):
+        """{estado: número de trabajos}."""
+        return dict(self._conexion().execute("SELECT estado, COUNT(*) FROM jobs GROUP BY estado").fetchall())
+
+    def work(self, parar=None, intervalo=1.0):
+        """Bucle de un trabajador: ejecuta trabajos hasta que ``parar`` (Event) se active."""
+        vueltas = 0
+        while parar is None or not parar.is_set():
+            try:
+                if self.run_one():
+                    continue
+                vueltas += 1
+                if vueltas % 3600 == 0:
+                    self.purge()
+            except sqlite3.Error as e:
+                print(f"[JOBS] Error de la cola: {e}")
+            self._despertar.wait(intervalo)
+            self._despertar.clear()
+
+    def start(self, hilos=1):
+        """Arranca ``hilos`` trabajadores en este proceso (una vez por proceso)."""
+        with self._mutex:
+            # Tras un fork los hilos del proceso padre no existen en el hijo
+            if self._pid == os.getpid() and all(h.is_alive() for h in self._hilos):
+                return
+            self._hilos = [threading.Thread(target=self.work, daemon=True, name=f"jobs-{i}")
+                           for i in range(hilos)]
+            self._pid = os.getpid()
+            for h in self._hilos:
+                h.start()
+
+
+def main():
+    """Trabajadores en procesos aparte; importar app registra los manejadores."""
+    import multiprocessing
+    procesos = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app
+    hijos = [multiprocessing.Process(target=app.job_queue.work) for _ in range(procesos)]
+    for p in hijos:
+        p.start()
+    print(f"[JOBS] {procesos} trabajador(es) en marcha sobre {app.job_queue.path}")
+    for p in hijos:
+        p.join()
+
+
+if __name__ == "__main__":
+    main()
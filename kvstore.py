@@ -0,0 +1,78 @@
+"""Almacén clave -> valor JSON sobre sqlite, con caducidad por clave.
+
+Pensado para estado corto compartido entre workers (por ejemplo, el punto en
+que va cada llamada). La base de datos va en modo WAL, así que las lecturas
+no esperan a las escrituras. Cada hilo usa su propia conexión, y un proceso
+hijo tras un fork abre conexiones nuevas; ``Conexiones`` hace eso mismo para
+las demás bases sqlite de la aplicación (cola de trabajos, sesiones, correo...).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class Conexiones:
+    """``conexiones()`` devuelve la conexión del hilo actual a ``path``.
+
+    Se abre en modo autocommit (las transacciones se piden con ``BEGIN``), en
+    WAL y con ``synchronous=NORMAL``, y ejecuta las sentencias de ``esquema``
+    (``CREATE ... IF NOT EXISTS``) al abrirse. ``columnas`` son
+    ``ALTER TABLE ... ADD COLUMN`` para bases creadas con un esquema anterior; si
+    la columna ya existe no pasa nada. Tras un fork se abre otra conexión.
+    """
+
+    def __init__(self, path, esquema, timeout=10, columnas=()):
+        self.path = path
+        self.esquema = esquema
+        self.columnas = columnas
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def __call__(self):
+        con = getattr(self._local, "con", None)
+        if con is None or self._local.pid != os.getpid():
+            con = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            for sentencia in self.esquema:
+                con.execute(sentencia)
+            for sentencia in self.columnas:
+                try:
+                    con.execute(sentencia)
+                except sqlite3.OperationalError as e:
+                    if "duplicate column" not in str(e):
+                        raise
+            self._local.con, self._local.pid = con, os.getpid()
+        return con
+
+
+class KVStore:
+    def __init__(self, path, ttl=3600, tabla="kv"):
+        self.path = path
+        self.ttl = ttl
+        self.tabla = tabla
+        self._conexion = Conexiones(path, [f"CREATE TABLE IF NOT EXISTS {tabla} "
+                                           "(clave TEXT PRIMARY KEY, valor TEXT NOT NULL, caduca REAL NOT NULL)"])
+        self._escrituras = 0
+
+    def get(self, clave, defecto=None):
+        fila = self._conexion().execute(
+            f"SELECT valor FROM {self.tabla} WHERE clave = ? AND caduca > ?", (clave, time.time())).fetchone()
+        return json.loads(fila[0]) if fila else defecto
+
+    def set(self, clave, valor, ttl=None):
+        self._conexion().execute(
+            f"INSERT OR REPLACE INTO {self.tabla} (clave, valor, caduca) VALUES (?, ?, ?)",
+            (clave, json.dumps(valor, ensure_ascii=False), time.time() + (ttl or self.ttl)))
+        # De vez en cuando se borran las claves caducadas
+        self._escrituras += 1
+        if self._escrituras % 500 == 0:
+            self.purge()
+
+    def delete(self, clave):
+        self._conexion().execute(f"DELETE FROM {self.tabla} WHERE clave = ?", (clave,))
+
+    def purge(self):
+        self._conexion().execute(f"DELETE FROM {self.tabla} WHERE caduca <= ?", (time.time(),))
@@ -0,0 +1,198 @@
+"""Correos de aviso: conexión SMTP reutilizada, resúmenes agrupados y cuotas.
+
+* ``SMTPPool`` mantiene una conexión SMTP abierta por proceso. Antes de
+  reutilizarla tras un rato parado le manda un NOOP, y si el servidor la cerró
+  reconecta y reintenta una vez. Así no hay un saludo TLS más login por
+  correo.
+* ``Mailer`` apunta los avisos (citas nuevas, mensajes de voz) en sqlite. Un
+  trabajo de la cola los envía juntos en un solo correo cada
+  ``MAIL_DIGEST_INTERVAL`` segundos. Con 0 cada aviso sale en cuanto se
+  procesa.
+* Los envíos se cuentan en la misma base de datos, compartida por todos los
+  workers. Si se supera ``MAIL_RATE_PER_MINUTE`` o ``MAIL_DAILY_LIMIT`` (Gmail
+  admite unos 500 al día), ``send`` lanza ``RateLimited`` con los segundos que
+  hay que esperar.
+* Sin destinatario (``NOTIFY_EMAIL`` o ``GMAIL_USER``) ``send`` y ``send_digest``
+  lanzan ``SinDestinatario`` y los avisos se quedan pendientes hasta que lo haya.
+"""
+import os
+import threading
+import time
+
+from kvstore import Conexiones
+
+DIGEST_INTERVAL = float(os.getenv("MAIL_DIGEST_INTERVAL", "300"))
+RATE_PER_MINUTE = int(os.getenv("MAIL_RATE_PER_MINUTE", "20"))
+DAILY_LIMIT = int(os.getenv("MAIL_DAILY_LIMIT", "450"))
+MAX_AVISOS = 200            # avisos como máximo en un resumen
+
+
+class RateLimited(Exception):
+    def __init__(self, espera):
+        super().__init__(f"Cuota de correo agotada, esperar {espera:.0f} s")
+        self.espera = espera
+
+
+class SinDestinatario(Exception):
+    def __init__(self):
+        super().__init__("Sin destinatario configurado (NOTIFY_EMAIL o GMAIL_USER)")
+
+
+class SMTPPool:
+    def __init__(self, host, port, starttls=True, user="", password="", idle=30, timeout=20):
+        self.host, self.port, self.starttls = host, port, starttls
+        self.user, self.password = user, password
+        self.idle = idle
+        self.timeout = timeout
+        self._smtp = None
+        self._pid = None
+        self._usado = 0
+        self._mutex = threading.Lock()
+        self.conexiones = 0     # sesiones abiertas por este proceso
+
+    def _conectar(self):
+        import smtplib
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls()
+        if self.user and self.password:
+            smtp.login(self.user, self.password)
+        self.conexiones += 1
+        return smtp
+
+    def _vigente(self):
+        import smtplib
+        # Una conexión heredada de otro proceso (fork) no se puede compartir
+        if self._smtp is not None and self._pid != os.getpid():
+            self._smtp = None
+        if self._smtp is not None and time.monotonic() - self._usado > self.idle:
+            try:
+                if self._smtp.noop()[0] != 250:
+                    raise smtplib.SMTPServerDisconnected("NOOP rechazado")
+            except (smtplib.SMTPException, OSError):
+                self._cerrar()
+        if self._smtp is None:
+            self._smtp = self._conectar()
+            self._pid = os.getpid()
+        return self._smtp
+
+    def _cerrar(self):
+        try:
+            self._smtp.close()
+        except Exception:
+            pass
+        self._smtp = None
+
+    def send(self, msg):
+        import smtplib
+        with self._mutex:
+            for intento in (1, 2):
+                try:
+                    self._vigente().send_message(msg)
+                    self._usado = time.monotonic()
+                    return
+                except (smtplib.SMTPServerDisconnected, OSError):
+                    # El servidor cerró la conexión: una nueva y un reintento
+                    self._cerrar()
+                    if intento == 2:
+                        raise
+
+    def close(self):
+        with self._mutex:
+            if self._smtp is not None:
+                try:
+                    self._smtp.quit()
+                except Exception:
+                    pass
+                self._smtp = None
+
+
+class Mailer:
+    def __init__(self, path, pool, remitente, destino):
+        self.path = path
+        self.pool = pool
+        self.remitente = remitente
+        self.destino = destino
+        self._conexion = Conexiones(path, [
+            "CREATE TABLE IF NOT EXISTS avisos (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "tipo TEXT NOT NULL, asunto TEXT NOT NULL, texto TEXT NOT NULL, creado REAL NOT NULL, reservado REAL)",
+            "CREATE TABLE IF NOT EXISTS enviados (instante REAL NOT NULL)"], timeout=30)
+
+    # --- Cuotas ---
+    def _reservar_envio(self):
+        """Apunta un envío si cabe en las cuotas; si no, lanza RateLimited."""
+        con = self._conexion()
+        ahora = time.time()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            con.execute("DELETE FROM enviados WHERE instante < ?", (ahora - 86400,))
+            for ventana, limite in ((60, RATE_PER_MINUTE), (86400, DAILY_LIMIT)):
+                instantes = con.execute("SELECT instante FROM enviados WHERE instante >= ? ORDER BY instante",
+                                        (ahora - ventana,)).fetchall()
+                if len(instantes) >= limite:
+                    raise RateLimited(instantes[len(instantes) - limite][0] + ventana - ahora + 1)
+            con.execute("INSERT INTO enviados (instante) VALUES (?)", (ahora,))
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+
+    def send(self, asunto, cuerpo, destino=None):
+        destino = destino or self.destino
+        if not destino:
+            raise SinDestinatario()
+        self._reservar_envio()
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+        msg = MIMEMultipart()
+        msg["From"] = self.remitente or "no-reply@localhost"
+        msg["To"] = destino
+        msg["Subject"] = asunto
+        msg.attach(MIMEText(cuerpo, "plain", "utf-8"))
+        self.pool.send(msg)
+
+    # --- Resúmenes ---
+    def notify(self, tipo, asunto, texto):
+        """Apunta un aviso para el próximo resumen."""
+        self._conexion().execute("INSERT INTO avisos (tipo, asunto, texto, creado) VALUES (?, ?, ?, ?)",
+                                 (tipo, asunto, texto, time.time()))
+
+    def send_digest(self):
+        """Envía los avisos pendientes en un correo (o el aviso tal cual si es uno solo)."""
+        if not self.destino:
+            raise SinDestinatario()
+        con = self._conexion()
+        ahora = time.time()
+        # Los avisos se reservan para que dos trabajadores no manden el mismo;
+        # una reserva de más de 10 minutos es de un trabajador que murió
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            avisos = con.execute("SELECT id, tipo, asunto, texto FROM avisos WHERE reservado IS NULL "
+                                 "OR reservado < ? ORDER BY id LIMIT ?", (ahora - 600, MAX_AVISOS)).fetchall()
+            con.executemany("UPDATE avisos SET reservado = ? WHERE id = ?", [(ahora, a[0]) for a in avisos])
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        if not avisos:
+            return 0
+        if len(avisos) == 1:
+            asunto, cuerpo = avisos[0][2], avisos[0][3]
+        else:
+            conteo = {}
+            for _, tipo, _, _ in avisos:
+                conteo[tipo] = conteo.get(tipo, 0) + 1
+            resumen = ", ".join(f"{n} {tipo}{'s' if n > 1 else ''}" for tipo, n in conteo.items())
+            asunto = f"Genesis SA Services: {resumen}"
+            cuerpo = "\n\n".join(f"== {a} ==\n{t}" for _, _, a, t in avisos)
+        try:
+            self.send(asunto, cuerpo)
+        except BaseException:
+            # Si falla, los avisos vuelven a estar libres para el siguiente intento
+            con.executemany("UPDATE avisos SET reservado = NULL WHERE id = ?", [(a[0],) for a in avisos])
+            raise
+        con.executemany("DELETE FROM avisos WHERE id = ?", [(a[0],) for a in avisos])
+        return len(avisos)
+
+    def pending(self):
+        return self._conexion().execute("SELECT COUNT(*) FROM avisos").fetchone()[0]
@@ -0,0 +1,236 @@
+"""Métricas en formato Prometheus, sumadas entre todos los workers de gunicorn.
+
+Cada proceso lleva sus contadores e histogramas en memoria y un hilo los
+vuelca cada segundo (si cambiaron) a ``<METRICS_DIR>/<pid>.json``. ``/metrics``
+lee los archivos de todos los procesos y los suma, así que da igual qué worker
+atienda la petición. Los archivos de procesos que ya no existen (workers
+reciclados) se acumulan en ``muertos.json`` para que los contadores no bajen.
+
+Los medidores (gauges) como el tamaño de la cola de trabajos se calculan en el
+momento de la consulta con las funciones registradas con ``gauge``.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+
+from store import bloqueo
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+INTERVALO = 1.0      # segundos entre volcados a disco
+MUERTOS = "muertos.json"
+
+
+def _clave(nombre, etiquetas):
+    return nombre, tuple(sorted(etiquetas.items()))
+
+
+def _etiquetas(pares, extra=None):
+    pares = list(pares) + ([extra] if extra else [])
+    if not pares:
+        return ""
+    escapar = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")  # noqa: E731
+    return "{" + ",".join(f'{k}="{escapar(v)}"' for k, v in pares) + "}"
+
+
+def _serializar(contadores, histogramas):
+    return {"contadores": [[n, list(map(list, e)), v] for (n, e), v in contadores.items()],
+            "histogramas": [[n, list(map(list, e)), list(h)] for (n, e), h in histogramas.items()]}
+
+
+def _numero(valor):
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+
+class Metrics:
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self._contadores = {}    # (nombre, etiquetas) -> valor
+        self._histogramas = {}   # (nombre, etiquetas) -> [conteo por bucket..., suma, total]
+        self._ayuda = {}         # nombre -> (tipo, texto)
+        self._gauges = []        # (nombre, texto, función)
+        self._mutex = threading.Lock()
+        self._volcando = threading.Lock()   # el hilo de volcado y /metrics usan el mismo temporal
+        self._cambios = False
+        self._pid = None
+        self._local = threading.local()
+
+    # --- Registro ---
+    def describe(self, nombre, tipo, texto):
+        self._ayuda[nombre] = (tipo, texto)
+
+    def gauge(self, nombre, texto, funcion):
+        """``funcion()`` devuelve un número o una lista de (etiquetas, valor); se llama en cada consulta."""
+        self._gauges.append((nombre, texto, funcion))
+
+    def inc(self, nombre, valor=1, **etiquetas):
+        clave = _clave(nombre, etiquetas)
+        with self._mutex:
+            self._contadores[clave] = self._contadores.get(clave, 0) + valor
+            self._cambios = True
+        self._arrancar()
+
+    def observe(self, nombre, segundos, **etiquetas):
+        clave = _clave(nombre, etiquetas)
+        with self._mutex:
+            h = self._histogramas.get(clave)
+            if h is None:
+                h = self._histogramas[clave] = [0] * (len(BUCKETS) + 2)
+            for i, limite in enumerate(BUCKETS):
+                if segundos <= limite:
+                    h[i] += 1
+                    break
+            h[-2] += segundos
+            h[-1] += 1
+            self._cambios = True
+        self._arrancar()
+
+    # --- Contexto de la petición ---
+    def set_endpoint(self, endpoint):
+        """Endpoint al que se atribuye lo que haga este hilo (bytes leídos y escritos)."""
+        self._local.endpoint = endpoint
+
+    def bytes_io(self, path, leidos=0, escritos=0):
+        """Se conecta a store.medir_es: bytes de los archivos de datos por endpoint."""
+        etiquetas = {"file": os.path.basename(path), "endpoint": getattr(self._local, "endpoint", None) or "background"}
+        if leidos:
+            self.inc("store_bytes_read_total", leidos, **etiquetas)
+        if escritos:
+            self.inc("store_bytes_written_total", escritos, **etiquetas)
+
+    # --- Volcado a disco ---
+    def _arrancar(self):
+        # Un hilo de volcado por proceso (tras un fork el del padre no existe)
+        if self._pid != os.getpid():
+            with self._mutex:
+                if self._pid == os.getpid():
+                    return
+                self._pid = os.getpid()
+            threading.Thread(target=self._volcar_siempre, daemon=True, name="metrics").start()
+            # Lo del último segundo de un worker que se recicla también cuenta
+            atexit.register(self.flush)
+
+    def _volcar_siempre(self):
+        while True:
+            time.sleep(INTERVALO)
+            if self._cambios:
+                self.flush()
+
+    def _estado(self):
+        with self._mutex:
+            self._cambios = False
+            return _serializar(self._contadores, self._histogramas)
+
+    def flush(self):
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            tmp = os.path.join(self.directorio, f"{os.getpid()}.json.tmp")
+            with self._volcando:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(self._estado(), f)
+                os.replace(tmp, os.path.join(self.directorio, f"{os.getpid()}.json"))
+        except OSError as e:
+            print(f"[METRICS] No se pudo guardar {self.directorio}: {e}")
+
+    # --- Suma de todos los procesos ---
+    @staticmethod
+    def _juntar(total, contadores, histogramas):
+        for clave, v in contadores:
+            total[0][clave] = total[0].get(clave, 0) + v
+        for clave, h in histogramas:
+            suma = total[1].get(clave)
+            total[1][clave] = list(h) if suma is None else [a + b for a, b in zip(suma, h)]
+
+    @classmethod
+    def _sumar(cls, total, estado):
+        """Suma un estado tal como se guarda en los archivos .json."""
+        cls._juntar(total, (((n, tuple(map(tuple, e))), v) for n, e, v in estado.get("contadores", ())),
+                    (((n, tuple(map(tuple, e))), h) for n, e, h in estado.get("histogramas", ())))
+
+    @staticmethod
+    def _vivo(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    @staticmethod
+    def _leer(ruta):
+        try:
+            with open(ruta, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def collect(self):
+        """(contadores, histogramas) sumados de todos los procesos."""
+        self.flush()
+        total = ({}, {})
+        muertos = os.path.join(self.directorio, MUERTOS)
+        with bloqueo(muertos):
+            archivados = ({}, {})
+            self._sumar(archivados, self._leer(muertos))
+            recogidos = []
+            for nombre in os.listdir(self.directorio):
+                if not nombre.endswith(".json") or nombre == MUERTOS:
+                    continue
+                ruta = os.path.join(self.directorio, nombre)
+                pid = nombre[:-5]
+                if pid.isdigit() and not self._vivo(int(pid)):
+                    self._sumar(archivados, self._leer(ruta))
+                    recogidos.append(ruta)
+                else:
+                    self._sumar(total, self._leer(ruta))
+            if recogidos:
+                tmp = muertos + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(_serializar(*archivados), f)
+                os.replace(tmp, muertos)
+                for ruta in recogidos:
+                    os.remove(ruta)
+        self._juntar(total, archivados[0].items(), archivados[1].items())
+        return total
+
+    # --- Formato de texto de Prometheus ---
+    def render(self):
+        contadores, histogramas = self.collect()
+        lineas = []
+        for nombre in sorted({n for n, _ in contadores}):
+            self._cabecera(lineas, nombre, "counter")
+            for (n, e), v in sorted(contadores.items()):
+                if n == nombre:
+                    lineas.append(f"{n}{_etiquetas(e)} {_numero(v)}")
+        for nombre in sorted({n for n, _ in histogramas}):
+            self._cabecera(lineas, nombre, "histogram")
+            for (n, e), h in sorted(histogramas.items()):
+                if n != nombre:
+                    continue
+                acumulado = 0
+                for limite, conteo in zip(BUCKETS, h):
+                    acumulado += conteo
+                    lineas.append(f"{n}_bucket{_etiquetas(e, ('le', _numero(limite)))} {acumulado}")
+                lineas.append(f"{n}_bucket{_etiquetas(e, ('le', '+Inf'))} {h[-1]}")
+                lineas.append(f"{n}_sum{_etiquetas(e)} {_numero(round(h[-2], 6))}")
+                lineas.append(f"{n}_count{_etiquetas(e)} {h[-1]}")
+        for nombre, texto, funcion in self._gauges:
+            try:
+                valores = funcion()
+            except Exception as e:
+                print(f"[METRICS] No se pudo calcular {nombre}: {e}")
+                continue
+            lineas.append(f"# HELP {nombre} {texto}")
+            lineas.append(f"# TYPE {nombre} gauge")
+            if not isinstance(valores, (list, tuple)):
+                valores = [({}, valores)]
+            for etiquetas, valor in valores:
+                lineas.append(f"{nombre}{_etiquetas(sorted(etiquetas.items()))} {_numero(valor)}")
+        return "\n".join(lineas) + "\n"
+
+    def _cabecera(self, lineas, nombre, tipo):
+        tipo, texto = self._ayuda.get(nombre, (tipo, nombre))
+        lineas.append(f"# HELP {nombre} {texto}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
@@ -0,0 +1,211 @@
+"""Perfilado de una petición concreta del panel, a petición de un administrador.
+
+Se activa con ``?_profile=1`` (o la cabecera ``X-Profile: 1``) en cualquier
+ruta protegida con ``admin_required``. Sin la marca no se hace nada más que
+mirarla. Hay dos modos:
+
+* ``_profile=1`` o ``cprofile``: cProfile. Se guardan ``<id>.pstats`` (para
+  ``python -m pstats`` o snakeviz) y ``<id>.txt`` con las 60 funciones de más
+  tiempo acumulado.
+* ``_profile=sample``: muestreo de la pila del hilo de la petición cada
+  ``INTERVALO`` segundos, casi sin sobrecoste. Se guardan ``<id>.folded``
+  (pilas plegadas, para speedscope o flamegraph.pl) y ``<id>.svg`` (el
+  flamegraph, se abre en el navegador).
+
+La captura dura hasta que se cierra la respuesta, así que las descargas en
+streaming se miden enteras. Solo se guardan los ``PROFILE_KEEP`` perfiles más
+recientes en ``PROFILE_DIR``.
+"""
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "perfiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+INTERVALO = 0.002                 # segundos entre muestras
+MAX_SEGUNDOS = 300                # una captura que nadie cierra se termina sola
+NOMBRE = re.compile(r"^[0-9a-f]{12}\.(pstats|txt|folded|svg)$")
+MODOS = {"1": "cprofile", "true": "cprofile", "cprofile": "cprofile", "sample": "sample"}
+
+# cProfile no admite dos perfiles activos a la vez en el mismo proceso
+_ocupado = threading.Lock()
+
+
+class Ocupado(Exception):
+    pass
+
+
+def solicitado(request):
+    """Modo pedido por la petición ("cprofile"/"sample") o None."""
+    marca = request.args.get("_profile") or request.headers.get("X-Profile")
+    return MODOS.get(marca.lower()) if marca else None
+
+
+class Captura:
+    def __init__(self, modo, etiqueta):
+        self.modo = modo
+        self.etiqueta = etiqueta
+        self.id = uuid.uuid4().hex[:12]
+        self._perfil = None
+        self._muestras = None
+        self._parar = threading.Event()
+        self._hilo = None
+        self._inicio = None
+        self._terminada = False
+        self._mutex = threading.Lock()
+        self._limite = None
+
+    def start(self):
+        if not _ocupado.acquire(blocking=False):
+            raise Ocupado("Ya hay un perfil en curso en este worker")
+        self._inicio = time.perf_counter()
+        self._limite = threading.Timer(MAX_SEGUNDOS, self.stop)
+        self._limite.daemon = True
+        self._limite.start()
+        if self.modo == "sample":
+            self._muestras = {}
+            objetivo = threading.get_ident()
+            self._hilo = threading.Thread(target=self._muestrear, args=(objetivo,), daemon=True, name="profiler")
+            self._hilo.start()
+        else:
+            import cProfile
+            self._perfil = cProfile.Profile()
+            self._perfil.enable()
+
+    def _muestrear(self, objetivo):
+        while not self._parar.wait(INTERVALO):
+            marco = sys._current_frames().get(objetivo)
+            pila = []
+            while marco is not None:
+                codigo = marco.f_code
+                pila.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}")
+                marco = marco.f_back
+            if pila:
+                pila = tuple(reversed(pila))
+                self._muestras[pila] = self._muestras.get(pila, 0) + 1
+
+    def stop(self):
+        """Termina la captura y guarda los archivos (se puede llamar más de una vez)."""
+        with self._mutex:
+            if self._terminada:
+                return
+            self._terminada = True
+        self._limite.cancel()
+        segundos = time.perf_counter() - self._inicio
+        try:
+            if self._perfil is not None:
+                self._perfil.disable()
+            else:
+                self._parar.set()
+                self._hilo.join()
+        finally:
+            _ocupado.release()
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            base = os.path.join(PROFILE_DIR, self.id)
+            cabecera = f"{self.etiqueta} ({segundos * 1000:.1f} ms)"
+            if self._perfil is not None:
+                import io
+                import pstats
+                self._perfil.dump_stats(base + ".pstats")
+                texto = io.StringIO()
+                texto.write(cabecera + "\n\n")
+                pstats.Stats(self._perfil, stream=texto).sort_stats("cumulative").print_stats(60)
+                with open(base + ".txt", "w", encoding="utf-8") as f:
+                    f.write(texto.getvalue())
+            else:
+                with open(base + ".folded", "w", encoding="utf-8") as f:
+                    for pila, n in sorted(self._muestras.items()):
+                        f.write(";".join(pila) + f" {n}\n")
+                with open(base + ".svg", "w", encoding="utf-8") as f:
+                    f.write(flamegraph(self._muestras, cabecera))
+            print(f"[PROFILE] {cabecera} -> {base}")
+            _podar()
+        except OSError as e:
+            print(f"[PROFILE] No se pudo guardar el perfil {self.id}: {e}")
+
+
+def _podar():
+    """Deja solo los PROFILE_KEEP perfiles más recientes."""
+    perfiles = {}
+    for nombre in os.listdir(PROFILE_DIR):
+        if NOMBRE.match(nombre):
+            ruta = os.path.join(PROFILE_DIR, nombre)
+            perfiles.setdefault(nombre[:12], []).append(ruta)
+    antiguos = sorted(perfiles.values(), key=lambda rutas: os.path.getmtime(rutas[0]), reverse=True)[PROFILE_KEEP:]
+    for rutas in antiguos:
+        for ruta in rutas:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+
+def listar():
+    """[(id, instante, [archivos])] del más reciente al más antiguo."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    perfiles = {}
+    for nombre in os.listdir(PROFILE_DIR):
+        if NOMBRE.match(nombre):
+            perfiles.setdefault(nombre[:12], []).append(nombre)
+    resultado = []
+    for pid, archivos in perfiles.items():
+        resultado.append((pid, os.path.getmtime(os.path.join(PROFILE_DIR, archivos[0])), sorted(archivos)))
+    return sorted(resultado, key=lambda p: p[1], reverse=True)
+
+
+def ruta(nombre):
+    """Ruta de un archivo de perfil, o None si el nombre no es válido o no existe."""
+    if not NOMBRE.match(nombre):
+        return None
+    ruta_archivo = os.path.join(PROFILE_DIR, nombre)
+    return ruta_archivo if os.path.exists(ruta_archivo) else None
+
+
+# --- Flamegraph en SVG ---
+def flamegraph(muestras, titulo, ancho=1200, alto_fila=16):
+    """SVG autocontenido a partir de {pila: muestras}; la raíz va abajo."""
+    import html
+    import zlib
+    arbol = {"n": 0, "hijos": {}}
+    for pila, n in muestras.items():
+        nodo = arbol
+        nodo["n"] += n
+        for marco in pila:
+            nodo = nodo["hijos"].setdefault(marco, {"n": 0, "hijos": {}})
+            nodo["n"] += n
+    total = arbol["n"] or 1
+    rects = []
+
+    def dibujar(nodo, nombre, x, nivel):
+        rects.append((nombre, x, nivel, nodo["n"]))
+        for hijo_nombre, hijo in sorted(nodo["hijos"].items()):
+            dibujar(hijo, hijo_nombre, x, nivel + 1)
+            x += hijo["n"]
+
+    dibujar(arbol, "all", 0, 0)
+    niveles = max(r[2] for r in rects) + 1
+    alto = (niveles + 2) * alto_fila
+    partes = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{ancho}" height="{alto}" '
+              f'font-family="Verdana" font-size="11">',
+              f'<text x="5" y="13">{html.escape(titulo)} - {total} muestras</text>']
+    for nombre, x, nivel, n in rects:
+        w = n / total * (ancho - 10)
+        if w < 0.5:
+            continue
+        px = 5 + x / total * (ancho - 10)
+        py = alto - (nivel + 1) * alto_fila
+        tono = zlib.crc32(nombre.encode()) % 60
+        etiqueta = html.escape(f"{nombre} ({n} muestras, {n / total:.1%})")
+        partes.append(f'<g><title>{etiqueta}</title><rect x="{px:.1f}" y="{py}" width="{w:.1f}" '
+                      f'height="{alto_fila - 1}" fill="hsl({tono},85%,60%)"/>')
+        if w > 40:
+            texto = nombre if len(nombre) * 7 < w else nombre[:max(0, int(w / 7) - 2)] + ".."
+            partes.append(f'<text x="{px + 3:.1f}" y="{py + 11}">{html.escape(texto)}</text>')
+        partes.append("</g>")
+    partes.append("</svg>")
+    return "\n".join(partes)
@@ -0,0 +1,176 @@
+"""Informe PDF de citas para /export_pdf.
+
+La tabla se dibuja fila a fila directamente en el canvas: cada celda se parte
+en líneas según el ancho de su columna, la cabecera se repite en cada página y
+nunca se tienen en memoria más citas que las del lote actual. Los informes
+grandes se generan en un hilo aparte y se descargan después desde un enlace.
+"""
+import functools
+import os
+import threading
+import time
+import uuid
+
+TITULO = "Genesis SA Services LLC - Appointments"
+COLUMNAS = (("#", 0.05), ("Name", 0.14), ("Service", 0.13), ("Date", 0.09),
+            ("Address", 0.19), ("Email", 0.17), ("Message", 0.23))
+MAX_LINEAS = 6          # líneas por celda; el resto se corta con "..."
+EXPORT_DIR = "exports"
+RETENCION = 3600        # segundos que se guardan los informes generados en segundo plano
+
+_diseno = None
+
+
+def _diseno_pagina():
+    """Medidas de la página y de las columnas, calculadas una vez por proceso."""
+    global _diseno
+    if _diseno is None:
+        from reportlab import rl_config
+        from reportlab.lib.pagesizes import landscape, letter
+        # Las páginas comprimidas se guardan en binario: codificarlas en ASCII85
+        # era la mitad del tiempo de un informe grande
+        rl_config.useA85 = 0
+        ancho, alto = landscape(letter)
+        margen = 30
+        util = ancho - 2 * margen
+        columnas, x = [], margen
+        for titulo, fraccion in COLUMNAS:
+            columnas.append((titulo, x, util * fraccion))
+            x += util * fraccion
+        _diseno = {
+            "tamano": (ancho, alto), "margen": margen, "util": util, "columnas": columnas,
+            "fuente": "Helvetica", "negrita": "Helvetica-Bold", "cuerpo": 8, "interlineado": 10,
+            "relleno": 3,
+        }
+    return _diseno
+
+
+@functools.lru_cache(maxsize=4096)
+def _partir(texto, fuente, tamano, ancho):
+    from reportlab.lib.utils import simpleSplit
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    if stringWidth(texto, fuente, tamano) <= ancho:
+        return (texto,)
+    lineas = simpleSplit(texto, fuente, tamano, ancho) or [""]
+    if len(lineas) > MAX_LINEAS:
+        lineas = lineas[:MAX_LINEAS]
+        lineas[-1] = lineas[-1][:-3] + "..."
+    return tuple(lineas)
+
+
+def write_pdf(lotes, destino, titulo=TITULO):
+    """Dibuja las citas de ``lotes`` (iterable de listas de citas) en ``destino``."""
+    from reportlab.pdfgen import canvas as pdfcanvas
+    d = _diseno_pagina()
+    ancho, alto = d["tamano"]
+    margen, relleno, interlineado = d["margen"], d["relleno"], d["interlineado"]
+    c = pdfcanvas.Canvas(destino, pagesize=d["tamano"], pageCompression=1)
+    estado = {"pagina": 0, "y": 0, "texto": None}
+
+    def cabecera():
+        estado["pagina"] += 1
+        c.setFont(d["negrita"], 14)
+        c.drawString(margen, alto - margen - 10, titulo)
+        c.setFont(d["fuente"], 8)
+        c.drawRightString(ancho - margen, margen - 15, f"Page {estado['pagina']}")
+        y = alto - margen - 30
+        c.setFillGray(0.85)
+        c.rect(margen, y - interlineado - relleno, d["util"], interlineado + 2 * relleno, stroke=0, fill=1)
+        c.setFillGray(0)
+        c.setFont(d["negrita"], d["cuerpo"])
+        for nombre, x, _ in d["columnas"]:
+            c.drawString(x + relleno, y - interlineado + 2, nombre)
+        estado["y"] = y - interlineado - relleno
+        # Un solo objeto de texto por página: mucho más rápido que drawString por celda
+        estado["texto"] = c.beginText()
+        estado["texto"].setFont(d["fuente"], d["cuerpo"])
+
+    def fin_de_pagina():
+        c.drawText(estado["texto"])
+
+    cabecera()
+    n = 0
+    for lote in lotes:
+        for cita in lote:
+            n += 1
+            valores = [str(n), cita["name"], cita["service"], cita["date"],
+                       cita["address"], cita["email"], cita["message"]]
+            celdas = [_partir(v, d["fuente"], d["cuerpo"], w - 2 * relleno)
+                      for v, (_, _, w) in zip(valores, d["columnas"])]
+            alto_fila = max(len(lineas) for lineas in celdas) * interlineado + 2 * relleno
+            if estado["y"] - alto_fila < margen:
+                fin_de_pagina()
+                c.showPage()
+                cabecera()
+            y = estado["y"]
+            if n % 2 == 0:
+                c.setFillGray(0.96)
+                c.rect(margen, y - alto_fila, d["util"], alto_fila, stroke=0, fill=1)
+                c.setFillGray(0)
+            texto = estado["texto"]
+            for lineas, (_, x, _) in zip(celdas, d["columnas"]):
+                for i, linea in enumerate(lineas):
+                    if linea:
+                        texto.setTextOrigin(x + relleno, y - relleno - (i + 1) * interlineado + 2)
+                        texto.textOut(linea)
+            c.setStrokeGray(0.8)
+            c.line(margen, y - alto_fila, margen + d["util"], y - alto_fila)
+            estado["y"] = y - alto_fila
+    if n == 0:
+        estado["texto"].setTextOrigin(margen, estado["y"] - 15)
+        estado["texto"].textOut("No appointments found.")
+    fin_de_pagina()
+    c.save()
+    return n
+
+
+# --- Informes en segundo plano ---
+def _ruta(token, sufijo=".pdf"):
+    return os.path.join(EXPORT_DIR, token + sufijo)
+
+
+def _limpiar_antiguos():
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    limite = time.time() - RETENCION
+    for nombre in os.listdir(EXPORT_DIR):
+        ruta = os.path.join(EXPORT_DIR, nombre)
+        try:
+            if os.path.getmtime(ruta) < limite:
+                os.remove(ruta)
+        except OSError:
+            pass
+
+
+def start_background(lotes, titulo=TITULO):
+    """Genera el informe en un hilo y devuelve el token para descargarlo."""
+    _limpiar_antiguos()
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    token = uuid.uuid4().hex
+    parcial = _ruta(token, ".pdf.part")
+    open(parcial, "wb").close()
+
+    def generar():
+        try:
+            write_pdf(lotes, parcial, titulo)
+            os.replace(parcial, _ruta(token))
+        except Exception as e:
+            print(f"[PDF] Error generando informe {token}: {e}")
+            os.replace(parcial, _ruta(token, ".error"))
+
+    threading.Thread(target=generar, daemon=True).start()
+    return token
+
+
+def status(token):
+    """'ready', 'pending', 'error' o None si el token no existe (o no es válido)."""
+    if not token.isalnum():
+        return None
+    for sufijo, estado in ((".pdf", "ready"), (".pdf.part", "pending"), (".error", "error")):
+        if os.path.exists(_ruta(token, sufijo)):
+            return estado
+    return None
+
+
+def path(token):
+    return _ruta(token)
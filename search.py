@@ -0,0 +1,99 @@
+"""Índice invertido de palabras para el buscador del panel.
+
+Cada registro se divide en palabras (minúsculas, letras y dígitos). Una
+consulta de varias palabras devuelve los registros que contienen todas, cada
+una como palabra completa o como prefijo, ordenados por relevancia. El coste
+depende de cuántos registros coinciden, no del total.
+
+Los términos unidos por puntuación (fechas ISO, correos) se buscan por sus
+palabras y luego se comprueba que el registro contiene el término entero:
+"2025-06" no coincide con "2025-03-06", aunque tenga "2025" y "06".
+"""
+import bisect
+import re
+
+_PALABRA = re.compile(r"\w+", re.UNICODE)
+_COMPUESTO = re.compile(r"\w+(?:[^\w\s]+\w+)+", re.UNICODE)
+
+
+def tokenizar(texto):
+    return _PALABRA.findall(str(texto).lower())
+
+
+class SearchIndex:
+    def __init__(self, campos, registro):
+        """``registro(id)`` devuelve el registro indexado con ese id (para los términos compuestos)."""
+        self.campos = campos
+        self.registro = registro
+        self._postings = {}      # palabra -> {id: apariciones}
+        self._palabras_de = {}   # id -> {palabras}
+        self._vocabulario = []   # palabras ordenadas, para prefijos
+        self._vocabulario_al_dia = True
+
+    def __len__(self):
+        return len(self._palabras_de)
+
+    def add(self, rid, registro):
+        if rid in self._palabras_de:
+            self.remove(rid)
+        conteo = {}
+        for campo in self.campos:
+            for palabra in tokenizar(registro.get(campo, "")):
+                conteo[palabra] = conteo.get(palabra, 0) + 1
+        for palabra, n in conteo.items():
+            ids = self._postings.get(palabra)
+            if ids is None:
+                ids = self._postings[palabra] = {}
+                self._vocabulario_al_dia = False
+            ids[rid] = n
+        self._palabras_de[rid] = set(conteo)
+
+    def remove(self, rid):
+        for palabra in self._palabras_de.pop(rid, ()):
+            ids = self._postings[palabra]
+            del ids[rid]
+            if not ids:
+                del self._postings[palabra]
+                self._vocabulario_al_dia = False
+
+    def _coincidencias(self, termino):
+        """{id: puntos} de los registros con alguna palabra que empieza por ``termino``."""
+        if not self._vocabulario_al_dia:
+            self._vocabulario = sorted(self._postings)
+            self._vocabulario_al_dia = True
+        puntos = {}
+        i = bisect.bisect_left(self._vocabulario, termino)
+        while i < len(self._vocabulario) and self._vocabulario[i].startswith(termino):
+            palabra = self._vocabulario[i]
+            # Coincidencia completa vale el doble que un prefijo
+            peso = 2 if palabra == termino else 1
+            for rid, n in self._postings[palabra].items():
+                puntos[rid] = puntos.get(rid, 0) + peso * n
+            i += 1
+        return puntos
+
+    def search(self, consulta):
+        """Ids que contienen todos los términos, como ``[(id, puntos)]`` sin ordenar."""
+        terminos = sorted(set(tokenizar(consulta)))
+        if not terminos:
+            return []
+        resultados = None
+        for termino in terminos:
+            puntos = self._coincidencias(termino)
+            if resultados is None:
+                resultados = puntos
+            else:
+                if len(puntos) < len(resultados):
+                    resultados, puntos = puntos, resultados
+                resultados = {rid: p + puntos[rid] for rid, p in resultados.items() if rid in puntos}
+            if not resultados:
+                return []
+        compuestos = _COMPUESTO.findall(str(consulta).lower())
+        if compuestos:
+            resultados = {rid: p for rid, p in resultados.items() if self._contiene(rid, compuestos)}
+        return list(resultados.items())
+
+    def _contiene(self, rid, compuestos):
+        registro = self.registro(rid)
+        texto = "\n".join(str(registro.get(campo) or "") for campo in self.campos).lower()
+        return all(termino in texto for termino in compuestos)
@@ -0,0 +1,197 @@
+"""Sesiones guardadas en el servidor: la cookie solo lleva un id aleatorio.
+
+``SESSION_BACKEND`` elige dónde viven los datos de la sesión:
+
+* ``sqlite`` (por defecto): tabla en ``SESSION_DB``, compartida por todos los
+  workers, con una caché LRU en memoria por proceso delante. Una entrada de la
+  caché vale ``SESSION_CACHE_SECONDS`` (2 s). Ese es el retraso máximo con que
+  un worker ve que otra petición ha revocado la sesión.
+* ``cookie``: la sesión firmada de Flask de siempre (sin revocación).
+
+Con sesiones en el servidor, cerrar sesión la borra de verdad, y
+``revoke_user`` echa a un usuario de todos los navegadores (ver
+``flask revoke-sessions``). La caducidad es deslizante (``SESSION_TTL``
+segundos sin uso).
+
+Solo se guardan en el servidor las sesiones con ``admin_user``. Antes del login
+(el token CSRF del formulario, los avisos de flash) la sesión va en la propia
+cookie, firmada y válida ``SESSION_ANON_TTL`` segundos, para que cualquiera que
+pida /login no escriba filas en la tabla. Un id de servidor no lleva puntos y
+una cookie firmada sí: así se distinguen.
+"""
+import collections
+import json
+import os
+import secrets
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from werkzeug.datastructures import CallbackDict
+
+from kvstore import Conexiones
+
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(12 * 3600)))
+CACHE_SECONDS = float(os.getenv("SESSION_CACHE_SECONDS", "2"))
+ANON_TTL = int(os.getenv("SESSION_ANON_TTL", "3600"))   # lo mismo que dura el token CSRF
+CACHE_SIZE = 1000
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, datos=None, sid=None, nueva=False):
+        def al_cambiar(_):
+            self.modified = True
+        super().__init__(datos, al_cambiar)
+        self.sid = sid
+        self.new = nueva
+        self.anonima = False    # leída de una cookie firmada, sin fila en el servidor
+        self.modified = False
+        self.regenerada = None  # id anterior, si se cambió (login)
+
+    def regenerate(self):
+        """Id nuevo para la misma sesión (contra la fijación de sesión al hacer login)."""
+        if self.regenerada is None:
+            self.regenerada = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+
+class SessionStore:
+    """Sesiones en sqlite con una caché LRU por proceso."""
+
+    def __init__(self, path, ttl=SESSION_TTL, cache_seconds=CACHE_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self.cache_seconds = cache_seconds
+        self._conexion = Conexiones(path, [
+            "CREATE TABLE IF NOT EXISTS sesiones (sid TEXT PRIMARY KEY, datos TEXT NOT NULL, "
+            "usuario TEXT, caduca REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS sesiones_usuario ON sesiones (usuario)"])
+        self._cache = collections.OrderedDict()  # sid -> (leído, datos, caduca)
+        self._mutex = threading.Lock()
+        self._escrituras = 0
+
+    def _cachear(self, sid, datos, caduca):
+        with self._mutex:
+            self._cache[sid] = (time.monotonic(), datos, caduca)
+            self._cache.move_to_end(sid)
+            while len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def _olvidar(self, sid):
+        with self._mutex:
+            self._cache.pop(sid, None)
+
+    def get(self, sid):
+        """(datos, caduca) de la sesión, o None si no existe o caducó."""
+        ahora = time.time()
+        with self._mutex:
+            guardada = self._cache.get(sid)
+            if guardada and time.monotonic() - guardada[0] < self.cache_seconds and guardada[2] > ahora:
+                self._cache.move_to_end(sid)
+                return dict(guardada[1]), guardada[2]
+        fila = self._conexion().execute("SELECT datos, caduca FROM sesiones WHERE sid = ? AND caduca > ?",
+                                        (sid, ahora)).fetchone()
+        if fila is None:
+            self._olvidar(sid)
+            return None
+        datos = json.loads(fila[0])
+        self._cachear(sid, datos, fila[1])
+        return dict(datos), fila[1]
+
+    def set(self, sid, datos):
+        caduca = time.time() + self.ttl
+        self._conexion().execute(
+            "INSERT OR REPLACE INTO sesiones (sid, datos, usuario, caduca) VALUES (?, ?, ?, ?)",
+            (sid, json.dumps(datos), datos.get("admin_user"), caduca))
+        self._cachear(sid, dict(datos), caduca)
+        self._escrituras += 1
+        if self._escrituras % 500 == 0:
+            self._conexion().execute("DELETE FROM sesiones WHERE caduca <= ?", (time.time(),))
+        return caduca
+
+    def delete(self, sid):
+        self._conexion().execute("DELETE FROM sesiones WHERE sid = ?", (sid,))
+        self._olvidar(sid)
+
+    def revoke_user(self, usuario):
+        """Cierra todas las sesiones de ``usuario``. Devuelve cuántas había."""
+        cur = self._conexion().execute("DELETE FROM sesiones WHERE usuario = ?", (usuario,))
+        with self._mutex:
+            for sid in [s for s, (_, datos, _) in self._cache.items() if datos.get("admin_user") == usuario]:
+                del self._cache[sid]
+        return cur.rowcount
+
+    def count(self, usuario=None):
+        consulta, args = "SELECT COUNT(*) FROM sesiones WHERE caduca > ?", [time.time()]
+        if usuario is not None:
+            consulta += " AND usuario = ?"
+            args.append(usuario)
+        return self._conexion().execute(consulta, args).fetchone()[0]
+
+
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, store, anon_ttl=ANON_TTL):
+        self.store = store
+        self.anon_ttl = anon_ttl
+
+    def _firmador(self, app):
+        return URLSafeTimedSerializer(app.secret_key, salt="sesion-anonima", serializer=TaggedJSONSerializer())
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and "." in sid:
+            try:
+                datos = self._firmador(app).loads(sid, max_age=self.anon_ttl)
+            except BadSignature:
+                datos = None
+            if isinstance(datos, dict) and "admin_user" not in datos:
+                sesion = ServerSession(datos, secrets.token_urlsafe(32), nueva=True)
+                sesion.anonima = True
+                sesion.renovar = False
+                return sesion
+        elif sid and len(sid) <= 64:
+            guardada = self.store.get(sid)
+            if guardada is not None:
+                datos, caduca = guardada
+                sesion = ServerSession(datos, sid)
+                # Renovar la caducidad solo cuando ya ha pasado la mitad del plazo
+                sesion.renovar = caduca - time.time() < self.store.ttl / 2
+                return sesion
+        sesion = ServerSession(sid=secrets.token_urlsafe(32), nueva=True)
+        sesion.renovar = False
+        return sesion
+
+    def save_session(self, app, session, response):
+        nombre = self.get_cookie_name(app)
+        dominio = self.get_cookie_domain(app)
+        ruta = self.get_cookie_path(app)
+        if session.regenerada:
+            self.store.delete(session.regenerada)
+        if not session:
+            # Sesión vacía: se borra en el servidor y en el navegador
+            if not session.new:
+                self.store.delete(session.sid)
+            if not session.new or session.anonima:
+                response.delete_cookie(nombre, domain=dominio, path=ruta)
+            return
+        if "admin_user" not in session:
+            # Sin login: en la cookie firmada, y fuera del servidor si estaba
+            if not session.new:
+                self.store.delete(session.sid)
+            elif not session.modified:
+                return
+            response.set_cookie(nombre, self._firmador(app).dumps(dict(session)), max_age=self.anon_ttl,
+                                httponly=self.get_cookie_httponly(app), domain=dominio, path=ruta,
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+            response.vary.add("Cookie")
+            return
+        if not (session.modified or session.renovar or session.regenerada):
+            return
+        self.store.set(session.sid, dict(session))
+        response.set_cookie(nombre, session.sid, expires=self.get_expiration_time(app, session),
+                            httponly=self.get_cookie_httponly(app), domain=dominio, path=ruta,
+                            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+        response.vary.add("Cookie")
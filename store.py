@@ -0,0 +1,779 @@
+"""Almacenes de citas y mensajes de voz sobre archivos de texto de solo anexado.
+
+``citas_clientes.txt`` es un diario: cada línea es una cita
+``name|service|date|address|email|message|id`` o una operación sobre una cita
+anterior. Las citas antiguas sin séptima columna reciben el id
+``l<número de línea>``. El formulario antiguo no quitaba los ``|`` del mensaje:
+una séptima columna solo es un id si la línea tiene justo siete y el valor
+tiene forma de id (ID_VALIDO); si no, lo que sobra es parte del mensaje. Las operaciones guardan la versión previa de la cita:
+
+    @del|id|name|service|date|address|email|message   (cita eliminada)
+    @upd|id|name|service|date|address|email|message   (versión sustituida; la
+                                                       nueva va en la línea siguiente)
+
+Cuando el diario acumula demasiadas líneas obsoletas se compacta en segundo
+plano escribiendo un archivo temporal y renombrándolo encima del original.
+
+Con varios workers de gunicorn las escrituras se serializan con ``flock`` sobre
+un archivo ``<ruta>.lock`` (exclusivo para escribir, compartido para leer), de
+modo que nadie parsea una línea a medio escribir ni renombra el diario mientras
+otro proceso anexa.
+"""
+import bisect
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+from search import SearchIndex
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+CAMPOS = ("name", "service", "date", "address", "email", "message")
+
+
+MARCAS = ("@del", "@upd")
+# Ids que escribe este módulo: uuid/sha1 recortados, o l<línea> de citas antiguas
+ID_VALIDO = re.compile(r"[0-9a-f]{12}|l\d+")
+
+# Función (ruta, leídos, escritos) a la que se avisa de los bytes que se leen y
+# escriben en los archivos de datos; app.py la conecta con las métricas
+medir_es = None
+
+
+def _contar(path, leidos=0, escritos=0):
+    if medir_es is not None:
+        medir_es(path, leidos, escritos)
+
+
+def limpiar(valor):
+    """Quita separadores y saltos de línea que romperían el formato del archivo."""
+    return str(valor or "").replace("|", "/").replace("\r", " ").replace("\n", " ").strip()
+
+
+def _nueva_cita(datos, cid):
+    if not isinstance(datos, dict):
+        datos = dict(zip(CAMPOS, datos))
+    cita = {k: limpiar(datos.get(k, "")) for k in CAMPOS}
+    # Un nombre que empiece por "@" se confundiría con una operación del diario
+    cita["name"] = cita["name"].lstrip("@")
+    cita["id"] = cid
+    return cita
+
+
+def _linea(cita, marca=None):
+    campos = [cita[k] for k in CAMPOS]
+    partes = [marca, cita["id"]] + campos if marca else campos + [cita["id"]]
+    return "|".join(partes) + "\n"
+
+
+def _fsync_directorio(path):
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def bloqueo(path, exclusivo=True):
+    """Bloqueo entre procesos sobre ``<path>.lock``; devuelve el archivo de bloqueo."""
+    if fcntl is None:
+        yield None
+        return
+    with open(path + ".lock", "a+") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH)
+        try:
+            yield f
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _generacion(lock):
+    """Número de compactaciones guardado en el archivo de bloqueo.
+
+    El inodo no sirve para saber si el diario fue reemplazado: el sistema de
+    archivos puede reutilizar el del diario anterior para el siguiente temporal.
+    """
+    if lock is None:
+        return 0
+    lock.seek(0)
+    contenido = lock.read().strip()
+    return int(contenido) if contenido.isdigit() else 0
+
+
+def _incrementar(conteo, clave, n):
+    total = conteo.get(clave, 0) + n
+    if total > 0:
+        conteo[clave] = total
+    else:
+        conteo.pop(clave, None)
+
+
+def _mes(fecha):
+    """'YYYY-MM' de una fecha ISO, o None si la fecha no tiene ese formato."""
+    if len(fecha) >= 7 and fecha[4] == "-" and fecha[:4].isdigit() and fecha[5:7].isdigit() \
+            and 1 <= int(fecha[5:7]) <= 12:
+        return fecha[:7]
+    return None
+
+
+class Estadisticas:
+    """Conteos de citas por día y servicio, con totales por mes y por servicio.
+
+    Se actualizan con cada cita que entra o sale, así que consultarlos no
+    recorre las citas; un rango de fechas solo recorre los días distintos.
+    """
+
+    def __init__(self, dias=None):
+        self.dias = {}       # date -> {service: n}
+        self.meses = {}      # "YYYY-MM" -> n
+        self.servicios = {}  # service -> n
+        self._fechas = []    # claves de ``dias`` ordenadas
+        for fecha, servicios in (dias or {}).items():
+            for servicio, n in servicios.items():
+                self.sumar(fecha, servicio, n)
+
+    def sumar(self, fecha, servicio, n=1):
+        por_servicio = self.dias.get(fecha)
+        if por_servicio is None:
+            por_servicio = self.dias[fecha] = {}
+            bisect.insort(self._fechas, fecha)
+        _incrementar(por_servicio, servicio, n)
+        if not por_servicio:
+            del self.dias[fecha]
+            self._fechas.pop(bisect.bisect_left(self._fechas, fecha))
+        _incrementar(self.servicios, servicio, n)
+        mes = _mes(fecha)
+        if mes:
+            _incrementar(self.meses, mes, n)
+
+    def resumen(self, desde=None, hasta=None, servicio=None):
+        if not desde and not hasta and not servicio:
+            meses, servicios = self.meses, self.servicios
+        else:
+            meses, servicios = {}, {}
+            i = bisect.bisect_left(self._fechas, desde) if desde else 0
+            j = bisect.bisect_right(self._fechas, hasta) if hasta else len(self._fechas)
+            for fecha in self._fechas[i:j]:
+                mes = _mes(fecha)
+                for s, n in self.dias[fecha].items():
+                    if servicio and s != servicio:
+                        continue
+                    _incrementar(servicios, s, n)
+                    if mes:
+                        _incrementar(meses, mes, n)
+        return {"months": dict(sorted(meses.items())), "services": dict(sorted(servicios.items())),
+                "total": sum(servicios.values())}
+
+
+class AppointmentStore:
+    """Citas indexadas por id, nombre+fecha, servicio y fecha.
+
+    El estado en memoria se identifica por ``(st_ino, st_mtime_ns, st_size)``
+    del diario y la generación de compactación. Si el archivo solo creció, se
+    parsean únicamente las líneas nuevas; si fue compactado, se recarga entero.
+    Agregar, editar y borrar solo anexan líneas al final; la compactación es la
+    única operación que reescribe el archivo.
+
+    Las estadísticas se guardan cada cierto tiempo en ``<ruta>.stats`` junto con
+    el offset del diario que cubren, para que un worker recién arrancado pueda
+    responder /stats_data leyendo solo la cola del diario.
+    """
+
+    def __init__(self, path, compact_threshold=1000):
+        self.path = path
+        self.compact_threshold = compact_threshold
+        self._firma = None
+        self._citas = {}             # id -> cita (dict), en orden del archivo
+        self._por_nombre_fecha = {}  # (name, date) -> [ids]
+        self._por_servicio = {}      # service -> {ids}
+        self._por_fecha = {}         # date -> {ids}
+        self._fechas = []            # fechas distintas ordenadas, para rangos
+        self._obsoletas = 0          # líneas que la compactación eliminaría
+        self._leido = 0              # bytes del diario ya aplicados
+        self._lineas = 0             # líneas ya aplicadas (ids l<n> de citas antiguas)
+        self._generacion = 0
+        self._posicion = {}          # id -> orden de llegada (cursor de paginación)
+        self._orden = []             # posiciones vigentes, ordenadas
+        self._id_en = {}             # posición -> id
+        self._filtrados = {}         # (servicio, búsqueda) -> (versión, posiciones)
+        self._siguiente = 0
+        self._indice = None          # SearchIndex, se construye en la primera búsqueda
+        self._estadisticas = Estadisticas()
+        self._guardadas = None       # (firma, Estadisticas) leídas de <ruta>.stats
+        self._guardado = 0.0         # último guardado de <ruta>.stats (monotonic)
+        self._version = 0            # cambia con cada cita aplicada
+        self._fin_con_salto = True
+        self._compactando = threading.Lock()
+        self._mutex = threading.RLock()
+
+    # --- Carga ---
+    def _firma_actual(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _refrescar(self):
+        with self._mutex:
+            if self._firma_actual() == self._firma:
+                return
+            with bloqueo(self.path, exclusivo=False) as lock:
+                self._sincronizar(lock)
+
+    def _sincronizar(self, lock):
+        """Pone el estado al día con el diario; quien llama ya tiene el bloqueo."""
+        # La firma se toma dentro del bloqueo: ningún escritor está a medias
+        firma = self._firma_actual()
+        if firma == self._firma:
+            return
+        generacion = _generacion(lock)
+        if (firma and self._firma and firma[0] == self._firma[0]
+                and generacion == self._generacion and firma[2] >= self._leido):
+            self._leer_desde(self._leido)
+            self._generacion = generacion
+        else:
+            self._cargar()
+            self._generacion = generacion
+            self._guardar_estadisticas()
+        self._firma = firma
+
+    def _cargar(self):
+        self._citas.clear()
+        self._por_nombre_fecha.clear()
+        self._por_servicio.clear()
+        self._por_fecha.clear()
+        self._fechas = []
+        self._posicion.clear()
+        self._orden = []
+        self._id_en.clear()
+        self._siguiente = 0
+        self._indice = None
+        self._estadisticas = Estadisticas()
+        self._guardadas = None
+        self._obsoletas = 0
+        self._leido = 0
+        self._lineas = 0
+        self._version += 1
+        self._fin_con_salto = True
+        self._leer_desde(0)
+
+    def _leer_desde(self, offset):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for raw in f:
+                self._lineas += 1
+                self._fin_con_salto = raw.endswith(b"\n")
+                self._leido += len(raw)
+                linea = raw.decode("utf-8", errors="replace").strip()
+                if linea:
+                    self._aplicar(linea.split("|"), self._lineas)
+        _contar(self.path, leidos=self._leido - offset)
+
+    def _aplicar(self, partes, numero):
+        """Aplica una línea del diario ya separada por '|'."""
+        if partes[0] in MARCAS:
+            self._obsoletas += 1
+            if partes[0] == "@del" and len(partes) > 1 and partes[1] in self._citas:
+                self._desindexar(partes[1])
+                self._obsoletas += 1
+            return
+        if len(partes) < 5:
+            return
+        cita = dict(zip(CAMPOS, partes[:6]))
+        cita.setdefault("message", "")
+        if len(partes) == 7 and ID_VALIDO.fullmatch(partes[6]):
+            cita["id"] = partes[6]
+        else:
+            # Mensaje con "|" de antes de limpiar(): se junta (con "/", como limpiar)
+            if len(partes) > 6:
+                cita["message"] = "/".join(partes[5:])
+            cita["id"] = f"l{numero}"
+        if cita["id"] in self._citas:
+            self._obsoletas += 1
+        self._indexar(cita)
+
+    # --- Índices ---
+    def _indexar(self, cita):
+        self._version += 1
+        cid = cita["id"]
+        if cid in self._citas:
+            # Una nueva versión conserva la posición de la cita original
+            self._quitar_de_indices(self._citas[cid])
+        else:
+            self._posicion[cid] = self._siguiente
+            self._orden.append(self._siguiente)
+            self._id_en[self._siguiente] = cid
+            self._siguiente += 1
+        self._citas[cid] = cita
+        if self._indice is not None:
+            self._indice.add(cid, cita)
+        self._estadisticas.sumar(cita["date"], cita["service"])
+        self._por_nombre_fecha.setdefault((cita["name"], cita["date"]), []).append(cid)
+        self._por_servicio.setdefault(cita["service"], set()).add(cid)
+        ids = self._por_fecha.get(cita["date"])
+        if ids is None:
+            ids = self._por_fecha[cita["date"]] = set()
+            bisect.insort(self._fechas, cita["date"])
+        ids.add(cid)
+
+    def _desindexar(self, cid):
+        self._version += 1
+        cita = self._citas.pop(cid)
+        self._quitar_de_indices(cita)
+        pos = self._posicion.pop(cid)
+        del self._orden[bisect.bisect_left(self._orden, pos)]
+        del self._id_en[pos]
+        if self._indice is not None:
+            self._indice.remove(cid)
+        return cita
+
+    def _quitar_de_indices(self, cita):
+        cid = cita["id"]
+        clave = (cita["name"], cita["date"])
+        self._por_nombre_fecha[clave].remove(cid)
+        if not self._por_nombre_fecha[clave]:
+            del self._por_nombre_fecha[clave]
+        self._por_servicio[cita["service"]].discard(cid)
+        if not self._por_servicio[cita["service"]]:
+            del self._por_servicio[cita["service"]]
+        self._por_fecha[cita["date"]].discard(cid)
+        if not self._por_fecha[cita["date"]]:
+            del self._por_fecha[cita["date"]]
+            self._fechas.pop(bisect.bisect_left(self._fechas, cita["date"]))
+        self._estadisticas.sumar(cita["date"], cita["service"], -1)
+
+    # --- Lectura ---
+    # Todas las lecturas con el mutex: un borrado, o un hilo de la cola de
+    # trabajos que agrega citas, no puede cambiar los índices entre dos accesos
+    def all(self):
+        """Todas las citas en el orden del archivo."""
+        self._refrescar()
+        with self._mutex:
+            return list(self._citas.values())
+
+    def __len__(self):
+        self._refrescar()
+        return len(self._citas)
+
+    def get(self, cid):
+        self._refrescar()
+        with self._mutex:
+            return self._citas.get(cid)
+
+    def find(self, name, date):
+        """Primera cita con ese nombre y fecha, o None."""
+        self._refrescar()
+        with self._mutex:
+            ids = self._por_nombre_fecha.get((name, date))
+            return self._citas[ids[0]] if ids else None
+
+    def resolve(self, cid, name, date):
+        """Cita por id comprobando nombre y fecha; si no coincide, busca por nombre+fecha."""
+        cita = self.get(cid) if cid else None
+        if cita and cita["name"] == name and cita["date"] == date:
+            return cita
+        return self.find(name, date)
+
+    def by_service(self, service):
+        self._refrescar()
+        with self._mutex:
+            return [self._citas[cid] for cid in self._por_servicio.get(service, ())]
+
+    def by_date(self, desde, hasta=None):
+        """Citas con fecha entre ``desde`` y ``hasta`` (ISO, ambos incluidos)."""
+        self._refrescar()
+        hasta = hasta or desde
+        with self._mutex:
+            i = bisect.bisect_left(self._fechas, desde)
+            j = bisect.bisect_right(self._fechas, hasta)
+            return [self._citas[cid] for fecha in self._fechas[i:j] for cid in self._por_fecha[fecha]]
+
+    def services(self):
+        self._refrescar()
+        with self._mutex:
+            return sorted(self._por_servicio)
+
+    def _buscar(self, consulta):
+        # Con el mutex: un hilo que agrega citas no puede cambiar los índices a medias
+        with self._mutex:
+            if self._indice is None:
+                self._indice = SearchIndex(CAMPOS, self._citas.__getitem__)
+                for cid, cita in self._citas.items():
+                    self._indice.add(cid, cita)
+            return self._indice.search(consulta)
+
+    def search(self, consulta):
+        """Citas que contienen todas las palabras de la consulta (también como
+        prefijo), de más a menos relevantes."""
+        self._refrescar()
+        with self._mutex:
+            resultados = self._buscar(consulta)
+            resultados.sort(key=lambda r: (-r[1], self._posicion[r[0]]))
+            return [self._citas[cid] for cid, _ in resultados]
+
+    # --- Paginación ---
+    def page(self, offset, limit):
+        """Citas ``offset`` a ``offset + limit`` en el orden del archivo."""
+        self._refrescar()
+        with self._mutex:
+            return [self._citas[self._id_en[pos]] for pos in self._orden[offset:offset + limit]]
+
+    def _posiciones(self, service="", search="", desde=None, hasta=None):
+        if not service and not search and not desde and not hasta:
+            return self._orden
+        clave = (service, search, desde, hasta)
+        guardado = self._filtrados.get(clave)
+        if guardado and guardado[0] == self._version:
+            return guardado[1]
+        ids = set(self._por_servicio.get(service, ())) if service else None
+        if desde or hasta:
+            i = bisect.bisect_left(self._fechas, desde) if desde else 0
+            j = bisect.bisect_right(self._fechas, hasta) if hasta else len(self._fechas)
+            en_rango = set().union(*(self._por_fecha[f] for f in self._fechas[i:j]))
+            ids = en_rango if ids is None else ids & en_rango
+        if search:
+            encontrados = {cid for cid, _ in self._buscar(search)}
+            ids = encontrados if ids is None else ids & encontrados
+        posiciones = sorted(self._posicion[cid] for cid in ids)
+        if len(self._filtrados) >= 32 or any(v != self._version for v, _ in self._filtrados.values()):
+            self._filtrados.clear()
+        self._filtrados[clave] = (self._version, posiciones)
+        return posiciones
+
+    def scan(self, after=None, limit=50, service="", search="", desde=None, hasta=None):
+        """Paginación por cursor: hasta ``limit`` citas posteriores a ``after``.
+
+        Devuelve ``(citas, siguiente_cursor, total)``; el cursor es la posición
+        de la última cita devuelta y vale None en la última página. Con filtros
+        las posiciones coincidentes se calculan una vez por versión del diario.
+        """
+        self._refrescar()
+        with self._mutex:
+            posiciones = self._posiciones(service, search, desde, hasta)
+            inicio = 0 if after is None else bisect.bisect_right(posiciones, after)
+            pagina = posiciones[inicio:inicio + limit]
+            citas = [self._citas[self._id_en[pos]] for pos in pagina]
+        siguiente = pagina[-1] if pagina and inicio + limit < len(posiciones) else None
+        return citas, siguiente, len(posiciones)
+
+    def iter_pages(self, lote=500, **filtros):
+        """Recorre las citas filtradas de ``lote`` en ``lote`` sin copiar la lista entera.
+
+        Cada lote se pide por cursor, así que las citas que cambian entre lotes
+        no desordenan el recorrido.
+        """
+        cursor = None
+        while True:
+            citas, cursor, _ = self.scan(after=cursor, limit=lote, **filtros)
+            if citas:
+                yield citas
+            if cursor is None:
+                return
+
+    # --- Estadísticas ---
+    def stats(self, desde=None, hasta=None, service=None):
+        """Citas por mes y por servicio, opcionalmente entre dos fechas o de un servicio."""
+        with self._mutex:
+            if self._firma is None and os.path.exists(self.path + ".stats"):
+                estadisticas = self._estadisticas_guardadas()
+                if estadisticas is not None:
+                    return estadisticas.resumen(desde, hasta, service)
+            self._refrescar()
+            return self._estadisticas.resumen(desde, hasta, service)
+
+    def _estadisticas_guardadas(self):
+        """Último resumen en disco más la cola del diario, sin cargar las citas."""
+        firma = self._firma_actual()
+        if self._guardadas and self._guardadas[0] == firma:
+            return self._guardadas[1]
+        try:
+            with bloqueo(self.path, exclusivo=False) as lock:
+                with open(self.path + ".stats", "r", encoding="utf-8") as f:
+                    datos = json.load(f)
+                firma = self._firma_actual()
+                if datos["generacion"] != _generacion(lock) or firma is None or firma[2] < datos["leido"]:
+                    return None
+                estadisticas = Estadisticas(datos["dias"])
+                with open(self.path, "rb") as f:
+                    f.seek(datos["leido"])
+                    _contar(self.path, leidos=firma[2] - datos["leido"])
+                    for raw in f:
+                        partes = raw.decode("utf-8", errors="replace").strip().split("|")
+                        if partes[0] in MARCAS and len(partes) >= 5:
+                            # La operación lleva la versión anterior: se descuenta
+                            estadisticas.sumar(partes[4], partes[3], -1)
+                        elif len(partes) >= 5:
+                            estadisticas.sumar(partes[2], partes[1])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        self._guardadas = (firma, estadisticas)
+        return estadisticas
+
+    def _guardar_estadisticas(self):
+        datos = {"generacion": self._generacion, "leido": self._leido, "dias": self._estadisticas.dias}
+        tmp = f"{self.path}.stats.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(datos, f)
+            os.replace(tmp, self.path + ".stats")
+        except OSError as e:
+            print(f"[STATS] No se pudo guardar {self.path}.stats: {e}")
+        self._guardado = time.monotonic()
+
+    # --- Escritura ---
+    def _escribir(self, lineas):
+        # Una sola llamada a write() por operación: el anexado queda entero o no queda
+        datos = "".join(lineas).encode("utf-8")
+        if not self._fin_con_salto:
+            datos = b"\n" + datos
+        with open(self.path, "ab") as f:
+            f.write(datos)
+        _contar(self.path, escritos=len(datos))
+        self._fin_con_salto = True
+        self._lineas += len(lineas)
+
+    def _escribiendo(self, operacion):
+        with self._mutex, bloqueo(self.path) as lock:
+            # Con el bloqueo exclusivo tomado, primero se aplica lo que anexaron
+            # otros procesos y luego se escribe; tras escribir no hace falta releer
+            self._sincronizar(lock)
+            resultado = operacion()
+            self._firma = self._firma_actual()
+            self._leido = self._firma[2] if self._firma else 0
+            if time.monotonic() - self._guardado > 30:
+                self._guardar_estadisticas()
+        self._quizas_compactar()
+        return resultado
+
+    def add(self, datos, cid=None):
+        """Agrega una cita (dict o lista en el orden de CAMPOS) y devuelve su id.
+
+        Con ``cid`` la operación es idempotente: si ya hay una cita con ese id
+        no se escribe nada (los reintentos de la cola de trabajos no duplican).
+        """
+        cita = _nueva_cita(datos, cid or uuid.uuid4().hex[:12])
+
+        def operacion():
+            if cid and cid in self._citas:
+                return cid
+            self._escribir([_linea(cita)])
+            self._indexar(cita)
+            return cita["id"]
+        return self._escribiendo(operacion)
+
+    def add_many(self, filas, omitir_repetidas=False):
+        """Agrega un lote de citas con un solo bloqueo y una sola escritura.
+
+        Devuelve los ids agregados. Con ``omitir_repetidas`` no se escriben las
+        filas idénticas (los seis campos) a una cita que ya existe o a otra del
+        mismo lote, así que repetir una importación no duplica citas.
+        """
+        citas = [_nueva_cita(datos, uuid.uuid4().hex[:12]) for datos in filas]
+
+        def operacion():
+            nuevas, vistas = [], set()
+            for cita in citas:
+                if omitir_repetidas:
+                    clave = tuple(cita[k] for k in CAMPOS)
+                    if clave in vistas or any(tuple(self._citas[cid][k] for k in CAMPOS) == clave
+                                              for cid in self._por_nombre_fecha.get((cita["name"], cita["date"]), ())):
+                        continue
+                    vistas.add(clave)
+                nuevas.append(cita)
+            if nuevas:
+                self._escribir([_linea(cita) for cita in nuevas])
+                for cita in nuevas:
+                    self._indexar(cita)
+            return [cita["id"] for cita in nuevas]
+        return self._escribiendo(operacion)
+
+    def update(self, cid, datos):
+        """Reemplaza los campos de una cita manteniendo su id y su posición."""
+        cita = _nueva_cita(datos, cid)
+
+        def operacion():
+            anterior = self._citas.get(cid)
+            if anterior is None:
+                return False
+            self._escribir([_linea(anterior, "@upd"), _linea(cita)])
+            self._indexar(cita)
+            self._obsoletas += 2
+            return True
+        return self._escribiendo(operacion)
+
+    def delete(self, cid):
+        def operacion():
+            anterior = self._citas.get(cid)
+            if anterior is None:
+                return False
+            self._escribir([_linea(anterior, "@del")])
+            self._desindexar(cid)
+            self._obsoletas += 2
+            return True
+        return self._escribiendo(operacion)
+
+    # --- Compactación ---
+    def _quizas_compactar(self):
+        if (self._obsoletas >= self.compact_threshold and self._obsoletas > len(self._citas)
+                and not self._compactando.locked()):
+            threading.Thread(target=self.compact, daemon=True).start()
+
+    def compact(self):
+        """Reescribe el diario solo con las citas vigentes.
+
+        Se escribe un temporal, se sincroniza a disco y se renombra encima del
+        original, así que un corte a mitad deja intacto el diario anterior.
+        """
+        if not self._compactando.acquire(blocking=False):
+            return False
+        try:
+            # Vista independiente: no toca el estado que usan las peticiones
+            vista = AppointmentStore(self.path)
+            with bloqueo(self.path, exclusivo=False) as lock:
+                generacion = _generacion(lock)
+                vista._cargar()
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp, "wb") as f:
+                    f.write("".join(_linea(c) for c in vista._citas.values()).encode("utf-8"))
+                    # Solo la cola y el renombrado bloquean a los escritores; lo que
+                    # otros procesos anexaron mientras tanto se copia tal cual
+                    with bloqueo(self.path) as lock:
+                        if _generacion(lock) != generacion:
+                            return False  # otro proceso compactó primero
+                        with open(self.path, "rb") as original:
+                            original.seek(vista._leido)
+                            cola = original.read()
+                        f.write(cola)
+                        _contar(self.path, leidos=len(cola), escritos=f.tell())
+                        f.flush()
+                        os.fsync(f.fileno())
+                        os.replace(tmp, self.path)
+                        if lock is not None:
+                            lock.truncate(0)
+                            lock.write(str(generacion + 1))
+                            lock.flush()
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            _fsync_directorio(self.path)
+            return True
+        finally:
+            self._compactando.release()
+
+
+class VoicemailStore:
+    """Mensajes de voz en mensajes_clientes.txt, uno por línea.
+
+    Cada mensaje nuevo es un objeto JSON con ``timestamp``, ``call_sid``,
+    ``caller``, ``name``, ``language``, ``transcript`` y ``recording_url``. Las
+    líneas antiguas ``Nombre: texto`` se leen como mensajes con solo nombre y
+    transcripción. Los mensajes nunca se editan: tras la primera carga solo se
+    lee lo que se haya anexado, y el buscador usa el mismo índice que las citas.
+    """
+
+    CAMPOS = ("timestamp", "call_sid", "caller", "name", "language", "transcript", "recording_url")
+
+    def __init__(self, path):
+        self.path = path
+        self._firma = None      # (inodo, tamaño) de lo ya leído
+        self._mensajes = []     # en el orden del archivo; el id es la posición
+        self._indice = None     # SearchIndex, se crea en la primera búsqueda
+        self._mutex = threading.Lock()
+
+    @classmethod
+    def _parsear(cls, linea):
+        if linea.startswith("{"):
+            try:
+                datos = json.loads(linea)
+            except ValueError:
+                datos = {"transcript": linea}
+        else:
+            nombre, separador, texto = linea.partition(": ")
+            datos = {"name": nombre, "transcript": texto} if separador else {"transcript": linea}
+        return {campo: str(datos.get(campo) or "") for campo in cls.CAMPOS}
+
+    def _refrescar(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+        with self._mutex:
+            if st is None:
+                self._firma, self._mensajes, self._indice = None, [], None
+                return
+            if self._firma and self._firma[0] == st.st_ino and self._firma[1] == st.st_size:
+                return
+            desde = self._firma[1] if self._firma and self._firma[0] == st.st_ino and st.st_size > self._firma[1] else 0
+            if desde == 0:
+                self._mensajes, self._indice = [], None
+            with bloqueo(self.path, exclusivo=False), open(self.path, "rb") as f:
+                f.seek(desde)
+                datos = f.read()
+            _contar(self.path, leidos=len(datos))
+            # Una línea sin salto final se está escribiendo: se lee la próxima vez
+            completo = datos[:datos.rfind(b"\n") + 1]
+            for linea in completo.decode("utf-8", "replace").splitlines():
+                if linea.strip():
+                    mensaje = self._parsear(linea.strip())
+                    mensaje["id"] = str(len(self._mensajes))
+                    self._mensajes.append(mensaje)
+                    if self._indice is not None:
+                        self._indice.add(mensaje["id"], mensaje)
+            self._firma = (st.st_ino, desde + len(completo))
+
+    def __len__(self):
+        self._refrescar()
+        return len(self._mensajes)
+
+    def page(self, offset, limit):
+        """Mensajes ``offset`` a ``offset + limit``, del más reciente al más antiguo."""
+        self._refrescar()
+        with self._mutex:
+            fin = max(0, len(self._mensajes) - offset)
+            return self._mensajes[max(0, fin - limit):fin][::-1]
+
+    def search(self, consulta):
+        """Mensajes con todas las palabras de la consulta, de más a menos relevantes
+        (y, a igualdad, los más recientes primero)."""
+        self._refrescar()
+        with self._mutex:
+            if self._indice is None:
+                self._indice = SearchIndex(("name", "caller", "transcript", "language", "timestamp"),
+                                           lambda mid: self._mensajes[int(mid)])
+                for mensaje in self._mensajes:
+                    self._indice.add(mensaje["id"], mensaje)
+            resultados = self._indice.search(consulta)
+        resultados.sort(key=lambda r: (-r[1], -int(r[0])))
+        return [self._mensajes[int(mid)] for mid, _ in resultados]
+
+    def iter_all(self):
+        """Todos los mensajes en el orden del archivo."""
+        self._refrescar()
+        return iter(self._mensajes[:])
+
+    def add(self, datos):
+        """Anexa un mensaje (dict con algunos de CAMPOS); sin fecha se pone la actual."""
+        mensaje = {campo: str(datos.get(campo) or "").strip() for campo in self.CAMPOS}
+        mensaje["timestamp"] = mensaje["timestamp"] or time.strftime("%Y-%m-%d %H:%M:%S")
+        linea = json.dumps(mensaje, ensure_ascii=False) + "\n"
+        datos = linea.encode("utf-8")
+        with bloqueo(self.path), open(self.path, "ab") as f:
+            f.write(datos)
+        _contar(self.path, escritos=len(datos))
@@ -0,0 +1,371 @@
+"""Webhooks de voz de Twilio (/voice, /voice_es, /gather_language, ...).
+
+Una llamada pide, en inglés (/gather_name) o en español (/gather_es), nombre,
+servicio, fecha y dirección, una pregunta por webhook. Si en lugar del nombre
+se contesta "message" ("mensaje"), pasa al buzón de voz. El punto en que va cada
+llamada se guarda por CallSid en un KVStore (sqlite) compartido por todos los
+workers. Al terminar, la cita se encola en la cola de trabajos (jobs.py), así
+que el webhook no espera al archivo de citas ni al correo de aviso.
+
+Los documentos TwiML no dependen de la llamada (saludos, preguntas,
+redirecciones, transferencia a un agente). Cada uno se construye una sola vez,
+la primera vez que se responde (así importar el módulo no carga twilio), y
+después se responde con los mismos bytes. ``precalentar`` los construye todos
+de antemano. Cada webhook se cronometra: si pasa de
+``VOICE_LATENCY_BUDGET_MS`` queda en el log, porque Twilio corta la llamada
+cuando un webhook tarda demasiado. Si un webhook falla se responde con una
+despedida en TwiML en lugar de un 500.
+
+Con ``TWILIO_AUTH_TOKEN`` definido (el Auth Token de la consola de Twilio), las
+peticiones deben venir firmadas por Twilio (cabecera ``X-Twilio-Signature``); sin
+firma válida se responde 403. ``TWILIO_VALIDATE`` elige qué pasa sin token:
+
+* ``auto`` (por defecto): se atienden sin comprobar y queda un aviso en el log,
+  para que un despliegue sin la variable siga tomando llamadas.
+* ``1``: se exige el token; sin él todos los webhooks responden 403.
+* ``0``: no se comprueba nunca (pruebas locales).
+"""
+import datetime
+import os
+import time
+import urllib.parse
+
+from flask import Blueprint, Response, current_app, g, request
+from werkzeug.exceptions import HTTPException
+
+from kvstore import KVStore
+
+LATENCY_BUDGET_MS = float(os.getenv("VOICE_LATENCY_BUDGET_MS", "300"))
+VALIDAR_FIRMA = os.getenv("TWILIO_VALIDATE", "auto")
+MAX_REINTENTOS = 2      # preguntas repetidas sin respuesta antes de colgar
+
+# Estado de cada llamada en curso, por CallSid (caduca a la hora)
+llamadas = KVStore(os.getenv("VOICE_STATE_DB", "llamadas.db"), ttl=3600, tabla="llamadas")
+
+bp = Blueprint("voice", __name__)
+
+
+class _Documento:
+    """TwiML fijo, construido con VoiceResponse la primera vez que hace falta."""
+
+    def __init__(self, construir):
+        self.construir = construir
+        self.datos = None
+        _DOCUMENTOS.append(self)
+
+    def __bytes__(self):
+        if self.datos is None:
+            from twilio.twiml.voice_response import VoiceResponse
+            resp = VoiceResponse()
+            self.construir(resp)
+            self.datos = str(resp).encode("utf-8")
+        return self.datos
+
+
+_DOCUMENTOS = []
+
+
+def _twiml(construir):
+    return _Documento(construir)
+
+
+def precalentar():
+    """Construye todos los documentos (importa twilio) antes de la primera llamada."""
+    for documento in _DOCUMENTOS:
+        bytes(documento)
+
+
+def _saludo(accion, idioma, bienvenida, despedida):
+    def construir(resp):
+        gather = resp.gather(
+            input='speech',
+            action=accion,
+            method='POST',
+            timeout=7,
+            speechTimeout='auto',
+            voice='alice',
+            language=idioma
+        )
+        gather.say(bienvenida, voice='alice', language=idioma)
+        resp.say(despedida, voice='alice', language=idioma)
+        resp.hangup()
+    return construir
+
+
+def _pregunta(accion, idioma, texto, repetir=None):
+    """Pregunta de un paso; sin respuesta vuelve a ``accion`` para contar el reintento."""
+    def construir(resp):
+        gather = resp.gather(input='speech', action=accion, method='POST', timeout=7,
+                             speechTimeout='auto', voice='alice', language=idioma)
+        if repetir:
+            gather.say(repetir, voice='alice', language=idioma)
+        gather.say(texto, voice='alice', language=idioma)
+        resp.redirect(accion)
+    return construir
+
+
+def _despedida(idioma, texto):
+    def construir(resp):
+        resp.say(texto, voice='alice', language=idioma)
+        resp.hangup()
+    return construir
+
+
+def _agente(resp):
+    resp.say("Transferring you to a human agent. Please wait.", voice='alice', language='en-US')
+    # Aquí puedes poner el número real de un agente humano
+    resp.dial('+1XXXXXXXXXX')
+    resp.hangup()
+
+
+def _error(resp):
+    resp.say("We are sorry, we are having technical difficulties. Please call us again later. Goodbye.",
+             voice='alice', language='en-US')
+    resp.hangup()
+
+
+# --- TwiML precalculado ---
+VOICE_EN = _twiml(_saludo(
+    '/gather_name', 'en-US',
+    "Hello and welcome to Genesis SA Services LLC! We are honored to receive your call today. At Genesis, your satisfaction and peace of mind are our priority. May I have your name, please? Or say message to leave a voicemail.",
+    "We could not hear your response. If you need help, please call us again or visit genesissaservices.com. Thank you for trusting Genesis SA Services LLC! Goodbye."))
+VOICE_ES = _twiml(_saludo(
+    '/gather_es', 'es-ES',
+    "¡Hola y bienvenido a Genesis SA Services LLC! Nos sentimos honrados de recibir su llamada hoy. En Genesis, su satisfacción y tranquilidad son nuestra prioridad. ¿Me puede decir su nombre, por favor? O diga mensaje para dejar un mensaje de voz.",
+    "No pudimos escuchar su respuesta. Si necesita ayuda, por favor llámenos de nuevo o visite genesissaservices.com. ¡Gracias por confiar en Genesis SA Services LLC! Adiós."))
+
+# Pasos de la llamada: el nombre se pide en el saludo, el resto aquí
+PASOS = ("name", "service", "date", "address")
+# Respuestas al saludo que llevan al buzón de voz en lugar de tomarse como nombre
+BUZON = {"message", "voicemail", "leave a message", "mensaje", "dejar un mensaje", "buzón de voz"}
+TEXTOS = {
+    "en": {
+        "accion": "/gather_name", "idioma": "en-US",
+        "service": "Thank you. What service do you need? For example: landscaping, tree removal or fence installation.",
+        "date": "What is the ideal date for the appointment?",
+        "address": "And what is your address or city?",
+        "repetir": "Sorry, I did not catch that.",
+        "fin": "Thank you, we will contact you soon to confirm the appointment. Thank you for trusting Genesis SA Services LLC! Goodbye.",
+        "adios": "We could not hear your response. If you need help, please call us again or visit genesissaservices.com. Goodbye.",
+    },
+    "es": {
+        "accion": "/gather_es", "idioma": "es-ES",
+        "service": "Gracias. ¿Qué servicio necesita? Por ejemplo: jardinería, remoción de árboles o instalación de cercas.",
+        "date": "¿Cuál es la fecha ideal para la cita?",
+        "address": "¿Y cuál es su dirección o ciudad?",
+        "repetir": "Disculpe, no le entendí.",
+        "fin": "Gracias, pronto nos comunicaremos con usted para confirmar la cita. ¡Gracias por confiar en Genesis SA Services LLC! Adiós.",
+        "adios": "No pudimos escuchar su respuesta. Si necesita ayuda, por favor llámenos de nuevo o visite genesissaservices.com. Adiós.",
+    },
+}
+PREGUNTAS, REPETIR, FIN, ADIOS = {}, {}, {}, {}
+for _lengua, _t in TEXTOS.items():
+    _preguntas = {"name": "May I have your name, please?" if _lengua == "en" else "¿Me puede decir su nombre, por favor?"}
+    _preguntas.update({paso: _t[paso] for paso in PASOS[1:]})
+    PREGUNTAS[_lengua] = {paso: _twiml(_pregunta(_t["accion"], _t["idioma"], texto))
+                          for paso, texto in _preguntas.items()}
+    REPETIR[_lengua] = {paso: _twiml(_pregunta(_t["accion"], _t["idioma"], texto, _t["repetir"]))
+                        for paso, texto in _preguntas.items()}
+    FIN[_lengua] = _twiml(_despedida(_t["idioma"], _t["fin"]))
+    ADIOS[_lengua] = _twiml(_despedida(_t["idioma"], _t["adios"]))
+
+# Buzón de voz: Twilio graba y luego manda la transcripción a /voicemail_transcription
+def _buzon(lengua, idioma, texto):
+    def construir(resp):
+        resp.say(texto, voice='alice', language=idioma)
+        resp.record(action='/voicemail_done', method='POST', maxLength=120, playBeep=True, transcribe=True,
+                    transcribeCallback=f'/voicemail_transcription?lang={lengua}')
+        resp.say(TEXTOS[lengua]["adios"], voice='alice', language=idioma)
+        resp.hangup()
+    return construir
+
+
+VOICEMAIL = {
+    "en": _twiml(_buzon("en", "en-US", "Please leave your name, phone number and message after the beep.")),
+    "es": _twiml(_buzon("es", "es-ES", "Por favor deje su nombre, teléfono y mensaje después del tono.")),
+}
+VOICEMAIL_DONE = _twiml(_despedida("en-US", "Thank you, we received your message. Goodbye."))
+VACIO = _twiml(lambda resp: None)
+
+REDIRECT_EN = _twiml(lambda resp: resp.redirect('/voice'))
+REDIRECT_ES = _twiml(lambda resp: resp.redirect('/voice_es'))
+AGENT = _twiml(_agente)
+ERROR = _twiml(_error)
+
+
+def twiml(datos):
+    return Response(bytes(datos), mimetype='text/xml')
+
+
+def grabacion_valida(url):
+    """Solo enlaces https a Twilio: el panel los muestra como enlace."""
+    partes = urllib.parse.urlsplit(url or "")
+    host = (partes.hostname or "").lower()
+    return partes.scheme == "https" and (host == "twilio.com" or host.endswith(".twilio.com"))
+
+
+_validador = (None, None)   # (token, RequestValidator)
+_sin_token_avisado = False
+
+
+def _firma_valida():
+    global _validador, _sin_token_avisado
+    token = os.getenv("TWILIO_AUTH_TOKEN")
+    if not token:
+        if VALIDAR_FIRMA == "1":
+            print("[VOICE] Falta TWILIO_AUTH_TOKEN y TWILIO_VALIDATE=1: se rechaza la petición")
+            return False
+        if not _sin_token_avisado:
+            _sin_token_avisado = True
+            print("[VOICE] Falta TWILIO_AUTH_TOKEN: los webhooks se atienden sin comprobar la firma de Twilio")
+        return True
+    if _validador[0] != token:
+        from twilio.request_validator import RequestValidator
+        _validador = (token, RequestValidator(token))
+    # Twilio firma la URL pública tal como la pidió (detrás del proxy, ProxyFix pone el https)
+    return _validador[1].validate(request.url, request.form.to_dict(), request.headers.get("X-Twilio-Signature", ""))
+
+
+@bp.before_request
+def _inicio():
+    g.voice_inicio = time.perf_counter()
+    if VALIDAR_FIRMA != "0" and not _firma_valida():
+        print(f"[VOICE] Firma de Twilio no válida en {request.path} desde {request.remote_addr}")
+        return Response("Forbidden", status=403)
+
+
+@bp.after_request
+def _presupuesto(response):
+    ms = (time.perf_counter() - g.pop("voice_inicio", time.perf_counter())) * 1000
+    metricas = current_app.extensions.get("metrics")
+    if metricas is not None:
+        metricas.observe("twilio_webhook_duration_seconds", ms / 1000, endpoint=request.endpoint)
+    if ms > LATENCY_BUDGET_MS:
+        print(f"[VOICE] {request.path} tardó {ms:.0f} ms (presupuesto {LATENCY_BUDGET_MS:.0f} ms) "
+              f"CallSid={request.form.get('CallSid', '-')}")
+        if metricas is not None:
+            metricas.inc("twilio_webhook_over_budget_total", endpoint=request.endpoint)
+    return response
+
+
+@bp.errorhandler(Exception)
+def _fallo(e):
+    if isinstance(e, HTTPException):
+        return e
+    print(f"[VOICE] Error en {request.path}: {e}")
+    if "metrics" in current_app.extensions:
+        current_app.extensions["metrics"].inc("twilio_webhook_errors_total", endpoint=request.endpoint)
+    return twiml(ERROR)
+
+
+@bp.route("/voice", methods=["POST"])
+def voice():
+    return twiml(VOICE_EN)
+
+
+@bp.route("/gather_language", methods=["POST"])
+def gather_language():
+    speech_result = request.form.get('SpeechResult', '').lower()
+    print(f"[LOG] Selección de idioma o agente: {speech_result}")
+    if 'español' in speech_result or 'spanish' in speech_result:
+        return twiml(REDIRECT_ES)
+    elif 'agent' in speech_result or 'agente' in speech_result:
+        return twiml(AGENT)
+    return twiml(REDIRECT_EN)
+
+
+@bp.route("/voice_es", methods=["POST"])
+def voice_es():
+    print("[LOG] Endpoint /voice_es fue llamado")
+    return twiml(VOICE_ES)
+
+
+@bp.route("/gather_name", methods=["POST"])
+def gather_name():
+    return twiml(atender("en"))
+
+
+@bp.route("/gather_es", methods=["POST"])
+def gather_es():
+    return twiml(atender("es"))
+
+
+@bp.route("/voicemail", methods=["POST"])
+def voicemail():
+    return twiml(VOICEMAIL["es" if request.args.get("lang") == "es" else "en"])
+
+
+@bp.route("/voicemail_done", methods=["POST"])
+def voicemail_done():
+    return twiml(VOICEMAIL_DONE)
+
+
+@bp.route("/voicemail_transcription", methods=["POST"])
+def voicemail_transcription():
+    """Twilio manda aquí la transcripción; el mensaje lo guarda la cola de trabajos."""
+    sid = request.form.get("RecordingSid") or request.form.get("CallSid", "")
+    grabacion = request.form.get("RecordingUrl", "")
+    if grabacion and not grabacion_valida(grabacion):
+        print(f"[VOICE] RecordingUrl descartada (no es https de Twilio): {grabacion[:100]!r}")
+        grabacion = ""
+    current_app.extensions["jobs"].enqueue("voicemail", {
+        "call_sid": request.form.get("CallSid", ""),
+        "caller": request.form.get("From", ""),
+        "language": "Spanish" if request.args.get("lang") == "es" else "English",
+        "transcript": request.form.get("TranscriptionText", ""),
+        "recording_url": grabacion,
+    }, clave=f"voicemail:{sid}" if sid else None)
+    return twiml(VACIO)
+
+
+# --- Máquina de estados de la llamada ---
+def _respuesta(texto):
+    # Twilio suele devolver "John Smith." o "¿Mañana?": fuera puntuación de los extremos
+    return (texto or "").strip().strip(".,;:!?¡¿ ").strip()
+
+
+def atender(lengua):
+    """Guarda la respuesta del paso actual y devuelve el TwiML del siguiente."""
+    sid = request.form.get("CallSid", "")
+    if not sid:
+        return ADIOS[lengua]
+    texto = _respuesta(request.form.get("SpeechResult"))
+    estado = llamadas.get(sid) or {"paso": 0, "datos": {}, "reintentos": 0, "lengua": lengua}
+    print(f"[VOICE] {sid} ({lengua}) paso {estado['paso']}: {texto!r}")
+    if estado.get("fin"):
+        # Reintento de Twilio de un webhook ya atendido: la cita ya está en cola
+        return FIN[lengua]
+    paso = PASOS[estado["paso"]]
+    if paso == "name" and texto.lower() in BUZON:
+        llamadas.delete(sid)
+        return VOICEMAIL[lengua]
+    if not texto:
+        estado["reintentos"] += 1
+        if estado["reintentos"] > MAX_REINTENTOS:
+            llamadas.delete(sid)
+            return ADIOS[lengua]
+        llamadas.set(sid, estado)
+        return REPETIR[lengua][paso]
+    estado["datos"][paso] = texto
+    estado["paso"] += 1
+    estado["reintentos"] = 0
+    if estado["paso"] < len(PASOS):
+        llamadas.set(sid, estado)
+        return PREGUNTAS[lengua][PASOS[estado["paso"]]]
+    estado["fin"] = True
+    llamadas.set(sid, estado)
+    # La cita la escribe la cola de trabajos; el CallSid evita duplicarla
+    current_app.extensions["jobs"].enqueue(
+        "call_appointment", {"call_sid": sid, "cita": cita_de_llamada(estado, request.form.get("From", "")),
+                             "respuestas": estado["datos"], "lengua": lengua,
+                             "fecha": datetime.date.today().isoformat()},
+        clave=f"call_appointment:{sid}")
+    return FIN[lengua]
+
+
+def cita_de_llamada(estado, telefono):
+    datos = estado["datos"]
+    idioma = "Spanish" if estado.get("lengua") == "es" else "English"
+    mensaje = f"Phone call from {telefono or 'unknown number'} ({idioma})"
+    return [datos["name"], datos["service"], datos["date"], datos["address"], "", mensaje]
+